@@ -1,5 +1,15 @@
 # AI module for WeGoAI backend
-from .crew import create_suggestion_crew
-from .handlers import handler
+# Exports resolve on first access, so importing a light submodule (ai.logs,
+# ai.handlers) does not pull in crewai/litellm/langchain; see ai/warmup.py.
 
 __all__ = ['create_suggestion_crew', 'handler']
+
+
+def __getattr__(name):
+    if name == 'create_suggestion_crew':
+        from .crew import create_suggestion_crew
+        return create_suggestion_crew
+    if name == 'handler':
+        from .handlers import handler
+        return handler
+    raise AttributeError(f"module 'ai' has no attribute {name!r}")
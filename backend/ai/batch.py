@@ -0,0 +1,114 @@
+"""
+Batch execution for POST /api/ai/suggest/batch.
+
+All queries of a batch share one tripContext and chat history. Their intents
+are classified together (classify_intents: one fast_llm call for every query
+the local rules are unsure about), then create_suggestion_crew runs for each
+on a worker pool shared by all batches, at most `concurrency` items of one
+batch at a time. A failing item is reported in its own slot and never fails
+the batch.
+
+Environment:
+    BATCH_MAX_ITEMS    Queries accepted per batch (default: 10)
+    BATCH_CONCURRENCY  Items of one batch running at once (default: 3)
+    BATCH_WORKERS      Worker threads shared by all batches (default: 8)
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ai.crew import classify_intents, create_suggestion_crew
+from ai.logs import current_request_id, log, new_request_id, request_scope
+from ai.metrics import request_timing, span
+
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 10))
+BATCH_CONCURRENCY = max(1, int(os.environ.get("BATCH_CONCURRENCY", 3)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("BATCH_WORKERS", 8)), thread_name_prefix="batch"
+                )
+    return _executor
+
+
+def parse_items(queries) -> list[dict]:
+    """`queries` as [{"id", "query"}]; accepts strings or {"id", "query"} objects.
+
+    Raises ValueError with a client-facing message on malformed input.
+    """
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("'queries' must be a non-empty list")
+    if len(queries) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} queries per batch (got {len(queries)})")
+    items = []
+    for i, entry in enumerate(queries):
+        if isinstance(entry, str):
+            entry = {"query": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("query"), str) or not entry["query"].strip():
+            raise ValueError(f"queries[{i}] must be a non-empty string or an object with a 'query' string")
+        items.append({"id": entry.get("id", i), "query": entry["query"]})
+    return items
+
+
+def _run_item(index: int, item: dict, intent: str, trip_context: dict, chat_history: list) -> dict:
+    started = time.perf_counter()
+    outcome = {"id": item["id"], "query": item["query"], "intent": intent}
+    # Items log under "<batch request id>.<index>"
+    with request_scope(f"{current_request_id() or new_request_id()}.{index}"), request_timing() as timings:
+        try:
+            outcome["result"] = create_suggestion_crew(item["query"], trip_context, chat_history, intent=intent)
+            outcome["success"] = True
+        except Exception as e:
+            log("error", "batch.item_failed", index=index, error=str(e))
+            outcome.update(success=False, error=str(e))
+    timing = {}
+    for name, seconds in timings:
+        timing[name] = timing.get(name, 0.0) + seconds
+    outcome["timing"] = {name: round(seconds * 1000, 1) for name, seconds in timing.items()}
+    outcome["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return outcome
+
+
+def run_batch(items: list[dict], trip_context: dict, chat_history: list, concurrency: int = None) -> list[dict]:
+    """Results for `items` (see parse_items), in order; one classification call for the batch."""
+    limit = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY, len(items)))
+    with span("route"):
+        intents = classify_intents([item["query"] for item in items])
+
+    results = [None] * len(items)
+    pending = iter(enumerate(items))
+    running = {}
+
+    def submit_next():
+        for index, item in pending:
+            # Each item runs in its own copy of the request context (request id, timings)
+            ctx = contextvars.copy_context()
+            future = _pool().submit(ctx.run, _run_item, index, item, intents[index], trip_context, chat_history)
+            running[future] = index
+            return
+
+    for _ in range(limit):
+        submit_next()
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = running.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {"id": items[index]["id"], "query": items[index]["query"],
+                                  "intent": intents[index], "success": False, "error": str(e)}
+            submit_next()
+    log("info", "batch", items=len(items), concurrency=limit,
+        failed=sum(1 for r in results if not r["success"]))
+    return results
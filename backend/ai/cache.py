@@ -0,0 +1,222 @@
+"""
+Caches shared by the AI backend (in-memory LRU, on-disk TTL, in-flight dedup).
+"""
+import copy
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL and hit/miss counters.
+
+    `on_evict(key, value)` is called, outside the lock, for entries dropped by
+    the LRU bound or found expired (not for pop() or clear()).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+        if entry is not _MISSING and self.on_evict is not None:
+            self.on_evict(key, entry[1])
+        return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        evicted = []
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+        if self.on_evict is not None:
+            for old_key, (_, old_value) in evicted:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class SQLiteTTLCache:
+    """Persistent string cache in SQLite with a TTL and size-bounded LRU eviction.
+
+    One connection is shared by all threads (guarded by a lock); WAL mode lets
+    several server processes share the same file.
+    """
+
+    def __init__(self, path: str, ttl: float = 6 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] + self.ttl > now:
+                self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                # Drop expired rows first, then least recently used ones
+                self._conn.execute("DELETE FROM cache WHERE created_at <= ?", (now - self.ttl,))
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    " SELECT key FROM cache ORDER BY accessed_at ASC LIMIT"
+                    " MAX(0, (SELECT COUNT(*) FROM cache) - ?))",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": size,
+            "max_entries": self.max_entries,
+        }
+
+
+class InFlightTimeout(TimeoutError):
+    """A SingleFlight follower gave up waiting for the leader."""
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller (leader) runs the function; callers arriving while it is
+    in flight wait and receive the same result, or the same exception.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.traceback = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn, timeout: float | None = None, on_follow=None):
+        """Run `fn` once per in-flight `key`; `on_follow()` is called before a follower waits."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            if on_follow is not None:
+                on_follow()
+            if not call.done.wait(timeout):
+                raise InFlightTimeout(f"Timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise self._follower_error(call)
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error, call.traceback = e, e.__traceback__
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @staticmethod
+    def _follower_error(call):
+        """A copy of the leader's exception, so concurrent raises don't chain tracebacks on one object."""
+        try:
+            error = copy.copy(call.error)
+        except Exception:
+            return call.error
+        return error.with_traceback(call.traceback)
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._calls)}
@@ -0,0 +1,215 @@
+"""
+Registry of long-lived upstream clients (NVIDIA NIM, Serper).
+
+Clients are built once per process and share one keep-alive HTTP connection
+pool, so TLS handshakes and client setup are paid on the first request only.
+The pool is sized from the server's concurrency (AI_WORKERS) unless
+HTTP_POOL_SIZE is set. Every NIM and Serper call made through these clients
+is admitted by the upstream scheduler first (ai/upstream.py), and every LLM
+call is bounded by the request deadline and optionally hedged (ai/hedge.py).
+Within a request, HTTP timeouts are cut to the time the request has left, so
+a call abandoned at the deadline does not keep running long after it.
+"""
+import os
+import threading
+from typing import Any
+
+import requests
+from crewai.hooks import HookAborted, register_after_llm_call_hook, register_before_llm_call_hook
+from crewai.llm import LLM
+from crewai.utilities.llm_utils import create_llm
+from requests.adapters import HTTPAdapter
+from langchain_community.utilities import GoogleSerperAPIWrapper
+from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+from ai import deadline, hedge
+from ai.context import estimate_tokens
+from ai.upstream import admit, charge
+
+NIM_BASE_URL = os.environ.get("NVIDIA_NIM_BASE_URL", "https://integrate.api.nvidia.com/v1")
+PLANNING_MODEL = "meta/llama-3.1-70b-instruct"
+FAST_MODEL = "meta/llama-3.1-8b-instruct"
+
+SERPER_TIMEOUT = float(os.environ.get("SERPER_TIMEOUT", 15))
+
+_lock = threading.Lock()
+_llms = {}
+_crew_llms = {}
+_serper = None
+_session = None
+
+
+def _pool_size() -> int:
+    workers = int(os.environ.get("AI_WORKERS", 8))
+    return int(os.environ.get("HTTP_POOL_SIZE", max(10, workers * 2)))
+
+
+class DeadlineSession(requests.Session):
+    """Session whose timeouts are cut to the time the current request has left."""
+
+    def request(self, method, url, *args, **kwargs):
+        if deadline.remaining() is not None:
+            timeout = kwargs.get("timeout")
+            kwargs["timeout"] = deadline.bound(timeout if isinstance(timeout, (int, float)) else deadline.DEADLINE_MAX)
+        return super().request(method, url, *args, **kwargs)
+
+
+def http_session() -> requests.Session:
+    """Process-wide keep-alive session shared by every upstream client."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                size = _pool_size()
+                session = DeadlineSession()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class ScheduledChatNVIDIA(ChatNVIDIA):
+    """ChatNVIDIA whose calls wait for the upstream scheduler and the request deadline."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        def send():
+            admit("nim", self.model, estimate_tokens("".join(str(m.content) for m in messages)))
+            result = super(ScheduledChatNVIDIA, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            charge("nim", self.model, sum(estimate_tokens(g.text) for g in result.generations))
+            return result
+
+        return hedge.call(send, self.model)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        admit("nim", self.model, estimate_tokens("".join(str(m.content) for m in messages)))
+        completion = 0
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            completion += estimate_tokens(chunk.text)
+            yield chunk
+        charge("nim", self.model, completion)
+
+
+def get_llm(model: str, max_tokens: int) -> ChatNVIDIA:
+    """Shared ChatNVIDIA client for (model, max_tokens)."""
+    key = (model, max_tokens)
+    client = _llms.get(key)
+    if client is None:
+        with _lock:
+            client = _llms.get(key)
+            if client is None:
+                client = ScheduledChatNVIDIA(
+                    model=model,
+                    api_key=os.environ.get("NVIDIA_NIM_API_KEY"),
+                    base_url=NIM_BASE_URL,
+                    max_tokens=max_tokens
+                )
+                _use_shared_session(client)
+                _llms[key] = client
+    return client
+
+
+class HedgedLLM(LLM):
+    """crewai LLM whose calls are bounded by the request deadline and hedged when slow."""
+
+    def call(self, messages, *args, **kwargs):
+        # The before-call hook already admitted this call; a duplicate is admitted on its own
+        def admit_duplicate():
+            admit("nim", self.model, estimate_tokens(str(messages)))
+
+        return hedge.call(lambda: super(HedgedLLM, self).call(messages, *args, **kwargs), self.model,
+                          on_hedge=admit_duplicate)
+
+    def _prepare_completion_params(self, *args, **kwargs):
+        params = super()._prepare_completion_params(*args, **kwargs)
+        left = deadline.remaining()
+        if left is not None:
+            # The upstream request gives up with the request, not after the LLM's own timeout
+            params["timeout"] = deadline.bound(params.get("timeout") or left)
+        return params
+
+
+def get_crew_llm(model: str, max_tokens: int):
+    """Shared crewai LLM for agents, converted once from the ChatNVIDIA client.
+
+    crewai converts a ChatNVIDIA passed to Agent(llm=...) into its own LLM on
+    every Agent construction; handing agents this instance skips that.
+    """
+    key = (model, max_tokens)
+    crew_llm = _crew_llms.get(key)
+    if crew_llm is None:
+        chat = get_llm(model, max_tokens)
+        with _lock:
+            crew_llm = _crew_llms.get(key)
+            if crew_llm is None:
+                base = create_llm(chat)
+                crew_llm = _crew_llms[key] = HedgedLLM(
+                    model=base.model, temperature=base.temperature, max_tokens=base.max_tokens,
+                    timeout=base.timeout, api_key=base.api_key, base_url=base.base_url, api_base=base.api_base,
+                )
+    return crew_llm
+
+
+def _crew_call_model(context) -> str:
+    return getattr(context.llm, "model", None) or str(context.llm)
+
+
+def _admit_crew_call(context):
+    # crewai runs these hooks around every agent LLM call, in the calling thread.
+    # Past the deadline no new call starts: guardrail retries and tool loops end here
+    # (HookAborted is the one exception crewai neither swallows nor retries).
+    try:
+        deadline.check("llm")
+        admit("nim", _crew_call_model(context), estimate_tokens("".join(
+            str(m.get("content") or "") if isinstance(m, dict) else str(m) for m in context.messages
+        )))
+    except deadline.DeadlineExceeded as e:
+        raise HookAborted(str(e), source="deadline") from e
+
+
+def _charge_crew_call(context):
+    charge("nim", _crew_call_model(context), estimate_tokens(context.response or ""))
+
+
+register_before_llm_call_hook(_admit_crew_call)
+register_after_llm_call_hook(_charge_crew_call)
+
+
+def _use_shared_session(client: ChatNVIDIA):
+    # ChatNVIDIA opens a fresh requests.Session per call via its internal
+    # client's get_session_fn; point it at the pooled one when available.
+    inner = getattr(client, "_client", None)
+    if inner is not None and hasattr(inner, "get_session_fn"):
+        inner.get_session_fn = http_session
+
+
+class PooledSerperAPIWrapper(GoogleSerperAPIWrapper):
+    """GoogleSerperAPIWrapper that posts through the shared keep-alive session."""
+
+    def _google_serper_api_results(self, search_term: str, search_type: str = "search", **kwargs: Any) -> dict:
+        headers = {
+            "X-API-KEY": self.serper_api_key or "",
+            "Content-Type": "application/json",
+        }
+        params = {
+            "q": search_term,
+            **{key: value for key, value in kwargs.items() if value is not None},
+        }
+        deadline.check("search")
+        admit("serper", search_type)
+        response = http_session().post(
+            f"https://google.serper.dev/{search_type}", headers=headers, params=params,
+            timeout=deadline.bound(SERPER_TIMEOUT)
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+def get_serper() -> GoogleSerperAPIWrapper:
+    """Shared Serper client."""
+    global _serper
+    if _serper is None:
+        with _lock:
+            if _serper is None:
+                _serper = PooledSerperAPIWrapper(serper_api_key=os.environ.get("SERPER_API_KEY"))
+    return _serper
@@ -0,0 +1,328 @@
+"""
+Local validation of the crews' JSON actions against the trip's itinerary.
+
+The guardrails only checked that fields exist, so items on days the trip
+doesn't have, suggestions on top of existing activities, and references to
+items that aren't there reached the client or cost another LLM turn.
+check() resolves them against the request's ItineraryIndex (ai/itinerary.py):
+
+  * items (and moves) to a day outside 1..daysCount are dropped;
+  * references (itemsToRemove, remove_items titles, originalTitle) are
+    rewritten to the existing item's exact title, kept when the client's own
+    substring match would find the item, and dropped otherwise;
+  * a new item whose time overlaps an item that stays on the day is resolved:
+    generic meals in the way of a smart_schedule are added to itemsToRemove
+    (what the prompt asks the model to do), anything else moves the new item
+    to the next free slot of its length that day. Items without a time are
+    placed the way the client would place them and written back only when
+    they had to move.
+
+Each overlap or free-slot query is a binary search on the day's sorted
+intervals (placing an item is an O(n) list insert), and each reference an
+O(1) title lookup. An action left with
+nothing valid is rejected with feedback saying why.
+
+The guardrails call check() with the index installed by use() around the
+request's crews. postprocess() does the same for the action blocks of a
+free-form answer that no guardrail saw (the GENERAL crew).
+"""
+import contextvars
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+from ai.itinerary import ItineraryIndex, as_day, format_minutes, normalize_title, to_minutes
+from ai.jsonrepair import iter_json_spans
+from ai.logs import log
+from ai.metrics import inc
+
+# Where the client schedules untimed items, and its defaults (src/app/api/messages/route.ts)
+DAY_START = 9 * 60
+ITEM_GAP = 30
+# Titles the client's "replace" strategy removes along with earlier AI items
+_REPLACEABLE = {"breakfast", "lunch", "dinner"}
+_MEALS = _REPLACEABLE | {"brunch", "snack", "coffee break"}
+
+_index = contextvars.ContextVar("ai_itinerary_index", default=None)
+
+# repair -> count
+conflict_counts = Counter()
+
+
+@contextmanager
+def use(index: ItineraryIndex):
+    """Check the actions of the crews run in this block against `index`."""
+    token = _index.set(index)
+    try:
+        yield
+    finally:
+        _index.reset(token)
+
+
+def _minutes(value, default: int) -> int:
+    return value if isinstance(value, int) and not isinstance(value, bool) and value > 0 else default
+
+
+def _note(repairs: set, repair: str):
+    repairs.add(repair)
+    conflict_counts[repair] += 1
+    inc("ai_conflict_repairs_total", help="LLM answer problems resolved against the itinerary", repair=repair)
+
+
+def _out_of_range(index: ItineraryIndex) -> str:
+    return (f"This trip only has {index.days_count} days. Use a 'day' between 1 and {index.days_count}."
+            if index.days_count else "Every item needs a positive 'day' number.")
+
+
+def _client_matches(phrase: str, item: dict) -> bool:
+    # The client's removal and update rule: either title contains the other
+    wanted, title = phrase.lower(), str(item.get("title", "")).lower()
+    return bool(wanted) and (wanted in title or title in wanted)
+
+
+def _resolve(index: ItineraryIndex, phrase, day: int) -> str | None:
+    """The title to send for a reference to an existing item on `day`, or None if there is none."""
+    if not isinstance(phrase, str) or not phrase.strip():
+        return None
+    matches = index.match(phrase, day)
+    if matches:
+        return matches[0]["title"]
+    if any(_client_matches(phrase, item) for item in index.items_on(day)):
+        return phrase
+    return None
+
+
+def _day_titles(index: ItineraryIndex, day: int) -> str:
+    titles = [item["title"] for item in index.items_on(day)]
+    return ", ".join(f'"{t}"' for t in titles[:12]) if titles else "nothing"
+
+
+def _place(schedule, start: int, duration: int, repairs: set, meals_out: list | None = None) -> int:
+    """Start for `duration` minutes at `start` or the next free slot; clashing meals go to `meals_out`."""
+    clashes = schedule.overlapping(start, start + duration)
+    if not clashes:
+        return start
+    if meals_out is not None and all(normalize_title(item["title"]) in _MEALS for item in clashes):
+        for item in clashes:
+            schedule.remove(item)
+            meals_out.append(item)
+        _note(repairs, "meal_replaced")
+        return start
+    free = schedule.free_slot(duration, start)
+    if free is None and start > DAY_START:
+        free = schedule.free_slot(duration, DAY_START)  # nothing later: earliest gap of the usual day
+    if free is None:
+        _note(repairs, "clash_unresolved")
+        return start
+    _note(repairs, "clash_moved")
+    return free
+
+
+def _check_references(items: list, key: str, index: ItineraryIndex, repairs: set) -> list:
+    kept = []
+    for item in items:
+        if not isinstance(item, dict):
+            _note(repairs, "unknown_reference")
+            continue
+        day = as_day(item.get("day"))
+        if not index.has_day(day) or ("newDay" in item and not index.has_day(item["newDay"])):
+            _note(repairs, "day_out_of_range")
+            continue
+        title = _resolve(index, item.get(key), day)
+        if title is None:
+            _note(repairs, "unknown_reference")
+            continue
+        if title != item[key]:
+            item[key] = title
+            _note(repairs, "reference_title")
+        kept.append(item)
+    return kept
+
+
+def _check_remove(data: dict, index: ItineraryIndex, repairs: set) -> str | None:
+    items = data.get("items") or []
+    kept = _check_references(items, "title", index, repairs)
+    if not kept:
+        day = as_day(items[0].get("day")) if items and isinstance(items[0], dict) else None
+        if index.has_day(day):
+            return f"None of those items are on day {day}. Day {day} has: {_day_titles(index, day)}. Use their exact titles."
+        return _out_of_range(index)
+    data["items"] = kept
+    return None
+
+
+def _check_modify(data: dict, index: ItineraryIndex, repairs: set) -> str | None:
+    updates = data.get("updates") or []
+    kept = _check_references(updates, "originalTitle", index, repairs)
+    if not kept:
+        day = as_day(updates[0].get("day")) if updates and isinstance(updates[0], dict) else None
+        if index.has_day(day):
+            return f"None of those items are on day {day}. Day {day} has: {_day_titles(index, day)}. Use their exact titles as 'originalTitle'."
+        return _out_of_range(index)
+    data["updates"] = kept
+    return None
+
+
+def _in_range(items: list, index: ItineraryIndex, repairs: set) -> list:
+    kept = [item for item in items if isinstance(item, dict) and index.has_day(item.get("day"))]
+    if len(kept) < len(items):
+        _note(repairs, "day_out_of_range")
+    return kept
+
+
+def _check_suggest(data: dict, index: ItineraryIndex, repairs: set) -> str | None:
+    new_items = _in_range(data.get("newItems") or [], index, repairs)
+    if not new_items:
+        return _out_of_range(index)
+    data["newItems"] = new_items
+    target_day = as_day(new_items[0]["day"])
+
+    # The client removes these from the target day only
+    wanted = data.get("itemsToRemove") or []
+    to_remove = []
+    for phrase in wanted if isinstance(wanted, list) else []:
+        title = _resolve(index, phrase, target_day)
+        if title is None:
+            _note(repairs, "unknown_reference")
+        elif title not in to_remove:
+            if title != phrase:
+                _note(repairs, "reference_title")
+            to_remove.append(title)
+    if "itemsToRemove" in data and to_remove != wanted:
+        data["itemsToRemove"] = to_remove
+
+    schedules = {}
+
+    def schedule_for(day: int):
+        if day not in schedules:
+            schedules[day] = index.schedule(day)
+            if day == target_day:
+                for item in index.items_on(day):
+                    if any(_client_matches(title, item) for title in to_remove):
+                        schedules[day].remove(item)
+        return schedules[day]
+
+    meals = []
+    if data.get("isOptions") is True:
+        # One shared slot, taken from the first option
+        first = new_items[0]
+        start = to_minutes(first.get("startTime"))
+        start = DAY_START if start is None else start
+        duration = _minutes(first.get("duration"), 60)
+        placed = _place(schedule_for(target_day), start, duration, repairs, meals)
+        if placed != start:
+            for item in new_items:
+                item["startTime"] = format_minutes(placed)
+                item["endTime"] = format_minutes(placed + _minutes(item.get("duration"), duration))
+    else:
+        cursor = DAY_START
+        for item in new_items:
+            day = as_day(item["day"])
+            start = to_minutes(item.get("startTime"))
+            start = cursor if start is None else start
+            duration = _minutes(item.get("duration"), 60)
+            schedule = schedule_for(day)
+            placed = _place(schedule, start, duration, repairs, meals if day == target_day else None)
+            if placed != start:
+                item["startTime"] = format_minutes(placed)
+                item.pop("endTime", None)
+            schedule.add(placed, placed + duration, item)
+            cursor = placed + duration + ITEM_GAP
+    if meals:
+        data["itemsToRemove"] = to_remove + [item["title"] for item in meals if item["title"] not in to_remove]
+    return None
+
+
+def _check_plan(data: dict, index: ItineraryIndex, repairs: set) -> str | None:
+    items = _in_range(data.get("items") or [], index, repairs)
+    if not items:
+        return _out_of_range(index)
+    data["items"] = items
+    replace = (data.get("replacementStrategy") or "replace") == "replace"
+
+    schedules = {}
+
+    def schedule_for(day: int):
+        if day not in schedules:
+            schedule = schedules[day] = index.schedule(day)
+            if replace:
+                # What the client clears before adding: earlier AI items and generic meals
+                for item in index.items_on(day):
+                    if item.get("suggestedBy") == "ai" or str(item["title"]).lower() in _REPLACEABLE:
+                        schedule.remove(item)
+        return schedules[day]
+
+    if data.get("isOptions") is True:
+        # The client puts every option in the first one's slot
+        first = items[0]
+        day = as_day(first["day"])
+        start = to_minutes(first.get("startTime"))
+        start = 20 * 60 if start is None else start
+        duration = _minutes(first.get("duration"), 180)
+        placed = _place(schedule_for(day), start, duration, repairs)
+        if placed != start:
+            first["startTime"] = format_minutes(placed)
+        return None
+
+    by_day = {}
+    for item in items:
+        by_day.setdefault(as_day(item["day"]), []).append(item)
+    for day, day_items in by_day.items():
+        schedule = schedule_for(day)
+        cursor = DAY_START
+        if not replace and index.items_on(day):
+            ends = [to_minutes(item.get("endTime")) for item in index.items_on(day)]
+            cursor = max([cursor] + [end for end in ends if end is not None]) + ITEM_GAP
+        for item in day_items:
+            start = to_minutes(item.get("startTime"))
+            start = cursor if start is None else start
+            duration = _minutes(item.get("duration"), 60)
+            placed = _place(schedule, start, duration, repairs)
+            if placed != start:
+                item["startTime"] = format_minutes(placed)
+                item.pop("endTime", None)
+            schedule.add(placed, placed + duration, item)
+            cursor = placed + duration + ITEM_GAP
+    return None
+
+
+_CHECKS = {
+    "remove_items": _check_remove,
+    "update_items": _check_modify,
+    "smart_schedule": _check_suggest,
+    "add_items": _check_plan,
+}
+
+
+def check(data: dict, repairs: set, index: ItineraryIndex = None) -> str | None:
+    """Resolve `data`'s conflicts with the itinerary in place, naming each fix in `repairs`.
+
+    Returns feedback for the model when nothing valid is left, else None.
+    Without an index (none installed for this request) nothing is checked.
+    """
+    index = index or _index.get()
+    check_action = _CHECKS.get(data.get("action"))
+    if index is None or check_action is None:
+        return None
+    return check_action(data, index, repairs)
+
+
+def postprocess(raw: str, index: ItineraryIndex = None) -> str:
+    """`raw` with each action block checked; blocks left with nothing valid are dropped."""
+    index = index or _index.get()
+    if index is None:
+        return raw
+    pieces, last, changed = [], 0, False
+    for data, _, start, end in iter_json_spans(raw):
+        repairs = set()
+        problem = check(data, repairs, index)
+        if problem is None and not repairs:
+            continue
+        log("info", "conflicts.postprocess", action=data.get("action"), repairs=sorted(repairs), problem=problem)
+        pieces += [raw[last:start], "" if problem else json.dumps(data)]
+        last, changed = end, True
+    return "".join(pieces) + raw[last:] if changed else raw
+
+
+def stats() -> dict:
+    return dict(conflict_counts)
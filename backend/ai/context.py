@@ -0,0 +1,196 @@
+"""
+Token-budgeted prompt context for the crews.
+
+Every intent gets its own budget. Trip settings drop empty fields, the
+itinerary keeps only the days a request is about (grouped one line per day),
+and older chat is folded into a short extractive summary ahead of the most
+recent messages. Tokens are estimated at ~4 characters each, which is close
+enough for the Llama tokenizer to size prompts without loading it.
+"""
+import math
+import re
+
+from ai.itinerary import as_day, normalize_title
+
+# Per-intent token budgets for each section. Sections a crew never reads get 0.
+CONTEXT_BUDGETS = {
+    "REMOVE":  {"context": 120, "itinerary": 500, "chat": 0},
+    "MODIFY":  {"context": 160, "itinerary": 500, "chat": 0},
+    "SUGGEST": {"context": 300, "itinerary": 400, "chat": 0},
+    "PLAN":    {"context": 300, "itinerary": 0, "chat": 0},
+    "GENERAL": {"context": 300, "itinerary": 700, "chat": 600},
+}
+# Latest messages kept verbatim; anything older is summarized
+RECENT_MESSAGES = 6
+SUMMARY_SHARE = 0.35
+
+_DAY_MENTION = re.compile(r"day\s*(\d+)", re.I)
+_FILLER_MESSAGE = re.compile(r"^(?:ok(?:ay)?|k|yes|yeah|yep|no|nope|lol|haha+|sure|cool|nice|thanks?|thank you|\W*)$", re.I)
+_QUERY_STOPWORDS = {
+    "the", "a", "an", "to", "on", "in", "for", "from", "of", "and", "my", "our", "day", "move", "remove",
+    "delete", "change", "reschedule", "push", "back", "at", "by", "it", "please", "can", "you", "pm", "am",
+}
+_UNSET = ("", None, "Unknown", "Not specified")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def target_days(query: str) -> list[int]:
+    """Days a query names explicitly ("day 3", "Day2"), in order of mention."""
+    days = []
+    for match in _DAY_MENTION.finditer(query):
+        day = int(match.group(1))
+        if day not in days:
+            days.append(day)
+    return days
+
+
+def _relevant_days(intent: str, query: str, itinerary: list) -> list[int] | None:
+    """Days to show for `intent`, or None for all of them."""
+    days = target_days(query)
+    if intent in ("REMOVE", "MODIFY"):
+        # The item being edited may live on a day the query doesn't name ("move the hike to day 3")
+        words = {w for w in normalize_title(query).split() if w not in _QUERY_STOPWORDS and not w.isdigit()}
+        mentioned = {
+            as_day(item.get("day")) for item in itinerary
+            if words & set(normalize_title(item.get("title", "")).split())
+        } - {None}
+        if not mentioned & set(days):
+            days.extend(sorted(mentioned))
+    return sorted(set(days)) or None
+
+
+def _truncate(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[:max(0, budget * 4 - 3)].rstrip() + "..."
+
+
+def build_trip_context(trip_context: dict, budget: int) -> str:
+    """Trip settings and persistent preferences, without the fields nobody filled in."""
+    settings = trip_context.get("settings", {}) or {}
+    preferences = trip_context.get("preferences", {}) or {}
+    lines = [
+        ("Trip Destination", settings.get("destination")),
+        ("Duration", f"{settings['daysCount']} days, {settings.get('nightsCount', '?')} nights" if settings.get("daysCount") else None),
+        ("Group Size", settings.get("groupSize")),
+        ("Age Group", settings.get("ageGroup")),
+        ("Hotel", settings.get("hotel")),
+        ("Landing Time", settings.get("landingTime")),
+        ("Departure Time", settings.get("departureTime")),
+        ("Dietary", ", ".join(preferences.get("dietary", []) or [])),
+        ("Interests", ", ".join(preferences.get("interests", []) or [])),
+        ("Constraints", ", ".join(preferences.get("constraints", []) or [])),
+        ("Budget", preferences.get("budget")),
+    ]
+    text = "\n".join(f"{label}: {value}" for label, value in lines if value not in _UNSET)
+    return _truncate(text or "Trip Destination: Unknown", budget)
+
+
+def _format_item(item: dict) -> str:
+    start, end = item.get("startTime"), item.get("endTime")
+    if start and end:
+        return f"{item.get('title')} {start}-{end}"
+    if item.get("duration"):
+        return f"{item.get('title')} ({item['duration']} min)"
+    return str(item.get("title"))
+
+
+def build_itinerary(itinerary: list, days: list[int] | None, budget: int) -> str:
+    """One line per day ("Day 1: Breakfast 08:00-09:00; ..."), limited to `days` and `budget`."""
+    if not itinerary:
+        return "No items scheduled yet."
+    by_day = {}
+    for item in itinerary:
+        day = as_day(item.get("day"))
+        if day is not None:
+            by_day.setdefault(day, []).append(item)
+
+    wanted = [d for d in (days or sorted(by_day)) if d in by_day]
+    if days and not wanted:
+        return "\n".join(f"Day {d}: nothing scheduled yet." for d in days)
+
+    lines, used, omitted = [], 0, []
+    for day in wanted:
+        line = f"Day {day}: " + "; ".join(_format_item(i) for i in by_day[day])
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            omitted.append(day)
+            continue
+        lines.append(line)
+        used += cost
+    for day in days or []:
+        if day not in by_day:
+            lines.append(f"Day {day}: nothing scheduled yet.")
+    hidden = [d for d in sorted(by_day) if d not in wanted] if days else []
+    if omitted:
+        lines.append(f"(Days {', '.join(map(str, omitted))} omitted for length.)")
+    elif hidden:
+        lines.append(f"(Other days: {', '.join(map(str, hidden))} — not shown.)")
+    return "\n".join(lines)
+
+
+def _summarize(messages: list, budget: int) -> str:
+    """Extractive summary: newest substantive lines first, shortened, within `budget`."""
+    lines, used, seen = [], 0, set()
+    for message in reversed(messages):
+        content = " ".join(str(message.get("content", "")).split())
+        if not content or _FILLER_MESSAGE.match(content) or content.lower() in seen:
+            continue
+        seen.add(content.lower())
+        words = content.split()
+        short = " ".join(words[:20]) + ("..." if len(words) > 20 else "")
+        line = f"- {message.get('senderName', 'User')}: {short}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return f"Earlier in the chat ({len(messages)} messages, summarized):\n" + "\n".join(reversed(lines))
+
+
+def build_chat(chat_history: list, user_query: str, budget: int) -> str:
+    """Most recent messages verbatim, older ones folded into a rolling summary."""
+    if budget <= 0 or not chat_history:
+        return ""
+    messages = list(chat_history)
+    if messages and user_query and user_query.lower() in str(messages[-1].get("content", "")).lower():
+        # The request itself is the newest message; the task already quotes it
+        messages = messages[:-1]
+
+    split = max(0, len(messages) - RECENT_MESSAGES)
+    recent_budget = budget - (int(budget * SUMMARY_SHARE) if split else 0)
+    kept, used = [], 0
+    for position in range(len(messages) - 1, split - 1, -1):
+        message = messages[position]
+        line = _truncate(f"{message.get('senderName', 'User')}: {message.get('content', '')}", recent_budget // 2)
+        cost = estimate_tokens(line) + 1
+        if used + cost > recent_budget:
+            split = position + 1
+            break
+        kept.append(line)
+        used += cost
+
+    older = messages[:split]
+    summary = _summarize(older, budget - used) if older else ""
+    return "\n".join(([summary] if summary else []) + list(reversed(kept)))
+
+
+def build_inputs(intent: str, user_query: str, trip_context: dict, chat_history: list) -> tuple[dict, dict]:
+    """Crew inputs for `intent` plus a report of the tokens each section uses."""
+    budget = CONTEXT_BUDGETS.get(intent, CONTEXT_BUDGETS["GENERAL"])
+    itinerary = trip_context.get("itinerary", []) or []
+    inputs = {
+        "user_query": user_query,
+        "context": build_trip_context(trip_context, budget["context"]),
+        "itinerary": build_itinerary(itinerary, _relevant_days(intent, user_query, itinerary), budget["itinerary"])
+        if budget["itinerary"] else "",
+        "chat": build_chat(chat_history or [], user_query, budget["chat"]),
+    }
+    report = {name: estimate_tokens(inputs[name]) for name in ("context", "itinerary", "chat")}
+    report["total"] = sum(report.values())
+    return inputs, report
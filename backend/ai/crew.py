@@ -3,29 +3,63 @@ CrewAI Trip Planner Agents
 3 Agents: Planner (manager), Search, Preference
 """
 import os
+import functools
 import json
 import re as _re
+import threading
+import time
+from collections import Counter
 from crewai import Agent, Crew, Task, Process
+from crewai.events import (
+    LLMCallCompletedEvent, LLMCallFailedEvent, TaskCompletedEvent, TaskFailedEvent,
+    ToolUsageErrorEvent, ToolUsageFinishedEvent, crewai_event_bus,
+)
 from crewai.tasks.task_output import TaskOutput
-from langchain_community.utilities import GoogleSerperAPIWrapper
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
-
 
-# Initialize NVIDIA NIM LLM (70B for complex planning)
-llm = ChatNVIDIA(
-    model="meta/llama-3.1-70b-instruct",
-    api_key=os.environ.get("NVIDIA_NIM_API_KEY"),
-    base_url="https://integrate.api.nvidia.com/v1",
-    max_tokens=4096
+from ai import conflicts, dayplan, deadline, prefetch, tiers, upstream
+from ai.clients import FAST_MODEL, PLANNING_MODEL, get_crew_llm, get_llm
+from ai.context import build_inputs, target_days
+from ai.events import emit
+from ai.fastpath import resolve_modify, resolve_remove
+from ai.itinerary import ItineraryIndex
+from ai.jsonrepair import extract_action
+from ai.logs import CREW_VERBOSE, enabled, log, preview, stats as log_stats
+from ai.metrics import inc, register_collector, span
+from ai.results import result_cache, trip_id
+from ai.search import cached_search, search_stats
+from ai.intent import (
+    CONFIDENCE_THRESHOLD, VALID_INTENTS, classify_local, intent_cache, normalize_query, route_counts
 )
 
-# Fast LLM for suggestions (8B)
-fast_llm = ChatNVIDIA(
-    model="meta/llama-3.1-8b-instruct",
-    api_key=os.environ.get("NVIDIA_NIM_API_KEY"),
-    base_url="https://integrate.api.nvidia.com/v1",
-    max_tokens=2048
-)
+
+# NVIDIA NIM clients: 70B for complex planning, 8B for routing and quick edits,
+# plus the same models as crewai LLMs shared by every Agent. Built on first use
+# (or by ai/warmup.py at startup), not at import; assigning one of these
+# globals replaces that client.
+llm = None
+fast_llm = None
+crew_llm = None
+fast_crew_llm = None
+
+_CLIENT_FACTORIES = {
+    "llm": lambda: get_llm(PLANNING_MODEL, max_tokens=4096),
+    "fast_llm": lambda: get_llm(FAST_MODEL, max_tokens=2048),
+    "crew_llm": lambda: get_crew_llm(PLANNING_MODEL, max_tokens=4096),
+    "fast_crew_llm": lambda: get_crew_llm(FAST_MODEL, max_tokens=2048),
+}
+
+def _client(name: str):
+    """Helper: the module-level client `name`, built on first use."""
+    client = globals()[name]
+    if client is None:
+        # get_llm/get_crew_llm are cached, so a race builds the same object
+        client = globals()[name] = _CLIENT_FACTORIES[name]()
+    return client
+
+def init_clients():
+    """Build every NIM client now instead of on the first request."""
+    for name in _CLIENT_FACTORIES:
+        _client(name)
 
 from crewai.tools import tool
 
@@ -36,132 +70,204 @@ def fast_search_tool(query: str):
     api_key = os.environ.get("SERPER_API_KEY")
     if not api_key:
         return "Error: Serper API key not found."
-    serper = GoogleSerperAPIWrapper(serper_api_key=api_key)
-    return serper.run(query)
+    emit("tool_start", tool="Fast Web Search", query=query)
+    started = time.perf_counter()
+    with span("search", tool="serper") as timing:
+        # The first search of a SUGGEST request may already be running (ai/prefetch.py)
+        result = prefetch.take(query)
+        timing.tag(source="prefetch" if result is not None else "search")
+        if result is None:
+            result = cached_search(query)
+    emit("tool_end", tool="Fast Web Search", query=query,
+         elapsed_ms=round((time.perf_counter() - started) * 1000))
+    return result
+
+# Agents are built per worker thread by the crew templates below (see CrewFactory)
 
 # Agent 1: Search Agent (has web search tools)
-search_agent = Agent(
-    role="Travel Researcher",
-    goal="Find the best travel options, restaurants, attractions, and activities. Calculate travel times between places.",
-    backstory="You are an expert travel researcher who knows how to find the best local experiences and hidden gems.",
-    tools=[fast_search_tool],
-    llm=llm,
-    verbose=True
-)
+def _search_agent() -> Agent:
+    return Agent(
+        role="Travel Researcher",
+        goal="Find the best travel options, restaurants, attractions, and activities. Calculate travel times between places.",
+        backstory="You are an expert travel researcher who knows how to find the best local experiences and hidden gems.",
+        tools=[fast_search_tool],
+        llm=_client("crew_llm"),
+        verbose=CREW_VERBOSE
+    )
 
 # Agent 2: Preference Agent  
-preference_agent = Agent(
-    role="Group Preference Analyst",
-    goal="Analyze group chat messages to understand what the group likes and dislikes. Extract food preferences, activity interests, budget hints, and time preferences.",
-    backstory="You are skilled at reading between the lines and understanding group dynamics. You pick up on subtle hints about what people really want.",
-    llm=llm,
-    verbose=True
-)
+def _preference_agent() -> Agent:
+    return Agent(
+        role="Group Preference Analyst",
+        goal="Analyze group chat messages to understand what the group likes and dislikes. Extract food preferences, activity interests, budget hints, and time preferences.",
+        backstory="You are skilled at reading between the lines and understanding group dynamics. You pick up on subtle hints about what people really want.",
+        llm=_client("crew_llm"),
+        verbose=CREW_VERBOSE
+    )
 
 # Agent 3: Planner Agent (TOP - orchestrates the other two)
-planner_agent = Agent(
-    role="Trip Itinerary Planner",
-    goal="Create amazing, well-organized itineraries that balance everyone's preferences. Consider travel times between locations and avoid scheduling conflicts.",
-    backstory="You are an experienced travel planner who creates perfect trip itineraries. You always consider practical constraints like travel time and make sure activities flow smoothly.",
-    llm=llm,
-    allow_delegation=True,
-    verbose=True
-)
+def _planner_agent() -> Agent:
+    return Agent(
+        role="Trip Itinerary Planner",
+        goal="Create amazing, well-organized itineraries that balance everyone's preferences. Consider travel times between locations and avoid scheduling conflicts.",
+        backstory="You are an experienced travel planner who creates perfect trip itineraries. You always consider practical constraints like travel time and make sure activities flow smoothly.",
+        llm=_client("crew_llm"),
+        allow_delegation=True,
+        verbose=CREW_VERBOSE
+    )
 
 # Agent 4: Fast Modifier Agent (using 8B model for simple JSON tasks)
-fast_modifier_agent = Agent(
-    role="Itinerary Modifier",
-    goal="Quickly update or remove items from the itinerary JSON based on user requests.",
-    backstory="You are a precise data assistant. You do not plan trips, you only manipulate JSON data structures accurately.",
-    llm=fast_llm, # Using 8B model for speed and efficiency
-    verbose=True
-)
+def _fast_modifier_agent() -> Agent:
+    return Agent(
+        role="Itinerary Modifier",
+        goal="Quickly update or remove items from the itinerary JSON based on user requests.",
+        backstory="You are a precise data assistant. You do not plan trips, you only manipulate JSON data structures accurately.",
+        llm=_client("fast_crew_llm"), # Using 8B model for speed and efficiency
+        verbose=CREW_VERBOSE
+    )
+
+# Agent 5: Suggestion Agent (8B model + web search)
+def _suggestion_agent() -> Agent:
+    return Agent(
+        role="Local Expert & Planner",
+        goal="Find the best places matching the request and format them for the itinerary.",
+        backstory="You are a knowledgeable local guide who knows the best spots. You are efficiency-focused and always return structured data.",
+        tools=[fast_search_tool],
+        llm=_client("fast_crew_llm"),
+        verbose=CREW_VERBOSE
+    )
+
+# Agent 6: Fast Planner Agent (70B, goal carries the requested theme)
+def _fast_planner_agent() -> Agent:
+    return Agent(
+        role="Creative Trip Planner",
+        goal="{agent_goal}",
+        backstory="You are an expert travel planner focused on creating the perfect introduction to a destination. For most travelers, you prioritize 'must-see' iconic landmarks, local culture, and top-rated experiences that define the place. However, if a specific theme is requested (like 'adventurous' or 'romantic'), you completely pivot to match that style.",
+        llm=_client("crew_llm"),
+        verbose=CREW_VERBOSE
+    )
 
 
 # ═══════════════════════════════════════════════════════════════
 # GUARDRAIL FUNCTIONS
 # ═══════════════════════════════════════════════════════════════
 
-def _extract_json(raw: str) -> dict | None:
-    """Helper: extract first JSON object from raw agent output."""
-    match = _re.search(r'\{.*\}', raw, _re.DOTALL)
-    if not match:
-        return None
-    try:
-        return json.loads(match.group())
-    except json.JSONDecodeError:
-        return None
+# Outcome of every guardrail check: clean, repaired locally, or retried by the LLM
+guardrail_counts = Counter()
+
+def _reject(task: str, feedback: str) -> tuple[bool, str]:
+    """Helper: fail a guardrail (the crew retries the task with `feedback`)."""
+    guardrail_counts["retries"] += 1
+    tiers.note_rejection()
+    inc("ai_guardrail_rejections_total", help="Guardrail rejections (each costs an LLM retry)", task=task)
+    emit("guardrail_retry", task=task, feedback=feedback)
+    return (False, feedback)
 
+def _accept(task: str, raw: str, data: dict, repairs: set) -> tuple[bool, str]:
+    """Helper: pass a guardrail, replacing the output with clean JSON if it needed repairs.
+
+    The answer is first checked against the trip's itinerary (ai/conflicts.py),
+    which fixes bad days, references and time clashes locally.
+    """
+    problem = conflicts.check(data, repairs)
+    if problem:
+        return _reject(task, problem)
+    tiers.note_accept()
+    if not repairs:
+        guardrail_counts["clean"] += 1
+        return (True, raw)
+    guardrail_counts["repairs"] += 1
+    emit("guardrail_repair", task=task, repairs=sorted(repairs))
+    return (True, json.dumps(data))
+
+def guardrail_stats() -> dict:
+    """How many guardrail checks passed clean, were repaired locally, or cost an LLM retry."""
+    return dict(guardrail_counts)
+
+def _timed(task: str):
+    """Helper: time a guardrail and label the span with its outcome."""
+    def decorate(check):
+        @functools.wraps(check)
+        def timed_check(output: TaskOutput) -> tuple[bool, str]:
+            with span("guardrail", task=task) as timing:
+                ok, value = check(output)
+                timing.tag(outcome="rejected" if not ok else "clean" if value is output.raw else "repaired")
+            return ok, value
+        return timed_check
+    return decorate
+
+@_timed("remove")
 def guardrail_remove(output: TaskOutput) -> tuple[bool, str]:
     """Guardrail for REMOVE tasks — expects action: remove_items with items[]."""
-    data = _extract_json(output.raw)
+    data, repairs = extract_action(output.raw, "remove_items")
     if data is None:
-        return (False, "Output must contain a valid JSON block. Output ONLY a JSON object with action: remove_items.")
+        return _reject("remove", "Output must contain a valid JSON block. Output ONLY a JSON object with action: remove_items.")
     if data.get("action") != "remove_items":
-        return (False, "JSON 'action' must be 'remove_items'. Fix the action field and try again.")
+        return _reject("remove", "JSON 'action' must be 'remove_items'. Fix the action field and try again.")
     items = data.get("items", [])
     if not items:
-        return (False, "JSON must contain a non-empty 'items' array. Each item needs 'title' and 'day'.")
+        return _reject("remove", "JSON must contain a non-empty 'items' array. Each item needs 'title' and 'day'.")
     for item in items:
         if "title" not in item or "day" not in item:
-            return (False, f"Every item must have 'title' and 'day'. This item is missing fields: {item}")
-    return (True, output.raw)
+            return _reject("remove", f"Every item must have 'title' and 'day'. This item is missing fields: {item}")
+    return _accept("remove", output.raw, data, repairs)
 
+@_timed("modify")
 def guardrail_modify(output: TaskOutput) -> tuple[bool, str]:
     """Guardrail for MODIFY tasks — expects action: update_items with updates[]."""
-    data = _extract_json(output.raw)
+    data, repairs = extract_action(output.raw, "update_items")
     if data is None:
-        return (False, "Output must contain a valid JSON block. Output ONLY a JSON object with action: update_items.")
+        return _reject("modify", "Output must contain a valid JSON block. Output ONLY a JSON object with action: update_items.")
     if data.get("action") != "update_items":
-        return (False, "JSON 'action' must be 'update_items'. Fix the action field and try again.")
+        return _reject("modify", "JSON 'action' must be 'update_items'. Fix the action field and try again.")
     updates = data.get("updates", [])
     if not updates:
-        return (False, "JSON must contain a non-empty 'updates' array with the items to modify.")
+        return _reject("modify", "JSON must contain a non-empty 'updates' array with the items to modify.")
     for u in updates:
         if "originalTitle" not in u or "day" not in u:
-            return (False, f"Every update must have 'originalTitle' and 'day'. This is missing fields: {u}")
-    return (True, output.raw)
+            return _reject("modify", f"Every update must have 'originalTitle' and 'day'. This is missing fields: {u}")
+    return _accept("modify", output.raw, data, repairs)
 
+@_timed("suggest")
 def guardrail_suggest(output: TaskOutput) -> tuple[bool, str]:
     """Guardrail for SUGGEST tasks — expects action: smart_schedule with newItems[]."""
-    data = _extract_json(output.raw)
+    data, repairs = extract_action(output.raw, "smart_schedule")
     if data is None:
-        return (False, "Output must contain a valid JSON block. Output ONLY a JSON object with action: smart_schedule.")
+        return _reject("suggest", "Output must contain a valid JSON block. Output ONLY a JSON object with action: smart_schedule.")
     if data.get("action") != "smart_schedule":
-        return (False, "JSON 'action' must be 'smart_schedule'. Fix the action field and try again.")
+        return _reject("suggest", "JSON 'action' must be 'smart_schedule'. Fix the action field and try again.")
     new_items = data.get("newItems", [])
     if not new_items:
-        return (False, "JSON must contain a non-empty 'newItems' array with at least 2 options.")
+        return _reject("suggest", "JSON must contain a non-empty 'newItems' array with at least 2 options.")
     for item in new_items:
         missing = [f for f in ["title", "day", "duration"] if f not in item]
         if missing:
-            return (False, f"Item '{item.get('title', '?')}' is missing required fields: {missing}")
-    return (True, output.raw)
+            return _reject("suggest", f"Item '{item.get('title', '?')}' is missing required fields: {missing}")
+    return _accept("suggest", output.raw, data, repairs)
 
+@_timed("plan")
 def guardrail_plan(output: TaskOutput) -> tuple[bool, str]:
     """Guardrail for PLAN tasks — expects action: add_items with items[]."""
-    data = _extract_json(output.raw)
+    data, repairs = extract_action(output.raw, "add_items")
     if data is None:
-        return (False, "Output must contain a valid JSON block. Output ONLY a JSON object with action: add_items.")
+        return _reject("plan", "Output must contain a valid JSON block. Output ONLY a JSON object with action: add_items.")
     if data.get("action") != "add_items":
-        return (False, "JSON 'action' must be 'add_items'. Fix the action field and try again.")
+        return _reject("plan", "JSON 'action' must be 'add_items'. Fix the action field and try again.")
     items = data.get("items", [])
     if not items:
-        return (False, "JSON must contain a non-empty 'items' array with the planned activities.")
+        return _reject("plan", "JSON must contain a non-empty 'items' array with the planned activities.")
     for item in items:
         missing = [f for f in ["title", "day", "duration"] if f not in item]
         if missing:
-            return (False, f"Item '{item.get('title', '?')}' is missing required fields: {missing}")
-    return (True, output.raw)
+            return _reject("plan", f"Item '{item.get('title', '?')}' is missing required fields: {missing}")
+    return _accept("plan", output.raw, data, repairs)
 
 
 # ═══════════════════════════════════════════════════════════════
-# LLM-BASED INTENT CLASSIFIER
-# Uses fast_llm
+# INTENT CLASSIFIER
+# Local rules first (ai/intent.py), fast_llm only when they are unsure
 # ═══════════════════════════════════════════════════════════════
-ROUTE_PROMPT = """Classify the user's intent into exactly ONE category. Reply with ONLY the category name, nothing else.
-
-Categories:
+_ROUTE_CATEGORIES = """Categories:
 - REMOVE: User wants to delete, remove, cancel, clear, or empty items from the itinerary
 - MODIFY: User wants to move, reschedule, change time, rename, or update existing items (NOT add new ones)
 - SUGGEST: User wants suggestions, recommendations, options, places, or to add new activities to a specific day
@@ -179,183 +285,132 @@ Examples:
 "create an adventurous itinerary" → PLAN
 "plan my trip" → PLAN
 "make an itinerary for 5 days" → PLAN
-"hello" → GENERAL
+"hello" → GENERAL"""
+
+ROUTE_PROMPT = """Classify the user's intent into exactly ONE category. Reply with ONLY the category name, nothing else.
+
+""" + _ROUTE_CATEGORIES + """
 
 User query: {query}
 Category:"""
 
+# All ambiguous queries of a batch in one call; answered as "<n>. <CATEGORY>" lines
+BATCH_ROUTE_PROMPT = """Classify the intent of EACH numbered user query into exactly ONE category. Reply with one line per query in the form "<number>. <CATEGORY>", nothing else.
+
+""" + _ROUTE_CATEGORIES + """
+
+User queries:
+{queries}
+"""
+
+def _route_without_llm(user_query: str, key: str) -> tuple[str | None, str]:
+    """Helper: (cached or confident local intent or None, best local guess)."""
+    cached = intent_cache.get(key)
+    if cached:
+        route_counts["cache"] += 1
+        log("info", "route", query=user_query, intent=cached, source="cache")
+        emit("intent", intent=cached, source="cache")
+        return cached, cached
+
+    # Stage 1: local rules, microseconds
+    local_intent, confidence = classify_local(user_query)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        intent_cache.set(key, local_intent)
+        route_counts["local"] += 1
+        log("info", "route", query=user_query, intent=local_intent, source="local", confidence=confidence)
+        emit("intent", intent=local_intent, source="local", confidence=confidence)
+        return local_intent, local_intent
+    return None, local_intent
+
 def classify_intent(user_query: str) -> str:
+    key = normalize_query(user_query)
+    intent, local_intent = _route_without_llm(user_query, key)
+    if intent:
+        return intent
+
+    # Stage 2: 8B model for the ambiguous remainder
     try:
-        response = fast_llm.invoke(ROUTE_PROMPT.format(query=user_query))
+        with upstream.priority("ROUTE"), deadline.limit(deadline.ROUTE_BUDGET), \
+                span("classify_llm", model=FAST_MODEL):
+            response = _client("fast_llm").invoke(ROUTE_PROMPT.format(query=user_query))
         intent = response.content.strip().split()[0].upper()  # Take first word only
-        valid_intents = {"MODIFY", "REMOVE", "SUGGEST", "PLAN", "GENERAL"}
-        if intent in valid_intents:
-            print(f"[ROUTER] Query: '{user_query}' → Intent: {intent}")
+        if intent in VALID_INTENTS:
+            intent_cache.set(key, intent)
+            route_counts["llm"] += 1
+            log("info", "route", query=user_query, intent=intent, source="llm")
+            emit("intent", intent=intent, source="llm")
             return intent
     except Exception as e:
-        print(f"[ROUTER] LLM classification failed: {e}")
+        log("warning", "route.llm_failed", query=user_query, error=str(e))
     
-    # Fallback: keyword-based classification if LLM fails
-    q = user_query.lower()
-    if any(w in q for w in ["delete", "remove", "cancel", "clear", "empty", "reset"]):
-        intent = "REMOVE"
-    elif any(w in q for w in ["move", "change", "update", "shift", "reschedule"]):
-        intent = "MODIFY"
-    elif any(w in q for w in ["suggest", "recommend", "options", "places", "spots", "ideas"]):
-        intent = "SUGGEST"
-    elif any(w in q for w in ["create", "make", "plan", "generate", "build"]) and any(w in q for w in ["itinerary", "trip", "schedule"]):
-        intent = "PLAN"
-    else:
-        intent = "SUGGEST"
-    
-    print(f"[ROUTER] Query: '{user_query}' → Intent: {intent} (keyword fallback)")
-    return intent
+    # Fallback: best local guess if LLM fails (not cached, so the LLM gets another chance)
+    route_counts["fallback"] += 1
+    log("info", "route", query=user_query, intent=local_intent, source="keyword")
+    emit("intent", intent=local_intent, source="keyword")
+    return local_intent
 
-def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: list) -> str:
-    """Create and run a crew to generate trip suggestions."""
-    import datetime
-    
-    def log_to_file(tag, content):
-        print(f"\n{'='*20} {tag} {datetime.datetime.now()} {'='*20}")
-        print(str(content))
-        print(f"{'='*50}\n")
-    
-    log_to_file("USER QUERY", user_query)
-    
-    # Format context for agents
-    settings = trip_context.get("settings", {})
-    preferences = trip_context.get("preferences", {})
-    existing_itinerary = trip_context.get("itinerary", [])
-    
-    context_str = f"""
-    Trip Destination: {settings.get('destination', 'Unknown')}
-    Group Size: {settings.get('groupSize', 'Unknown')}
-    Duration: {settings.get('daysCount', 'Unknown')} days, {settings.get('nightsCount', 'Unknown')} nights
-    Age Group: {settings.get('ageGroup', 'mixed')}
-    Landing Time: {settings.get('landingTime', 'Not specified')}
-    Departure Time: {settings.get('departureTime', 'Not specified')}
-    Hotel: {settings.get('hotel', 'Not specified')}
-
-    USER PREFERENCES (Persistent):
-    - Dietary: {", ".join(preferences.get('dietary', []))}
-    - Interests: {", ".join(preferences.get('interests', []))}
-    - Constraints: {", ".join(preferences.get('constraints', []))}
-    - Budget: {preferences.get('budget', 'Not specified')}
-    """
-    
-    chat_str = "\n".join([f"{m.get('senderName', 'User')}: {m.get('content', '')}" for m in chat_history[-20:]])
-    
-    itinerary_str = "\\n".join([f"Day {i.get('day')}: {i.get('title')} at {i.get('startTime')}-{i.get('endTime')}" for i in existing_itinerary]) if existing_itinerary else "No items scheduled yet."
-    
-    log_to_file("ITINERARY CONTEXT", itinerary_str)
-    
-    # Define tasks
-    search_task = Task(
-        description=f"""Search for information related to: {user_query}
-        
-        Trip context: {context_str}
-        
-        Find relevant options for the destination. Include practical details like opening hours, prices, and locations.""",
-        agent=search_agent,
-        expected_output="A list of 5-10 relevant options with details including name, description, location, and practical info."
-    )
-    
-    preference_task = Task(
-        description=f"""Analyze this group chat to understand preferences:
-        
-        {chat_str}
-        
-        What does this group like? What should be avoided? Any dietary restrictions? Budget concerns?
-        
-        If you find NEW preferences that are not already listed in the Trip Context, you MUST output a JSON block to update them.
-        
-        FORMAT:
-        ```json
-        {{
-            "action": "update_preferences",
-            "preferences": {{
-                "dietary": ["Vegan", "Gluten-free"],
-                "interests": ["Hiking", "History"],
-                "constraints": ["No stairs"],
-                "budget": "Medium"
-            }}
-        }}
-        ```
-        
-        Merge new findings with existing ones. Only output this if there are NEW findings.""",
-        agent=preference_agent,
-        expected_output="A text summary of preferences, OPTIONALLY followed by a JSON block with action: update_preferences if new info is found."
-    )
-    
-    planning_task = Task(
-        description=f"""Based on the search results and group preferences, create suggestions for: {user_query}
-        
-        Existing itinerary:
-        {itinerary_str}
-        
-        Trip settings: {context_str}
-        
-        Create ranked suggestions that:
-        1. Match group preferences
-        2. Don't clash with existing itinerary items
-        3. Account for travel times between locations
-        4. Are practical given the trip duration and group size
+_NUMBERED_INTENT = _re.compile(r"^\W*(\d+)\W+([A-Za-z]+)", _re.M)
 
-        Determine if the user wants to REPLACE existing suggestions or ADD MORE to the list.
-        - If query has "more", "additional", "other", "else": replacementStrategy = "append"
-        - If query has "instead", "change", "replace", "different", or is a new request: replacementStrategy = "replace"
-        
-        IMPORTANT: You must NOT output conversational text or lists.
-        Output ONLY the JSON block with the action "add_items".
-        
-        The user wants to see the items in their itinerary UI, not in the chat text.
-        
-        JSON FORMAT:
-        ```json
-        {{
-            "action": "add_items",
-            "replacementStrategy": "replace",
-            "items": [
-                {{
-                    "title": "Activity Name",
-                    "description": "Brief description",
-                    "day": 1,
-                    "duration": 120,
-                    "location": "Address or location name"
-                }}
-            ]
-        }}
-        ```
-        
-        "replacementStrategy" must be either "replace" or "append".
-        
-        If the Preference Agent found new preferences, include the "update_preferences" JSON block as well.
-        
-        DO NOT include "Here are the suggestions:" or any other text. JUST THE JSON.""",
-        agent=planner_agent,
-        expected_output="A JSON block with action: add_items. NO conversational text.",
-    )
+def classify_intents(user_queries: list[str]) -> list[str]:
+    """classify_intent for several queries, with one fast_llm call for all the ambiguous ones."""
+    intents = [None] * len(user_queries)
+    guesses = {}
+    ambiguous = {}  # normalized query -> indexes, so repeats are asked once
+    for i, user_query in enumerate(user_queries):
+        key = normalize_query(user_query)
+        intents[i], guesses[i] = _route_without_llm(user_query, key)
+        if intents[i] is None:
+            ambiguous.setdefault(key, []).append(i)
+    if not ambiguous:
+        return intents
 
-    # ═══════════════════════════════════════════════════════════════
-    # LLM-BASED INTENT ROUTING
-    # ═══════════════════════════════════════════════════════════════
-    intent = classify_intent(user_query)
-    query_lower = user_query.lower()
+    keys = list(ambiguous)
+    numbered = "\n".join(f"{n}. {user_queries[ambiguous[key][0]]}" for n, key in enumerate(keys, 1))
+    answers = {}
+    try:
+        with upstream.priority("ROUTE"), deadline.limit(deadline.ROUTE_BUDGET), \
+                span("classify_llm", model=FAST_MODEL):
+            response = _client("fast_llm").invoke(BATCH_ROUTE_PROMPT.format(queries=numbered))
+        for number, word in _NUMBERED_INTENT.findall(response.content):
+            if word.upper() in VALID_INTENTS:
+                answers.setdefault(int(number), word.upper())
+    except Exception as e:
+        log("warning", "route.llm_failed", queries=len(keys), error=str(e))
 
-    # ═══════════════════════════════════════════════════════════════
-    # PATH 1: REMOVAL (8B Model)
-    # ═══════════════════════════════════════════════════════════════
-    if intent == "REMOVE":
-        # Handle removal requests with remove_items action
-        mod_task = Task(
-            description=f"""The user wants to REMOVE item(s) from the itinerary.
+    for n, key in enumerate(keys, 1):
+        intent = answers.get(n)
+        for i in ambiguous[key]:
+            if intent:
+                route_counts["llm"] += 1
+                intents[i] = intent
+            else:
+                # Unanswered lines fall back like classify_intent (not cached)
+                route_counts["fallback"] += 1
+                intents[i] = guesses[i]
+            log("info", "route", query=user_queries[i], intent=intents[i], source="llm" if intent else "keyword",
+                batch=len(keys))
+        if intent:
+            intent_cache.set(key, intent)
+    return intents
+
+# ═══════════════════════════════════════════════════════════════
+# CREW TEMPLATES
+# Each path's agents, tasks and crew are built once per worker thread
+# with {placeholders} in their text; a request only binds its inputs
+# via kickoff(inputs=...). Tasks a path doesn't use are never built.
+# ═══════════════════════════════════════════════════════════════
+
+def _build_remove_crew() -> Crew:
+    agent = _fast_modifier_agent()
+    task = Task(
+        description="""The user wants to REMOVE item(s) from the itinerary.
             
             User Request: {user_query}
             
             Existing Itinerary:
-            {itinerary_str}
+            {itinerary}
             
-            Trip Settings: {context_str}
+            Trip Settings: {context}
             
             Identify the EXACT item(s) to remove based on the user's request.
             Match the title and day from the existing itinerary.
@@ -364,15 +419,15 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
             
             Format:
             ```json
-            {{
+            {
                 "action": "remove_items",
                 "items": [
-                    {{
+                    {
                         "title": "Exact title from itinerary",
                         "day": 1
-                    }}
+                    }
                 ]
-            }}
+            }
             ```
             
             RULES:
@@ -383,35 +438,24 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
             5. If user says "clear day X" or "empty day X" or "reset day X", include ALL items from day X in the removal list.
             6. For "clear day X", list EVERY item that has day: X in the existing itinerary.
             """,
-            agent=fast_modifier_agent,
-            expected_output="JSON block with action: remove_items.",
-            guardrail=guardrail_remove,
-            max_retries=3
-        )
-        
-        mod_crew = Crew(
-            agents=[fast_modifier_agent],
-            tasks=[mod_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        result = mod_crew.kickoff()
-        return str(result)
+        agent=agent,
+        expected_output="JSON block with action: remove_items.",
+        guardrail=guardrail_remove,
+        max_retries=3
+    )
+    return Crew(agents=[agent], tasks=[task], process=Process.sequential, verbose=CREW_VERBOSE)
 
-    # ═══════════════════════════════════════════════════════════════
-    # PATH 2: MODIFICATION (8B Model)
-    # ═══════════════════════════════════════════════════════════════
-    elif intent == "MODIFY":
-        # Handle modifications (move, reschedule, rename)
-        mod_task = Task(
-            description=f"""The user wants to MODIFY the itinerary.
+def _build_modify_crew() -> Crew:
+    agent = _fast_modifier_agent()
+    task = Task(
+        description="""The user wants to MODIFY the itinerary.
             
             User Request: {user_query}
             
             Existing Itinerary:
-            {itinerary_str}
+            {itinerary}
             
-            Trip Settings: {context_str}
+            Trip Settings: {context}
             
             Identify the item(s) to modify.
             
@@ -419,64 +463,44 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
             
             Format:
             ```json
-            {{
+            {
                 "action": "update_items",
                 "updates": [
-                    {{
+                    {
                         "originalTitle": "Exact or partial title of item",
                         "day": 1,
                         "newStartTime": "20:00",
                         "newEndTime": "22:00"
-                    }}
+                    }
                 ]
-            }}
+            }
             ```
             
             For moving items: Update startTime and endTime.
             For renaming: Add "newTitle": "New Name".
+            For moving to another day: Add "newDay": 3.
             
             RULES:
             1. Use 24-hour format for times (HH:MM).
             2. Ensure "day" matches the item's day.
             3. Output ONLY JSON.
             """,
-            agent=fast_modifier_agent,
-            expected_output="JSON block with action: update_items.",
-            guardrail=guardrail_modify,
-            max_retries=3
-        )
-        
-        mod_crew = Crew(
-            agents=[fast_modifier_agent],
-            tasks=[mod_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        result = mod_crew.kickoff()
-        return str(result)
+        agent=agent,
+        expected_output="JSON block with action: update_items.",
+        guardrail=guardrail_modify,
+        max_retries=3
+    )
+    return Crew(agents=[agent], tasks=[task], process=Process.sequential, verbose=CREW_VERBOSE)
 
-    # ═══════════════════════════════════════════════════════════════
-    # PATH 3: SUGGESTION (8B Model + Serper Search)
-    # ═══════════════════════════════════════════════════════════════
-    elif intent == "SUGGEST":
-        # Create a specialized agent that can search AND format
-        # Uses fast_llm and fast_search_tool
-        suggestion_agent = Agent(
-            role="Local Expert & Planner",
-            goal="Find the best places matching the request and format them for the itinerary.",
-            backstory="You are a knowledgeable local guide who knows the best spots. You are efficiency-focused and always return structured data.",
-            tools=[fast_search_tool],
-            llm=fast_llm,
-            verbose=True
-        )
-
-        suggestion_task = Task(
-            description=f"""User Request: {user_query}
-            
-            Trip Context: {context_str}
+def _build_suggest_crew() -> Crew:
+    agent = _suggestion_agent()
+    task = Task(
+        description="""User Request: {user_query}
+            
+            Trip Context: {context}
             
             CURRENT SCHEDULE (analyze this carefully):
-            {itinerary_str}
+            {itinerary}
             
             **DAY VALIDATION (CRITICAL - CHECK THIS FIRST!):**
             Look at the Trip Context above for "Duration: X days".
@@ -502,11 +526,11 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
             OUTPUT FORMAT:
             You MUST output a JSON with BOTH new items AND any schedule adjustments:
             
-            {{
+            {
                 "action": "smart_schedule",
                 "isOptions": true,
                 "newItems": [
-                    {{
+                    {
                         "title": "Option A: Scuba Diving",
                         "description": "Deep dive at Neil Island",
                         "day": 3,
@@ -514,8 +538,8 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
                         "startTime": "09:00",
                         "endTime": "12:00",
                         "location": "Neil Island"
-                    }},
-                     {{
+                    },
+                     {
                         "title": "Option B: Glass Bottom Boat",
                         "description": "Relaxed view of coral",
                         "day": 3,
@@ -523,11 +547,11 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
                          "startTime": "09:00",
                         "endTime": "12:00",
                         "location": "Neil Jetty"
-                    }}
+                    }
                 ],
                 "itemsToRemove": ["Breakfast"],
                 "reschedule": []
-            }}
+            }
             ```
             
             KEY PARAMETERS:
@@ -544,34 +568,445 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
             CRITICAL: You MUST end your response with the JSON block. Do NOT just list suggestions in text.
             The user CANNOT see text suggestions - they can ONLY see items added to the itinerary via JSON.
             """,
-            agent=suggestion_agent,
-            expected_output="You MUST output a JSON block with action: smart_schedule. This is REQUIRED, not optional.",
-            guardrail=guardrail_suggest,
-            max_retries=3
-        )
+        agent=agent,
+        expected_output="You MUST output a JSON block with action: smart_schedule. This is REQUIRED, not optional.",
+        guardrail=guardrail_suggest,
+        max_retries=3
+    )
+    return Crew(agents=[agent], tasks=[task], process=Process.sequential, verbose=CREW_VERBOSE)
+
+def _build_plan_crew() -> Crew:
+    agent = _fast_planner_agent()
+    task = Task(
+        description="""USER REQUEST: {user_query}
+            
+            Trip settings: {context}
+            {theme_emphasis}
+            {day_instruction}
+            
+            IMPORTANT: READ THE USER REQUEST ABOVE. If they said "adventurous", "romantic", "relaxing", etc., 
+            you MUST create activities that match that theme. Do NOT ignore adjectives!
+            
+            RULES:
+            1. For meals, use GENERIC titles: "Breakfast", "Lunch", "Dinner" - no restaurant names.
+            2. For attractions, choose activities that MATCH THE USER'S REQUESTED THEME/STYLE.
+            3. Keep descriptions to MAX 5 words each (very brief).
+            4. IMPORTANT: Include 5-6 activities per day covering MORNING, AFTERNOON, and EVENING.
+            5. EVERY day MUST have: Breakfast, morning activity, Lunch, afternoon activity, Dinner, and optionally an evening activity.
+            6. OUTPUT A SINGLE JSON OBJECT containing {output_limit_instruction} in one 'items' array.
+            7. Do NOT output multiple JSON blocks.
+            8. Set "replacementStrategy" to "replace" (default for new plans).
+            9. CRITICAL: Use "duration" (in minutes). Time fields (startTime/endTime) are OPTIONAL.
+            
+            OUTPUT FORMAT:
+            ```json
+            {
+                "action": "add_items",
+                "replacementStrategy": "replace",
+                "items": [
+                    {"title": "Breakfast", "description": "Fuel up", "day": {example_day}, "duration": 60, "location": "Hotel"},
+                    {"title": "[THEMED ACTIVITY]", "description": "Brief desc", "day": {example_day}, "duration": 180, "location": "Location"},
+                    ...
+                ]
+            }
+            ```""",
+        agent=agent,
+        expected_output="JSON block with action: add_items.",
+        guardrail=guardrail_plan,
+        max_retries=3
+    )
+    return Crew(agents=[agent], tasks=[task], process=Process.sequential, verbose=CREW_VERBOSE)
+
+def _build_general_crew() -> Crew:
+    search_agent = _search_agent()
+    preference_agent = _preference_agent()
+    planner_agent = _planner_agent()
+
+    search_task = Task(
+        description="""Search for information related to: {user_query}
         
-        fast_crew = Crew(
-            agents=[suggestion_agent],
-            tasks=[suggestion_task],
-            process=Process.sequential,
-            verbose=True
-        )
+        Trip context: {context}
         
-        result = fast_crew.kickoff()
-        log_to_file("SUGGESTION RESULT", result)
-        return str(result)
+        Find relevant options for the destination. Include practical details like opening hours, prices, and locations.""",
+        agent=search_agent,
+        expected_output="A list of 5-10 relevant options with details including name, description, location, and practical info.",
+        async_execution=True
+    )
+    
+    preference_task = Task(
+        description="""Analyze this group chat to understand preferences:
+        
+        {chat}
+        
+        What does this group like? What should be avoided? Any dietary restrictions? Budget concerns?
+        
+        If you find NEW preferences that are not already listed in the Trip Context, you MUST output a JSON block to update them.
+        
+        FORMAT:
+        ```json
+        {
+            "action": "update_preferences",
+            "preferences": {
+                "dietary": ["Vegan", "Gluten-free"],
+                "interests": ["Hiking", "History"],
+                "constraints": ["No stairs"],
+                "budget": "Medium"
+            }
+        }
+        ```
+        
+        Merge new findings with existing ones. Only output this if there are NEW findings.""",
+        agent=preference_agent,
+        expected_output="A text summary of preferences, OPTIONALLY followed by a JSON block with action: update_preferences if new info is found.",
+        async_execution=True
+    )
+    
+    planning_task = Task(
+        description="""Based on the search results and group preferences, create suggestions for: {user_query}
+        
+        Existing itinerary:
+        {itinerary}
+        
+        Trip settings: {context}
+        
+        Create ranked suggestions that:
+        1. Match group preferences
+        2. Don't clash with existing itinerary items
+        3. Account for travel times between locations
+        4. Are practical given the trip duration and group size
+
+        Determine if the user wants to REPLACE existing suggestions or ADD MORE to the list.
+        - If query has "more", "additional", "other", "else": replacementStrategy = "append"
+        - If query has "instead", "change", "replace", "different", or is a new request: replacementStrategy = "replace"
+        
+        IMPORTANT: You must NOT output conversational text or lists.
+        Output ONLY the JSON block with the action "add_items".
+        
+        The user wants to see the items in their itinerary UI, not in the chat text.
+        
+        JSON FORMAT:
+        ```json
+        {
+            "action": "add_items",
+            "replacementStrategy": "replace",
+            "items": [
+                {
+                    "title": "Activity Name",
+                    "description": "Brief description",
+                    "day": 1,
+                    "duration": 120,
+                    "location": "Address or location name"
+                }
+            ]
+        }
+        ```
+        
+        "replacementStrategy" must be either "replace" or "append".
+        
+        If the Preference Agent found new preferences, include the "update_preferences" JSON block as well.
+        
+        DO NOT include "Here are the suggestions:" or any other text. JUST THE JSON.""",
+        agent=planner_agent,
+        expected_output="A JSON block with action: add_items. NO conversational text.",
+        context=[search_task, preference_task]
+    )
+
+    # search_task and preference_task don't depend on each other: both run
+    # concurrently and planning_task waits for (and reads) both outputs
+    return Crew(
+        agents=[search_agent, preference_agent, planner_agent],
+        tasks=[search_task, preference_task, planning_task],
+        process=Process.sequential,
+        verbose=CREW_VERBOSE
+    )
+
+
+class _NoReplayStorage:
+    """Stand-in for crewai's task output storage, which only `crewai replay` reads.
+
+    The real one rewrites a shared SQLite file under a cross-process file lock
+    on every kickoff and task, so concurrent crews (PLAN days, batch items,
+    parallel requests) queued on that lock.
+    """
+
+    def reset(self):
+        pass
+
+    def update(self, task_index, log):
+        pass
+
+    def add(self, *args, **kwargs):
+        pass
+
+    def load(self):
+        return None
+
+
+def _reusable(crew: Crew) -> bool:
+    """Whether this crewai has the private state CrewFactory resets between kickoffs (as 1.15 does)."""
+    return hasattr(crew, "_task_output_handler") and all(
+        hasattr(task, "retry_count") and isinstance(getattr(task, "_guardrail_retry_counts", None), dict)
+        for task in crew.tasks
+    )
+
+
+class CrewFactory:
+    """Per-thread cache of crew templates, keyed by path name and model tier.
+
+    crewai agents and tasks keep executor state while a crew runs, so each
+    worker thread gets its own copy of every template it uses. A template
+    built for a tier (ai/tiers.py) has all its agents on that tier's model.
+
+    Reusing a template means resetting crewai private attributes between
+    kickoffs. check_reuse() (run at warmup) looks for them once; on a crewai
+    without them every kickoff builds a fresh crew instead.
+    """
+
+    def __init__(self, builders: dict):
+        self._builders = builders
+        self._local = threading.local()
+        self.reuse = None
+
+    def check_reuse(self) -> bool:
+        """Whether templates can be reused with the installed crewai."""
+        if self.reuse is None:
+            self.reuse = _reusable(next(iter(self._builders.values()))())
+            if not self.reuse:
+                import crewai
+                log("warning", "crew.templates_disabled", crewai=crewai.__version__,
+                    reason="private kickoff state not found; building a crew per kickoff")
+        return self.reuse
+
+    def _build(self, name: str, tier: str = None) -> Crew:
+        with span("crew_build", path=name, tier=tier):
+            crew = self._builders[name]()
+            if self.reuse:
+                crew._task_output_handler = _NoReplayStorage()
+            if tier is not None:
+                for agent in crew.agents:
+                    agent.llm = _client(tiers.TIERS[tier][1])
+            # The builders' guardrail budgets, restored after a shortened attempt
+            crew._guardrail_retries = [task.guardrail_max_retries for task in crew.tasks]
+        return crew
+
+    def get(self, name: str, tier: str = None) -> Crew:
+        if not self.check_reuse():
+            return self._build(name, tier)
+        templates = getattr(self._local, "templates", None)
+        if templates is None:
+            templates = self._local.templates = {}
+        crew = templates.get((name, tier))
+        if crew is None:
+            crew = templates[(name, tier)] = self._build(name, tier)
+        return crew
+
+    def kickoff(self, name: str, inputs: dict, task: str = None):
+        """Run path `name` on the tier ai/tiers.py picks for `task` (default: `name`)."""
+        emit("crew_start", path=name)
+
+        def attempt(tier: str, guardrail_retries: int | None):
+            crew = self.get(name, tier)
+            for crew_task, retries in zip(crew.tasks, crew._guardrail_retries):
+                if self.reuse:
+                    # crewai keeps guardrail retry counters on the task between kickoffs
+                    crew_task.retry_count = 0
+                    crew_task._guardrail_retry_counts.clear()
+                crew_task.guardrail_max_retries = retries if guardrail_retries is None else guardrail_retries
+            with upstream.priority(name.upper()), \
+                    span("kickoff", intent=name.upper(), model=tiers.TIERS[tier][0], tier=tier):
+                return crew.kickoff(inputs=inputs)
+
+        result = tiers.run(task or name, attempt)
+        log("info", "result", path=name, source="crew", result=preview(result))
+        return result
+
+
+crew_factory = CrewFactory({
+    "remove": _build_remove_crew,
+    "modify": _build_modify_crew,
+    "suggest": _build_suggest_crew,
+    "plan": _build_plan_crew,
+    "general": _build_general_crew,
+})
+
+
+# ═══════════════════════════════════════════════════════════════
+# CREW TRACE LOGGING
+# ═══════════════════════════════════════════════════════════════
+# With CREW_VERBOSE off, agent/task/tool activity goes to the structured log
+# (debug, sampled per request) instead of console panels. crewai runs these
+# handlers on its own executor with the request's context copied, so the
+# records keep the request id.
+
+@crewai_event_bus.on(TaskCompletedEvent)
+def _log_task_completed(source, event):
+    if enabled("debug"):
+        agent = event.agent_role or getattr(getattr(event.task, "agent", None), "role", None)
+        log("debug", "crew.task_completed", agent=agent, task=preview(event.task_name or "", 80),
+            output=preview(getattr(event.output, "raw", event.output)))
+
+@crewai_event_bus.on(TaskFailedEvent)
+def _log_task_failed(source, event):
+    log("warning", "crew.task_failed", agent=event.agent_role, error=event.error)
+
+@crewai_event_bus.on(ToolUsageFinishedEvent)
+def _log_tool_finished(source, event):
+    if enabled("debug"):
+        log("debug", "crew.tool", agent=event.agent_role, tool=event.tool_name, args=preview(event.tool_args, 200),
+            from_cache=event.from_cache, output=preview(event.output))
+
+@crewai_event_bus.on(ToolUsageErrorEvent)
+def _log_tool_error(source, event):
+    log("warning", "crew.tool_failed", agent=event.agent_role, tool=event.tool_name, error=str(event.error))
+
+@crewai_event_bus.on(LLMCallCompletedEvent)
+def _log_llm_completed(source, event):
+    if enabled("debug"):
+        log("debug", "crew.llm", agent=event.agent_role, model=event.model, usage=event.usage,
+            response=preview(event.response))
+
+@crewai_event_bus.on(LLMCallFailedEvent)
+def _log_llm_failed(source, event):
+    log("warning", "crew.llm_failed", agent=event.agent_role, model=event.model, error=event.error)
+
+
+@register_collector
+def _collect_stats():
+    """Routing, cache, guardrail and prefetch counters as /metrics gauges."""
+    gauges = [("ai_intent_routes", {"stage": stage}, n) for stage, n in route_counts.items()]
+    gauges += [("ai_guardrail_checks", {"outcome": outcome}, n) for outcome, n in guardrail_counts.items()]
+    search = search_stats()
+    for cache, stats in (("intent", intent_cache.stats()), ("search", search), ("result", result_cache.stats())):
+        gauges += [(f"ai_cache_{field}", {"cache": cache}, stats[field]) for field in ("hits", "misses", "size")]
+    gauges.append(("ai_search_coalesced", {}, search["followers"]))
+    gauges += [("ai_prefetch", {"outcome": k}, v) for k, v in prefetch.stats().items() if not k.endswith("_rate")]
+    gauges += [("ai_log_records", {"outcome": k}, v) for k, v in log_stats().items()]
+    return gauges
+
+def _single_day_inputs(day: int, days_count: int = None) -> dict:
+    """Helper: PLAN crew inputs limiting the answer to `day`.
+
+    With `days_count` the day is one of a fan-out (ai/dayplan.py): the other
+    days are planned concurrently, so the prompt says which share of the
+    activities belongs to this day.
+    """
+    if days_count:
+        reason = f"This is Day {day} of a {days_count}-day trip; the other days are planned separately at the same time."
+        split = f"""
+            4. Do NOT take what the other days will do: rank the activities that fit this trip from most
+               to least essential and use those at positions {day}, {day + days_count}, {day + 2 * days_count}, ... for Day {day}."""
+    else:
+        reason = f"User specifically requested to plan for **DAY {day}**."
+        split = ""
+    return {
+        "day_instruction": f"""
+            
+            ⚠️⚠️⚠️ SINGLE DAY PLANNING ⚠️⚠️⚠️
+            {reason}
+            
+            YOU MUST:
+            1. ONLY generate activities for Day {day}.
+            2. Do NOT generate items for other days.
+            3. Ensure the "day" field in JSON is exactly {day} for all items.{split}
+            """,
+        "output_limit_instruction": f"ONLY items for Day {day}",
+        "example_day": day,
+    }
+
+def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: list, intent: str = None) -> str:
+    """Create and run a crew to generate trip suggestions.
+
+    `intent` skips classification when the caller already routed the query (batch endpoint).
+    """
+    log("info", "request", query=user_query, trip_id=trip_id(trip_context),
+        chat_messages=len(chat_history or []))
+
+    # ═══════════════════════════════════════════════════════════════
+    # LLM-BASED INTENT ROUTING
+    # ═══════════════════════════════════════════════════════════════
+    # Optionally start the SUGGEST path's first search while classification runs
+    speculative = None
+    if intent not in VALID_INTENTS:
+        speculative = prefetch.start(user_query, trip_context)
+        with span("route") as timing:
+            intent = classify_intent(user_query)
+            timing.tag(intent=intent)
+    # The budget of this intent, unless the client brought its own (ai/deadline.py)
+    deadline.set_intent(intent)
+
+    # Repeated asks against an unchanged trip reuse the previous crew answer
+    cache_key = result_cache.key(intent, user_query, trip_context, chat_history)
+    cached = result_cache.get(cache_key, trip_context)
+    if speculative and (intent != "SUGGEST" or cached is not None):
+        speculative.discard()
+    if cached is not None:
+        emit("result_cache", intent=intent)
+        inc("ai_result_cache_hits_total", help="Answers served from the result cache", intent=intent)
+        log("info", "result", path=intent.lower(), source="result_cache", result=preview(cached))
+        return cached
+
+    # Days, titles and time slots of the trip, for the fast paths and the guardrails
+    index = ItineraryIndex.from_trip(trip_context)
+    with conflicts.use(index):
+        return _answer(intent, user_query, trip_context, chat_history, index, cache_key, speculative)
+
+
+def _answer(intent: str, user_query: str, trip_context: dict, chat_history: list, index: ItineraryIndex,
+            cache_key: str, speculative) -> str:
+    """Run `intent`'s fast path or crew for a request the result cache could not answer."""
+    settings = trip_context.get("settings", {})
+    query_lower = user_query.lower()
+
+    # Per-request inputs bound into the crew templates, sized for this intent
+    with span("context", intent=intent):
+        inputs, context_tokens = build_inputs(intent, user_query, trip_context, chat_history)
+    emit("context", intent=intent, tokens=context_tokens)
+    log("info", "context", intent=intent, tokens=context_tokens)
+    log("debug", "context.itinerary", intent=intent, itinerary=preview(inputs["itinerary"]))
+
+    # ═══════════════════════════════════════════════════════════════
+    # PATH 1: REMOVAL (8B Model)
+    # ═══════════════════════════════════════════════════════════════
+    if intent == "REMOVE":
+        # Common forms ("clear day 2", "remove lunch from day 1") need no LLM
+        with span("fast_path", intent=intent):
+            resolved = resolve_remove(user_query, index)
+        if resolved:
+            emit("fast_path", path="remove")
+            log("info", "result", path="remove", source="fast_path", result=preview(resolved))
+            return resolved
+
+        result = crew_factory.kickoff("remove", inputs)
+        return result_cache.put(cache_key, trip_context, str(result))
+
+    # ═══════════════════════════════════════════════════════════════
+    # PATH 2: MODIFICATION (8B Model)
+    # ═══════════════════════════════════════════════════════════════
+    elif intent == "MODIFY":
+        # Single-item moves, shifts and renames ("move lunch to 2pm") need no LLM
+        with span("fast_path", intent=intent):
+            resolved = resolve_modify(user_query, index, settings.get('daysCount'))
+        if resolved:
+            emit("fast_path", path="modify")
+            log("info", "result", path="modify", source="fast_path", result=preview(resolved))
+            return resolved
+
+        result = crew_factory.kickoff("modify", inputs)
+        return result_cache.put(cache_key, trip_context, str(result))
+
+    # ═══════════════════════════════════════════════════════════════
+    # PATH 3: SUGGESTION (8B Model + Serper Search)
+    # ═══════════════════════════════════════════════════════════════
+    elif intent == "SUGGEST":
+        # Uses fast_llm and fast_search_tool (see _build_suggest_crew)
+        with prefetch.use(speculative):
+            result = crew_factory.kickoff("suggest", inputs)
+        return result_cache.put(cache_key, trip_context, str(result))
     
     # ═══════════════════════════════════════════════════════════════
     # PATH 4: Fast PLANNING (70B Model, no web search)
     # ═══════════════════════════════════════════════════════════════
     elif intent == "PLAN":
-        planning_llm = ChatNVIDIA(
-            model="meta/llama-3.1-70b-instruct",
-            api_key=os.environ.get("NVIDIA_NIM_API_KEY"),
-            base_url="https://integrate.api.nvidia.com/v1",
-            max_tokens=4096
-        )
-
         # Extract theme/adjectives from user query for emphasis
         theme_words = []
         theme_keywords = ["adventurous", "adventure", "romantic", "relaxing", "cultural", "foodie", 
@@ -589,14 +1024,6 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
         else:
             agent_goal = "Create themed, personalized JSON itineraries that match the user's vision"
         
-        fast_planner_agent = Agent(
-            role="Creative Trip Planner",
-            goal=agent_goal,
-            backstory="You are an expert travel planner focused on creating the perfect introduction to a destination. For most travelers, you prioritize 'must-see' iconic landmarks, local culture, and top-rated experiences that define the place. However, if a specific theme is requested (like 'adventurous' or 'romantic'), you completely pivot to match that style.",
-            llm=planning_llm,
-            verbose=True
-        )
-        
         theme_emphasis = ""
         if theme_words:
             theme_emphasis = f"""
@@ -631,92 +1058,38 @@ def create_suggestion_crew(user_query: str, trip_context: dict, chat_history: li
             4. Do NOT assume the user wants extreme adventure or niche activities unless specified.
             """
         
-        # Extract target day if specified (e.g., "day 3", "day three")
-        import re
-        target_day = None
-        day_match = re.search(r'day\s*(\d+)', query_lower)
-        if day_match:
-            target_day = int(day_match.group(1))
-        
+        # Extract target day if specified (e.g., "day 3")
+        days = target_days(user_query)
+        target_day = days[0] if days else None
+        inputs.update(agent_goal=agent_goal, theme_emphasis=theme_emphasis)
+
+        # A whole multi-day trip is planned one day per concurrent crew
+        if dayplan.should_fan_out(settings.get('daysCount'), target_day):
+            days_count = int(settings['daysCount'])
+
+            def run_day(day: int) -> str:
+                return str(crew_factory.kickoff("plan", {**inputs, **_single_day_inputs(day, days_count)}, task="plan_day"))
+
+            result = dayplan.plan_by_day(run_day, days_count)
+            if deadline.was_cut():
+                return result  # days missing for lack of time; not worth keeping
+            return result_cache.put(cache_key, trip_context, result)
+
         # Modify instructions if a specific day is targeted
-        day_instruction = ""
-        output_limit_instruction = ""
-        
         if target_day:
-            day_instruction = f"""
-            
-            ⚠️⚠️⚠️ SINGLE DAY PLANNING ⚠️⚠️⚠️
-            User specifically requested to plan for **DAY {target_day}**.
-            
-            YOU MUST:
-            1. ONLY generate activities for Day {target_day}.
-            2. Do NOT generate items for other days.
-            3. Ensure the "day" field in JSON is exactly {target_day} for all items.
-            """
-            output_limit_instruction = f"ONLY items for Day {target_day}"
+            inputs.update(_single_day_inputs(target_day))
         else:
-            output_limit_instruction = "ALL items for ALL days"
-
-        general_task = Task(
-            description=f"""USER REQUEST: {user_query}
-            
-            Trip settings: {context_str}
-            {theme_emphasis}
-            {day_instruction}
-            
-            IMPORTANT: READ THE USER REQUEST ABOVE. If they said "adventurous", "romantic", "relaxing", etc., 
-            you MUST create activities that match that theme. Do NOT ignore adjectives!
-            
-            RULES:
-            1. For meals, use GENERIC titles: "Breakfast", "Lunch", "Dinner" - no restaurant names.
-            2. For attractions, choose activities that MATCH THE USER'S REQUESTED THEME/STYLE.
-            3. Keep descriptions to MAX 5 words each (very brief).
-            4. IMPORTANT: Include 5-6 activities per day covering MORNING, AFTERNOON, and EVENING.
-            5. EVERY day MUST have: Breakfast, morning activity, Lunch, afternoon activity, Dinner, and optionally an evening activity.
-            6. OUTPUT A SINGLE JSON OBJECT containing {output_limit_instruction} in one 'items' array.
-            7. Do NOT output multiple JSON blocks.
-            8. Set "replacementStrategy" to "replace" (default for new plans).
-            9. CRITICAL: Use "duration" (in minutes). Time fields (startTime/endTime) are OPTIONAL.
-            
-            OUTPUT FORMAT:
-            ```json
-            {{
-                "action": "add_items",
-                "replacementStrategy": "replace",
-                "items": [
-                    {{"title": "Breakfast", "description": "Fuel up", "day": {target_day if target_day else 1}, "duration": 60, "location": "Hotel"}},
-                    {{"title": "[THEMED ACTIVITY]", "description": "Brief desc", "day": {target_day if target_day else 1}, "duration": 180, "location": "Location"}},
-                    ...
-                ]
-            }}
-            ```""",
-            agent=fast_planner_agent,
-            expected_output="JSON block with action: add_items.",
-            guardrail=guardrail_plan,
-            max_retries=3
-        )
-        
-        fast_crew = Crew(
-            agents=[fast_planner_agent],
-            tasks=[general_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        
-        result = fast_crew.kickoff()
-        return str(result)
+            inputs.update(day_instruction="", output_limit_instruction="ALL items for ALL days", example_day=1)
+        result = crew_factory.kickoff("plan", inputs, task="plan_day" if target_day else "plan")
+        return result_cache.put(cache_key, trip_context, str(result))
 
 
     # ═══════════════════════════════════════════════════════════════
     # PATH 5: FULL CREW FALLBACK (3 Agents, 70B Models)
     # ═══════════════════════════════════════════════════════════════
     else:
-        crew = Crew(
-            agents=[search_agent, preference_agent, planner_agent],
-            tasks=[search_task, preference_task, planning_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        
-        result = crew.kickoff()
-        return str(result)
\ No newline at end of file
+        result = crew_factory.kickoff("general", inputs)
+        # No guardrail saw this answer; check any actions in it against the itinerary
+        with span("postprocess", intent=intent):
+            result = conflicts.postprocess(str(result))
+        return result_cache.put(cache_key, trip_context, result)
\ No newline at end of file
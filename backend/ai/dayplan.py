@@ -0,0 +1,151 @@
+"""
+Per-day fan-out for multi-day PLAN requests.
+
+A whole-trip PLAN used to be one 70B call answering "ALL items for ALL
+days": its latency grew with daysCount, long trips ran into max_tokens, and
+one malformed day regenerated the whole trip. plan_by_day() instead runs
+one single-day crew per day on a shared worker pool, all at once. Each day's
+crew task keeps its own guardrail retries. plan_by_day() then validates each
+day again: the JSON must parse, have items, and use that day's number
+(stray day numbers are repaired locally). A day that still fails is run
+again on its own, up to PLAN_DAY_RETRIES times. The days are merged into one
+add_items payload, dropping non-meal activities that an earlier day already
+has.
+
+If some days still fail, the payload covers the days that succeeded and
+lists the others in "failedDays". With replacementStrategy "replace" the
+client only rewrites the days present, so failed days keep their current
+plan. Days still running when the request deadline passes (ai/deadline.py)
+count as failed, and failed days are not retried past it. When every day
+fails, the first error is raised.
+
+Environment:
+    PLAN_FANOUT           "0" to plan whole trips in one call again (default: on)
+    PLAN_FANOUT_MIN_DAYS  Fewest days that are fanned out (default: 2)
+    PLAN_DAY_RETRIES      Extra attempts for a day that fails (default: 1)
+    PLAN_DAY_WORKERS      Day crews running at once, shared by all requests (default: 8)
+"""
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ai import deadline
+from ai.events import emit
+from ai.itinerary import as_day, normalize_title
+from ai.jsonrepair import extract_action
+from ai.logs import log
+from ai.metrics import inc, span
+
+PLAN_FANOUT = os.environ.get("PLAN_FANOUT", "1").lower() not in ("0", "false", "no")
+PLAN_FANOUT_MIN_DAYS = int(os.environ.get("PLAN_FANOUT_MIN_DAYS", 2))
+PLAN_DAY_RETRIES = max(0, int(os.environ.get("PLAN_DAY_RETRIES", 1)))
+
+# Generic titles every day repeats
+_MEALS = {"breakfast", "brunch", "lunch", "dinner", "snack", "coffee break"}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("PLAN_DAY_WORKERS", 8)), thread_name_prefix="plan-day"
+                )
+    return _executor
+
+
+def should_fan_out(days_count, target_day) -> bool:
+    """Whole-trip PLAN of at least PLAN_FANOUT_MIN_DAYS days (a request for one day runs as is)."""
+    days = as_day(days_count)
+    return PLAN_FANOUT and target_day is None and days is not None and days >= max(2, PLAN_FANOUT_MIN_DAYS)
+
+
+def _day_items(raw: str, day: int) -> list[dict]:
+    """This day's validated items from one crew answer; raises ValueError if unusable."""
+    data, _ = extract_action(str(raw), "add_items")
+    if data is None or data.get("action") != "add_items":
+        raise ValueError(f"day {day}: no add_items JSON in the answer")
+    items = [item for item in data.get("items") or [] if isinstance(item, dict) and item.get("title")]
+    if not items:
+        raise ValueError(f"day {day}: no items")
+    strays = 0
+    for item in items:
+        if as_day(item.get("day")) != day:
+            item["day"] = day
+            strays += 1
+    if strays:
+        inc("ai_plan_day_repairs_total", strays, help="Items whose day number was fixed locally")
+    return items
+
+
+def _run_day(run_day, day: int) -> list[dict]:
+    error = None
+    for attempt in range(PLAN_DAY_RETRIES + 1):
+        if attempt and deadline.expired():
+            break
+        if attempt:
+            inc("ai_plan_day_retries_total", help="Single days re-planned after failing")
+            log("warning", "plan.day_retry", day=day, attempt=attempt, error=str(error))
+        try:
+            items = _day_items(run_day(day), day)
+        except Exception as e:
+            error = e
+            continue
+        emit("plan_day", day=day, items=len(items))
+        return items
+    raise error
+
+
+def _merge(results: dict) -> tuple[list[dict], int]:
+    """Items of all days in day order, each non-meal activity kept only on its first day."""
+    seen, merged, dropped = set(), [], 0
+    for day in sorted(results):
+        for item in results[day]:
+            key = normalize_title(item["title"])
+            if key not in _MEALS:
+                if key in seen:
+                    dropped += 1
+                    continue
+                seen.add(key)
+            merged.append(item)
+    return merged, dropped
+
+
+def plan_by_day(run_day, days_count: int) -> str:
+    """add_items JSON for days 1..days_count, planned concurrently.
+
+    `run_day(day)` runs the single-day crew for `day` and returns its raw answer.
+    """
+    days = list(range(1, days_count + 1))
+    with span("plan_fanout") as timing:
+        # Every day runs in a copy of the request context (request id, timings, event sink)
+        futures = {day: _pool().submit(contextvars.copy_context().run, _run_day, run_day, day) for day in days}
+        results, failed = {}, {}
+        for day, future in futures.items():
+            try:
+                results[day] = future.result(timeout=deadline.remaining())
+            except Exception as e:
+                if not future.done():
+                    # Still running at the deadline; its crew's next LLM call is refused
+                    e = deadline.exceeded("plan_day")
+                failed[day] = e
+                log("error", "plan.day_failed", day=day, error=str(e))
+        # A bounded label; the failed days themselves are in the logs
+        if failed:
+            timing.tag(outcome="partial" if results else "error")
+    if not results:
+        raise failed[days[0]]
+
+    items, dropped = _merge(results)
+    log("info", "plan.fanout", days=days_count, items=len(items), duplicates_dropped=dropped,
+        failed_days=sorted(failed))
+    payload = {"action": "add_items", "replacementStrategy": "replace", "items": items}
+    if failed:
+        payload["failedDays"] = sorted(failed)
+    return json.dumps(payload)
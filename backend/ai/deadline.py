@@ -0,0 +1,175 @@
+"""
+Per-request time budgets.
+
+Every suggestion request runs under a deadline, opened by the handler when
+the request arrives (so time spent waiting for warmup counts). The client
+may send its budget as `timeoutMs` in the body; otherwise the request gets
+the default of its intent (DEADLINE_DEFAULTS), and until the intent is known
+the largest of those defaults. Client budgets are capped at DEADLINE_MAX.
+
+The deadline lives in a context variable, so it follows the request onto
+the crew's threads, the PLAN day crews and batch items. Each stage checks it:
+
+  * intent classification gets at most the ROUTE budget and falls back to the
+    local classifier when it runs out;
+  * every LLM call waits no longer than the time left (ai/hedge.py), and once
+    the deadline has passed the crewai before-call hook refuses new calls, so
+    guardrail retries and tool iterations stop;
+  * web searches and upstream queueing are bounded by the time left;
+  * a PLAN fan-out returns the days that finished, listing the others in
+    "failedDays".
+
+A request cut short this way is answered with what it has: the partial plan,
+or BEST_EFFORT_MESSAGE when there is nothing to show. was_cut() tells
+the handler to flag the response.
+
+Environment:
+    DEADLINE_DEFAULTS  Comma-separated `<INTENT>=seconds`, plus ROUTE for classification
+                       (default: "ROUTE=10,REMOVE=30,MODIFY=30,SUGGEST=60,PLAN=120,GENERAL=150")
+    DEADLINE_MAX       Largest budget a client may ask for, in seconds (default: 300)
+"""
+import contextvars
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from ai.events import emit
+from ai.logs import log
+from ai.metrics import inc
+
+DEADLINE_MAX = float(os.environ.get("DEADLINE_MAX", 300))
+
+
+def _parse_defaults(spec: str) -> dict:
+    defaults = {}
+    for part in spec.split(","):
+        intent, _, seconds = part.partition("=")
+        if intent.strip() and seconds.strip():
+            defaults[intent.strip().upper()] = float(seconds)
+    return defaults
+
+
+DEADLINE_DEFAULTS = _parse_defaults(os.environ.get(
+    "DEADLINE_DEFAULTS", "ROUTE=10,REMOVE=30,MODIFY=30,SUGGEST=60,PLAN=120,GENERAL=150"
+))
+ROUTE_BUDGET = DEADLINE_DEFAULTS.get("ROUTE", 10.0)
+# Before routing a request may still turn out to be the slowest intent
+_UNROUTED = max((s for i, s in DEADLINE_DEFAULTS.items() if i != "ROUTE"), default=DEADLINE_MAX)
+
+BEST_EFFORT_MESSAGE = (
+    "Sorry, I ran out of time working on that. Please try again, "
+    "or ask for something smaller (for example, one day at a time)."
+)
+
+_current = contextvars.ContextVar("ai_deadline", default=None)
+
+# stage -> requests cut short there
+cut_counts = Counter()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out."""
+
+
+class Deadline:
+    """Absolute monotonic deadline; `flags` is shared by the deadlines derived from one request."""
+
+    def __init__(self, started: float, at: float, client_budget: float | None, flags: dict | None):
+        self.started = started
+        self.at = at
+        self.client_budget = client_budget
+        self.flags = flags
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+
+def parse_budget(value) -> float | None:
+    """Seconds from a client's `timeoutMs` (None when absent); raises ValueError if malformed."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError("'timeoutMs' must be a positive number of milliseconds")
+    return min(value / 1000, DEADLINE_MAX)
+
+
+@contextmanager
+def scope(client_budget: float | None = None, started: float | None = None):
+    """Run a request under a deadline of `client_budget` seconds from `started` (default: now)."""
+    started = time.monotonic() if started is None else started
+    budget = _UNROUTED if client_budget is None else client_budget
+    token = _current.set(Deadline(started, started + budget, client_budget, {"cut": None}))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def set_intent(intent: str):
+    """Narrow the current deadline to `intent`'s default (a client's own budget is kept)."""
+    current = _current.get()
+    if current is None or current.client_budget is not None or intent not in DEADLINE_DEFAULTS:
+        return
+    at = min(current.at, current.started + DEADLINE_DEFAULTS[intent])
+    _current.set(Deadline(current.started, at, None, current.flags))
+
+
+@contextmanager
+def limit(seconds: float):
+    """Give this block at most `seconds`; running out here does not flag the request."""
+    current = _current.get()
+    at = time.monotonic() + seconds
+    if current is not None:
+        at = min(at, current.at)
+    token = _current.set(Deadline(time.monotonic(), at, None, None))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left (never negative), or None outside a request."""
+    current = _current.get()
+    return None if current is None else max(0.0, current.remaining())
+
+
+def expired() -> bool:
+    current = _current.get()
+    return current is not None and current.remaining() <= 0
+
+
+def bound(seconds: float) -> float:
+    """`seconds`, shortened to the time left; for timeouts, so never zero."""
+    left = remaining()
+    return seconds if left is None else max(0.001, min(seconds, left))
+
+
+def exceeded(stage: str) -> DeadlineExceeded:
+    """Record that `stage` was cut short by the deadline; returns the exception to raise."""
+    current = _current.get()
+    if current is not None and current.flags is not None and current.flags["cut"] is None:
+        current.flags["cut"] = stage
+        cut_counts[stage] += 1
+        inc("ai_deadline_exceeded_total", help="Requests cut short by their deadline", stage=stage)
+        log("warning", "deadline.exceeded", stage=stage,
+            elapsed_s=round(time.monotonic() - current.started, 2))
+        emit("deadline", stage=stage)
+    return DeadlineExceeded(f"request deadline exceeded during {stage}")
+
+
+def check(stage: str):
+    """Raise DeadlineExceeded if the deadline has already passed."""
+    if expired():
+        raise exceeded(stage)
+
+
+def was_cut() -> bool:
+    """Whether the current request was cut short anywhere (its answer is partial)."""
+    current = _current.get()
+    return current is not None and current.flags is not None and current.flags["cut"] is not None
+
+
+def stats() -> dict:
+    return {"defaults": dict(DEADLINE_DEFAULTS), "cut": dict(cut_counts)}
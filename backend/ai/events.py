@@ -0,0 +1,37 @@
+"""
+Request-scoped progress events.
+
+create_suggestion_crew, its tools and guardrails report progress through
+emit(). The HTTP handler subscribes with event_sink() to stream those events
+to the client while the crew is still running. With no sink installed,
+emit() is a no-op.
+"""
+import contextvars
+import time
+
+from ai.logs import log
+from contextlib import contextmanager
+
+_current_sink = contextvars.ContextVar("ai_event_sink", default=None)
+
+
+def emit(event: str, **data):
+    """Send an event to the sink of the current request, if any."""
+    sink = _current_sink.get()
+    if sink is None:
+        return
+    try:
+        sink({"event": event, "ts": round(time.time(), 3), **data})
+    except Exception as e:
+        # A broken sink (e.g. client went away) must never break the crew
+        log("warning", "events.dropped", event_name=event, error=str(e))
+
+
+@contextmanager
+def event_sink(callback):
+    """Route events emitted inside the block to `callback(event_dict)`."""
+    token = _current_sink.set(callback)
+    try:
+        yield
+    finally:
+        _current_sink.reset(token)
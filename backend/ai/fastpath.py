@@ -0,0 +1,327 @@
+"""
+Deterministic resolvers for simple itinerary edits.
+
+Each resolver returns the exact JSON string its crew path would produce (and
+its guardrail accepts), or None when the request is not a form it handles or
+the match is ambiguous, in which case the caller falls back to the crew.
+"""
+import json
+import re
+
+from ai.itinerary import ItineraryIndex, format_minutes, normalize_title, to_minutes
+
+_FILLER = r"(?:please\s+|can you\s+|could you\s+)?"
+
+# "clear day 2", "empty out day 3", "reset everything on day 1"
+_CLEAR_DAY = re.compile(
+    rf"^{_FILLER}(?:clear|empty|reset|wipe)(?:\s+(?:out|everything|all|the schedule|the plan))*"
+    r"(?:\s+(?:on|for|of|from|in))?\s+day\s*(\d+)$"
+)
+
+# "remove lunch from day 1", "delete the museum", "cancel breakfast and dinner on day 2"
+_REMOVE_TITLES = re.compile(
+    rf"^{_FILLER}(?:remove|delete|cancel|drop|scrap|take out|get rid of)\s+(?:the\s+)?(.+?)"
+    r"(?:\s+(?:from|on|for|in)\s+day\s*(\d+))?$"
+)
+_TITLE_SEPARATORS = re.compile(r"\s*(?:,|\band\b|&)\s*")
+_EVERYTHING = {"everything", "all", "all items", "all activities", "all plans", "it all"}
+
+
+def _normalize_request(query: str) -> str:
+    return " ".join(query.lower().split()).strip(" .!?")
+
+
+def _remove_payload(items: list) -> str:
+    return json.dumps({
+        "action": "remove_items",
+        "items": [{"title": i["title"], "day": int(i["day"])} for i in items],
+    })
+
+
+def resolve_remove(query: str, index: ItineraryIndex) -> str | None:
+    """Resolve "clear day N" and "remove <title> [from day N]" without an LLM."""
+    q = _normalize_request(query)
+
+    match = _CLEAR_DAY.match(q)
+    if match:
+        items = index.items_on(int(match.group(1)))
+        return _remove_payload(items) if items else None
+
+    match = _REMOVE_TITLES.match(q)
+    if not match:
+        return None
+    day = int(match.group(2)) if match.group(2) else None
+    target = match.group(1)
+    if day is not None and normalize_title(target) in _EVERYTHING:
+        items = index.items_on(day)
+        return _remove_payload(items) if items else None
+
+    # Whole phrase first so titles like "Rock and Roll Bar" survive, then "x and y"
+    whole = index.match(target, day)
+    if whole:
+        return _remove_payload(whole)
+    phrases = [p for p in _TITLE_SEPARATORS.split(target) if normalize_title(p)]
+    if len(phrases) < 2:
+        return None
+
+    items, seen = [], set()
+    for phrase in phrases:
+        matched = index.match(phrase, day)
+        if not matched:
+            return None
+        for item in matched:
+            if id(item) not in seen:
+                seen.add(id(item))
+                items.append(item)
+    return _remove_payload(items)
+
+
+# Times: "2pm", "2:30 p.m.", "14:00", "noon", "8 o'clock"; bare hours ("move
+# breakfast to 8:30") are read relative to the item's current start.
+_TIME = r"(?:noon|midday|midnight|\d{1,2}(?::\d{2})?(?:\s*[ap]\.?m\b\.?)?(?:\s*o'?clock)?)"
+_RANGE = rf"(?:from\s+)?{_TIME}\s*(?:-|–|to|until|till)\s*{_TIME}"
+_AMOUNT = r"(?:an?|one|two|three|four|five|six|\d+(?:\.\d+)?)"
+_DURATION = (
+    rf"(?:half an hour|{_AMOUNT}\s*(?:hours?|hrs?|h)(?:\s+(?:and\s+)?(?:a half|\d+\s*(?:minutes?|mins?|m)))?"
+    r"|\d+\s*(?:minutes?|mins?|m))"
+)
+_ITEM = r"(?:the\s+|my\s+|our\s+)?(?P<title>.+?)(?:\s+(?:on|from|in)\s+day\s*(?P<day>\d+))?"
+_VERB = r"(?:move|reschedule|shift|change|push|set|put|bump)"
+
+# "move lunch to 2pm", "reschedule the hike to day 3 at 9am", "move dinner to 7-9pm"
+_MOVE = re.compile(
+    rf"^{_FILLER}{_VERB}\s+{_ITEM}\s+(?:to|at|for)\s+(?:start(?:ing)?\s+(?:at\s+)?)?"
+    rf"(?:day\s*(?P<to_day>\d+)(?:\s+(?:at|from)\s+(?P<day_time>{_RANGE}|{_TIME}))?"
+    rf"|(?P<time>{_RANGE}|{_TIME})(?:\s+on\s+day\s*(?P<time_day>\d+))?)$",
+    re.I,
+)
+# "push dinner back an hour", "delay lunch by 30 min", "bring breakfast forward half an hour"
+_SHIFT = re.compile(
+    rf"^{_FILLER}(?P<verb>push|move|shift|bump|bring|pull|delay|postpone)\s+(?:(?P<lead>back|forward|up)\s+)?"
+    rf"{_ITEM}(?:\s+(?P<dir>back|later|forward|earlier|up))?\s+(?:by\s+)?(?P<amount>{_DURATION})"
+    r"(?:\s+(?P<tail>later|earlier))?(?:\s+on\s+day\s*(?P<tail_day>\d+))?$",
+    re.I,
+)
+# "extend the hike by an hour", "shorten lunch by 15 minutes"
+_RESIZE = re.compile(
+    rf"^{_FILLER}(?P<verb>extend|lengthen|shorten|cut)\s+{_ITEM}\s+by\s+(?P<amount>{_DURATION})$",
+    re.I,
+)
+# "rename lunch to Seafood Lunch", "change the name of the hike to Sunrise Trek"
+_RENAME = re.compile(
+    rf"^{_FILLER}(?:rename|retitle|change the (?:name|title) of)\s+{_ITEM}\s+(?:to|as)\s+(?P<new_title>.+)$",
+    re.I,
+)
+_TITLE_NOISE = re.compile(r"^(?:the )?(?:time|timing|start|start time) (?:of|for) |(?: start)? (?:time|timing)$")
+
+_LATER = {"back", "later", "delay", "postpone"}
+_EARLIER = {"forward", "earlier", "up"}
+_NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+
+# A bare hour ("to 8") is only trusted when one reading is this close to the item's current start
+_BARE_HOUR_WINDOW = 5 * 60
+
+
+def parse_time(text: str, near: int | None = None) -> int | None:
+    """Minutes since midnight for a spoken time, or None when unsure."""
+    text = text.lower().replace("o'clock", "").replace("oclock", "").strip()
+    if text in ("noon", "midday"):
+        return 12 * 60
+    if text == "midnight":
+        return 0
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?\s*(?:([ap])\.?m\.?)?", text)
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = match.group(3)
+    if minutes > 59:
+        return None
+    if meridiem:
+        if not 1 <= hours <= 12:
+            return None
+        return (hours % 12 + (12 if meridiem == "p" else 0)) * 60 + minutes
+    if hours > 23:
+        return None
+    if hours == 0 or hours >= 13 or (match.group(2) and match.group(1).startswith("0")):
+        return hours * 60 + minutes
+    # "8" / "8:30": morning or evening, whichever is near the current slot
+    if near is None:
+        return None
+    readings = [(hours % 12) * 60 + minutes, (hours % 12 + 12) * 60 + minutes]
+    best = min(readings, key=lambda r: abs(r - near))
+    return best if abs(best - near) <= _BARE_HOUR_WINDOW else None
+
+
+def parse_range(text: str, near: int | None = None) -> tuple[int, int] | None:
+    """(start, end) minutes for "7-9pm", "from 1pm to 2:30pm", or None."""
+    match = re.fullmatch(rf"(?:from\s+)?({_TIME})\s*(?:-|–|to|until|till)\s*({_TIME})", text, re.I)
+    if not match:
+        return None
+    first, second = match.group(1), match.group(2)
+    end = parse_time(second, near)
+    if end is None:
+        return None
+    start = parse_time(first, near)
+    suffix = re.search(r"[ap]\.?m\.?$", second.lower())
+    if suffix and not re.search(r"[ap]\.?m|:|noon|midday|midnight", first.lower()):
+        # "7-9pm": the start shares the end's meridiem unless that puts it after the end
+        same = parse_time(f"{first} {suffix.group(0)}")
+        other = parse_time(f"{first} {'am' if suffix.group(0).startswith('p') else 'pm'}")
+        start = same if same is not None and same < end else other
+    if start is None or start >= end:
+        return None
+    return start, end
+
+
+def parse_duration(text: str) -> int | None:
+    """Minutes for "an hour", "1.5 hours", "2 hours and 30 minutes", "90 min"."""
+    text = text.lower().strip()
+    if text == "half an hour":
+        return 30
+    match = re.fullmatch(
+        rf"({_AMOUNT})\s*(?:hours?|hrs?|h)(?:\s+(?:and\s+)?(a half|(\d+)\s*(?:minutes?|mins?|m)))?", text
+    )
+    if match:
+        amount = _NUMBERS.get(match.group(1))
+        hours = float(match.group(1)) if amount is None else amount
+        extra = 30 if match.group(2) == "a half" else int(match.group(3) or 0)
+        return int(round(hours * 60)) + extra
+    match = re.fullmatch(r"(\d+)\s*(?:minutes?|mins?|m)", text)
+    return int(match.group(1)) if match else None
+
+
+def _item_slot(item: dict) -> tuple[int | None, int | None]:
+    """(start, duration) in minutes, with the duration from the times or item.duration."""
+    start, end = to_minutes(item.get("startTime")), to_minutes(item.get("endTime"))
+    if start is not None and end is not None and end > start:
+        return start, end - start
+    try:
+        duration = int(item.get("duration")) if item.get("duration") is not None else None
+    except (TypeError, ValueError):
+        duration = None
+    return start, duration
+
+
+def _target_item(index: ItineraryIndex, title: str, day: str | None) -> dict | None:
+    """The single item `title` refers to, or None when ambiguous.
+
+    The client applies updates to the first item on that day whose title
+    contains (or is contained in) originalTitle, so overlapping titles on the
+    same day are left to the crew as well.
+    """
+    title = _TITLE_NOISE.sub("", normalize_title(title))
+    matched = index.match(title, int(day) if day else None)
+    if not matched or len(matched) != 1:
+        return None
+    item = matched[0]
+    own = item["title"].lower()
+    for other in index.items_on(int(item["day"])):
+        if other is item:
+            continue
+        other_title = other["title"].lower()
+        if own in other_title or other_title in own:
+            return None
+    return item
+
+
+def _modify_payload(item: dict, **changes) -> str:
+    update = {"originalTitle": item["title"], "day": int(item["day"])}
+    update.update({k: v for k, v in changes.items() if v is not None})
+    return json.dumps({"action": "update_items", "updates": [update]})
+
+
+def _retime(item: dict, start: int | None = None, end: int | None = None, **changes) -> str | None:
+    """Payload moving `item` to start/end, keeping its duration when only the start is given."""
+    if start is not None and end is None:
+        _, duration = _item_slot(item)
+        if duration is not None:
+            end = start + duration
+        elif item.get("endTime"):
+            # An end time we can't keep consistent with the new start
+            return None
+    if (start is not None and start < 0) or (end is not None and end >= 24 * 60):
+        return None
+    return _modify_payload(
+        item,
+        newStartTime=format_minutes(start) if start is not None else None,
+        newEndTime=format_minutes(end) if end is not None else None,
+        **changes,
+    )
+
+
+def resolve_modify(query: str, index: ItineraryIndex, days_count: int | None = None) -> str | None:
+    """Resolve single-item moves, shifts, resizes and renames without an LLM."""
+    q = " ".join(query.split()).strip(" .!?")
+
+    match = _RENAME.match(q)
+    if match:
+        item = _target_item(index, match.group("title"), match.group("day"))
+        new_title = match.group("new_title").strip(" \"'")
+        if not item or not normalize_title(new_title):
+            return None
+        if new_title.islower():
+            new_title = new_title[0].upper() + new_title[1:]
+        return _modify_payload(item, newTitle=new_title)
+
+    match = _RESIZE.match(q)
+    if match:
+        item = _target_item(index, match.group("title"), match.group("day"))
+        amount = parse_duration(match.group("amount"))
+        if not item or not amount:
+            return None
+        start, duration = _item_slot(item)
+        if start is None or duration is None:
+            return None
+        delta = amount if match.group("verb").lower() in ("extend", "lengthen") else -amount
+        if duration + delta <= 0:
+            return None
+        return _retime(item, start, start + duration + delta)
+
+    match = _SHIFT.match(q)
+    if match:
+        directions = {
+            "later" if w in _LATER else "earlier"
+            for w in (match.group("verb").lower(), match.group("lead"), match.group("dir"), match.group("tail"))
+            if w and (w.lower() in _LATER or w.lower() in _EARLIER)
+        }
+        day = match.group("day") or match.group("tail_day")
+        item = _target_item(index, match.group("title"), day) if len(directions) == 1 else None
+        amount = parse_duration(match.group("amount"))
+        if not item or not amount:
+            return None
+        start, duration = _item_slot(item)
+        if start is None:
+            return None
+        start += amount if directions == {"later"} else -amount
+        return _retime(item, start, start + duration if duration is not None else None)
+
+    match = _MOVE.match(q)
+    if not match:
+        return None
+    day, to_day = match.group("day"), match.group("to_day")
+    if match.group("time_day"):
+        # "to 2pm on day 2" names the item's day, unless its day was already given ("lunch on day 1")
+        if day:
+            to_day = match.group("time_day")
+        else:
+            day = match.group("time_day")
+    item = _target_item(index, match.group("title"), day)
+    if not item:
+        return None
+    current, _ = _item_slot(item)
+    new_day = int(to_day) if to_day else None
+    if new_day is not None and (new_day < 1 or (str(days_count).isdigit() and new_day > int(days_count))):
+        return None
+    if new_day == int(item["day"]):
+        new_day = None
+
+    when = match.group("time") or match.group("day_time")
+    if not when:
+        return _modify_payload(item, newDay=new_day) if new_day else None
+    span = parse_range(when, current)
+    if span:
+        return _retime(item, span[0], span[1], newDay=new_day)
+    start = parse_time(when, current)
+    if start is None:
+        return None
+    return _retime(item, start, newDay=new_day)
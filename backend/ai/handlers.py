@@ -1,20 +1,119 @@
 """
 HTTP Request Handlers for AI Suggestions
-Endpoint: POST /api/ai/suggest
+Endpoints: POST /api/ai/suggest, POST /api/ai/suggest/batch
+
+Streaming: send `"stream": true` in the body (or `Accept: application/x-ndjson`)
+to receive newline-delimited JSON events while the crew runs:
+    {"event": "intent", ...}, {"event": "tool_start", ...}, {"event": "tool_end", ...},
+    {"event": "guardrail_retry", ...}, and finally {"event": "result", "success": true, "result": ...}
+
+Batch: {"queries": ["...", {"id": "x", "query": "..."}], "tripContext": {...},
+"chatHistory": [...], "concurrency": 2} answers {"success": true, "results": [...]}
+with one {"id", "query", "intent", "success", "result" | "error"} per query,
+in order (see ai/batch.py).
+
+Identical asks about the same trip that arrive while one is still running
+(same trip id, normalized query and trip-context fingerprint) wait for that
+request's crew instead of starting their own, for at most COALESCE_WAIT
+seconds (default: 180). Its error, if any, is returned to every waiter.
+
+The crew stack is imported by ai/warmup.py in the background, not by this
+module; suggestion requests wait for warmup (up to WARMUP_TIMEOUT) and get a
+503 with Retry-After if it does not finish in time.
+
+Every request runs under a request id (the caller's X-Request-ID header, or a
+new one) that is echoed back in X-Request-ID and stamped on its log records.
+
+Every request also runs under a deadline counted from its arrival: the
+body's "timeoutMs" (single and batch), or the default of its intent (see
+ai/deadline.py). An answer cut short by it is still a 200, with
+"timedOut": true; its result is whatever was ready (a PLAN without some of
+its days) or a short best-effort message.
 """
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-import sys
+import threading
+import time
+import traceback
+
+from ai import deadline, warmup
+from ai.cache import InFlightTimeout, SingleFlight
+from ai.deadline import DeadlineExceeded
+from ai.events import emit, event_sink
+from ai.intent import CONFIDENCE_THRESHOLD, classify_local, normalize_query
+from ai.logs import log, request_scope
+from ai.metrics import inc, observe, register_collector, request_timing, server_timing
+from ai.results import fingerprint, trip_id
+
+COALESCE_WAIT = float(os.environ.get('COALESCE_WAIT', 180))
+
+_in_flight = SingleFlight()
+
 
-# Add the backend directory to the path for local imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+def _coalesce_key(query, trip_context, chat_history):
+    """Trip id, normalized query and a hash of the trip context the answer depends on."""
+    intent, confidence = classify_local(query)
+    # Unsure of the intent: assume the chat matters too (only GENERAL reads it)
+    if confidence < CONFIDENCE_THRESHOLD:
+        intent = 'GENERAL'
+    return (trip_id(trip_context), normalize_query(query), fingerprint(intent, trip_context, chat_history))
 
-from ai.crew import create_suggestion_crew
+
+def coalesced_suggestion(query, trip_context, chat_history):
+    """create_suggestion_crew, shared with an identical request already in flight."""
+    from ai.crew import create_suggestion_crew  # loaded by warmup; kept off this module's import
+
+    def on_follow():
+        inc('ai_coalesced_requests_total', help='Requests answered by an identical in-flight crew')
+        log('info', 'coalesced', query=query, trip_id=trip_id(trip_context))
+        emit('coalesced')
+
+    def lead():
+        # Followers share whether the leader's answer was cut short, not just the answer
+        result = create_suggestion_crew(query, trip_context, chat_history)
+        return result, deadline.was_cut()
+
+    try:
+        result, cut = _in_flight.do(
+            _coalesce_key(query, trip_context, chat_history),
+            lead,
+            timeout=deadline.bound(COALESCE_WAIT),
+            on_follow=on_follow,
+        )
+    except (DeadlineExceeded, InFlightTimeout) as e:
+        if isinstance(e, InFlightTimeout) and not deadline.expired():
+            raise
+        deadline.exceeded("coalesce")  # flags a follower too; the leader keeps its own stage
+        return deadline.BEST_EFFORT_MESSAGE
+    if cut:
+        deadline.exceeded("coalesce")  # a follower's answer is as partial as the leader's
+    return result
+
+
+@register_collector
+def _collect_coalescing():
+    return [('ai_coalesce', {'role': role}, n) for role, n in _in_flight.stats().items()]
 
 
 class handler(BaseHTTPRequestHandler):
+    request_id = None
+
     def do_POST(self):
+        arrived = time.monotonic()
+        with request_scope(self.headers.get('X-Request-ID')) as self.request_id:
+            # Never run a request on a cold stack (ai/warmup.py)
+            if not warmup.wait(warmup.WARMUP_TIMEOUT):
+                log('warning', 'request.not_ready', warmup=warmup.status()['status'])
+                self._send_json(503, {'success': False, 'error': 'AI server is starting up, please retry shortly.'},
+                                extra_headers={'Retry-After': '5'})
+                return
+            if self.path.split('?', 1)[0].rstrip('/').endswith('/batch'):
+                self._handle_batch(arrived)
+            else:
+                self._handle_suggest(arrived)
+
+    def _handle_suggest(self, arrived):
         try:
             # Parse request body
             content_length = int(self.headers.get('Content-Length', 0))
@@ -23,38 +122,158 @@ class handler(BaseHTTPRequestHandler):
             query = body.get('query', '')
             trip_context = body.get('tripContext', {})
             chat_history = body.get('chatHistory', [])  
+            try:
+                budget = deadline.parse_budget(body.get('timeoutMs'))
+            except ValueError as e:
+                self._send_json(400, {'success': False, 'error': str(e)})
+                return
             
-            result = create_suggestion_crew(query, trip_context, chat_history)
+            if body.get('stream') or 'application/x-ndjson' in self.headers.get('Accept', ''):
+                with deadline.scope(budget, started=arrived):
+                    self._stream_suggestion(query, trip_context, chat_history)
+                return
+            
+            started = time.perf_counter()
+            with deadline.scope(budget, started=arrived), request_timing() as timings:
+                result = coalesced_suggestion(query, trip_context, chat_history)
+                timed_out = deadline.was_cut()
+            elapsed = time.perf_counter() - started
+            observe('ai_request_duration_seconds', elapsed,
+                    help='create_suggestion_crew wall time per request', mode='json')
             
             # Send response
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Request-ID', self.request_id)
+            self.send_header('Server-Timing', ', '.join(filter(None, [
+                server_timing(timings), f'total;dur={elapsed * 1000:.1f}'
+            ])))
             self.end_headers()
             
             response = {
                 'success': True,
                 'result': result
             }
+            if timed_out:
+                response['timedOut'] = True
             self.wfile.write(json.dumps(response).encode('utf-8'))
             
+        except InFlightTimeout as e:
+            log('warning', 'request.coalesce_timeout', error=str(e))
+            self._send_json(504, {'success': False, 'error': 'Timed out waiting for an identical request in progress.'})
+
         except Exception as e:
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
+            self.send_header('X-Request-ID', self.request_id)
             self.end_headers()
             
-            import traceback
-            traceback.print_exc()
+            log('error', 'request.failed', error=str(e), traceback=traceback.format_exc())
             error_response = {
                 'success': False,
                 'error': str(e)
             }
             self.wfile.write(json.dumps(error_response).encode('utf-8'))
-    
+
+    def _send_json(self, status, payload, timings=None, elapsed=None, extra_headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('X-Request-ID', self.request_id)
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        if timings is not None:
+            self.send_header('Server-Timing', ', '.join(filter(None, [
+                server_timing(timings), f'total;dur={elapsed * 1000:.1f}'
+            ])))
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode('utf-8'))
+
+    def _handle_batch(self, arrived):
+        """Several queries against one trip: one classification call, items run concurrently."""
+        from ai.batch import parse_items, run_batch
+
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            items = parse_items(body.get('queries'))
+            concurrency = body.get('concurrency')
+            if concurrency is not None and not isinstance(concurrency, int):
+                raise ValueError("'concurrency' must be an integer")
+            budget = deadline.parse_budget(body.get('timeoutMs'))
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {'success': False, 'error': str(e)})
+            return
+
+        try:
+            started = time.perf_counter()
+            # One deadline for the whole batch; items cut short by it fail on their own
+            with deadline.scope(budget, started=arrived), request_timing() as timings:
+                results = run_batch(items, body.get('tripContext', {}), body.get('chatHistory', []), concurrency)
+            elapsed = time.perf_counter() - started
+            observe('ai_request_duration_seconds', elapsed,
+                    help='create_suggestion_crew wall time per request', mode='batch')
+            self._send_json(200, {'success': True, 'results': results}, timings, elapsed)
+        except Exception as e:
+            log('error', 'request.failed', error=str(e), traceback=traceback.format_exc())
+            self._send_json(500, {'success': False, 'error': str(e)})
+
+    def _stream_suggestion(self, query, trip_context, chat_history):
+        """Run the crew while streaming its progress events as NDJSON."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('X-Request-ID', self.request_id)
+        self.end_headers()
+
+        write_lock = threading.Lock()
+        client_gone = False
+
+        def write_event(event):
+            nonlocal client_gone
+            if client_gone:
+                return
+            line = json.dumps(event, default=str).encode('utf-8') + b'\n'
+            with write_lock:
+                try:
+                    self.wfile.write(line)
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Keep running the crew; the final result is simply not delivered
+                    client_gone = True
+
+        started = time.perf_counter()
+        with event_sink(write_event), request_timing() as timings:
+            try:
+                result = coalesced_suggestion(query, trip_context, chat_history)
+                elapsed = time.perf_counter() - started
+                observe('ai_request_duration_seconds', elapsed,
+                        help='create_suggestion_crew wall time per request', mode='stream')
+                final = {'event': 'result', 'success': True, 'result': result}
+                if deadline.was_cut():
+                    final['timedOut'] = True
+                # Headers are long gone; the stage timings travel with the result instead
+                timing = {}
+                for name, seconds in timings:
+                    timing[name] = timing.get(name, 0.0) + seconds
+                final['timing'] = {name: round(seconds * 1000, 1) for name, seconds in timing.items()}
+                write_event(final)
+            except Exception as e:
+                log('error', 'request.failed', error=str(e), traceback=traceback.format_exc())
+                write_event({'event': 'error', 'success': False, 'error': str(e)})
+
     def do_OPTIONS(self):
         """Handle CORS preflight"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Request-ID')
+        self.send_header('Access-Control-Expose-Headers', 'X-Request-ID, Server-Timing')
         self.end_headers()
+
+    def log_message(self, format, *args):
+        """BaseHTTPRequestHandler's access/error lines, as structured records instead of stderr."""
+        log('info', 'http', client=self.address_string(), message=format % args)
@@ -0,0 +1,198 @@
+"""
+Deadline-bounded and hedged LLM calls.
+
+call(send, model) runs one upstream LLM call on a shared pool and waits for
+it no longer than the request has left (ai/deadline.py); past that it raises
+DeadlineExceeded. The call itself is left running, unread, but not for long:
+its HTTP timeout is the time the request had left (ai/clients.py). Calls
+queued on the pool are cancelled instead, and calls still running once
+nobody waits for them (past the deadline, or losing a hedge) are counted as
+abandoned. Both the ChatNVIDIA clients and the crewai agent LLMs go through
+it (ai/clients.py).
+
+With LLM_HEDGE on, a call that is still running after the HEDGE_QUANTILE
+latency recently observed for its model (at least HEDGE_MIN_DELAY seconds)
+gets a duplicate, and the first answer wins. A model needs
+HEDGE_MIN_SAMPLES recent calls before it is hedged, and hedging pauses while
+more than HEDGE_MAX_SHARE of its recent calls were hedged, so a slow upstream
+is not sent twice the load. Duplicates are admitted by the upstream
+scheduler like any other call. A call that fails is not hedged; retries stay
+with crewai and ai/tiers.py.
+
+Environment:
+    LLM_HEDGE          "1" to hedge slow LLM calls (default: off)
+    HEDGE_QUANTILE     Latency quantile after which a duplicate is sent (default: 0.95)
+    HEDGE_MIN_DELAY    Fewest seconds before a duplicate is sent (default: 1.0)
+    HEDGE_MIN_SAMPLES  Recent calls of a model needed before hedging it (default: 20)
+    HEDGE_MAX_SHARE    Largest share of recent calls that may be hedged (default: 0.1)
+    HEDGE_WINDOW       Recent calls per model the quantile is taken over (default: 200)
+    LLM_CALL_WORKERS   Threads running LLM calls, shared by all requests (default: the NIM
+                       rpm limit of UPSTREAM_LIMITS, at least 8; 32 without one)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ai import deadline, upstream
+from ai.logs import log
+from ai.metrics import inc, register_collector
+
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", 0.95))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", 1.0))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_MAX_SHARE = float(os.environ.get("HEDGE_MAX_SHARE", 0.1))
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", 200))
+
+
+def _default_workers() -> int:
+    # At most `rpm` NIM calls start a minute and few run longer, so that many threads hold them all
+    rpm = upstream.LIMITS.get("nim", {}).get("rpm")
+    return max(8, int(rpm)) if rpm else 32
+
+
+LLM_CALL_WORKERS = int(os.environ.get("LLM_CALL_WORKERS", _default_workers()))
+
+_executor = None
+_executor_lock = threading.Lock()
+_lock = threading.Lock()
+_samples = {}  # model -> deque of (seconds, hedged) of recent successful calls
+_abandoned = Counter()  # model -> calls still running that nobody waits for
+
+# (model, outcome) -> count; outcome is calls / hedged / hedge_won / deadline / abandoned
+hedge_counts = Counter()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=LLM_CALL_WORKERS,
+                    thread_name_prefix="llm-call",
+                )
+    return _executor
+
+
+def _record(model: str, seconds: float, hedged: bool):
+    with _lock:
+        samples = _samples.get(model)
+        if samples is None:
+            samples = _samples[model] = deque(maxlen=HEDGE_WINDOW)
+        samples.append((seconds, hedged))
+
+
+def hedge_delay(model: str) -> float | None:
+    """Seconds after which a call to `model` gets a duplicate, or None to not hedge it."""
+    if not LLM_HEDGE:
+        return None
+    with _lock:
+        samples = list(_samples.get(model, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    if sum(hedged for _, hedged in samples) > HEDGE_MAX_SHARE * len(samples):
+        return None
+    latencies = sorted(seconds for seconds, _ in samples)
+    return max(HEDGE_MIN_DELAY, latencies[int(HEDGE_QUANTILE * (len(latencies) - 1))])
+
+
+def _release(model: str):
+    with _lock:
+        _abandoned[model] -= 1
+
+
+def _abandon(model: str, futures):
+    """Stop waiting for `futures`: cancel those not started, count the rest until they finish."""
+    for future in futures:
+        if future.cancel():
+            continue
+        with _lock:
+            _abandoned[model] += 1
+        hedge_counts[(model, "abandoned")] += 1
+        future.add_done_callback(lambda _, model=model: _release(model))
+
+
+def _duplicate(send, on_hedge):
+    if on_hedge is not None:
+        on_hedge()
+    return send()
+
+
+def call(send, model: str, on_hedge=None):
+    """`send()`'s result, bounded by the request deadline and hedged when slow.
+
+    `on_hedge()` runs before a duplicate is sent, for callers whose `send`
+    does not pass the upstream scheduler itself.
+    """
+    left = deadline.remaining()
+    delay = hedge_delay(model)
+    hedge_counts[(model, "calls")] += 1
+    started = time.perf_counter()
+    if left is None and delay is None:
+        # Nothing to bound or hedge (warmup, scripts); the latency still counts
+        result = send()
+        _record(model, time.perf_counter() - started, False)
+        return result
+    if left is not None and left <= 0:
+        raise deadline.exceeded("llm")
+    # Calls run in a copy of the request context (request id, priority, deadline)
+    primary = _pool().submit(contextvars.copy_context().run, send)
+    pending, duplicate, error = {primary}, None, None
+    while True:
+        timeout = deadline.remaining()
+        if delay is not None and duplicate is None:
+            until_hedge = max(0.0, delay - (time.perf_counter() - started))
+            timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            _record(model, time.perf_counter() - started, duplicate is not None)
+            _abandon(model, pending)  # the other of a hedged pair
+            if future is duplicate:
+                hedge_counts[(model, "hedge_won")] += 1
+            return result
+        if not pending:
+            raise error
+        if deadline.expired():
+            hedge_counts[(model, "deadline")] += 1
+            _abandon(model, pending)
+            raise deadline.exceeded("llm")
+        if not done and delay is not None and duplicate is None:
+            hedge_counts[(model, "hedged")] += 1
+            inc("ai_llm_hedged_total", help="LLM calls that got a duplicate after running past the hedge delay",
+                model=model)
+            log("info", "llm.hedge", model=model, after_s=round(time.perf_counter() - started, 2))
+            duplicate = _pool().submit(contextvars.copy_context().run, _duplicate, send, on_hedge)
+            pending.add(duplicate)
+
+
+def stats() -> dict:
+    """Per model: calls bounded or hedged here, duplicates sent and won, deadline cuts, abandoned calls, hedge delay."""
+    models = {}
+    for (model, outcome), n in hedge_counts.items():
+        models.setdefault(model, {})[outcome] = n
+    for model, summary in models.items():
+        summary["hedge_delay_s"] = hedge_delay(model)
+        summary["abandoned_running"] = _abandoned[model]
+    return {"enabled": LLM_HEDGE, "workers": LLM_CALL_WORKERS, "models": models}
+
+
+@register_collector
+def _collect_stats():
+    """Hedging and deadline outcomes, abandoned calls still running and the hedge delay per model, as /metrics gauges."""
+    gauges = [("ai_llm_calls", {"model": model, "outcome": outcome}, n)
+              for (model, outcome), n in hedge_counts.items()]
+    gauges += [("ai_llm_abandoned_running", {"model": model}, n) for model, n in list(_abandoned.items())]
+    for model in list(_samples):
+        delay = hedge_delay(model)
+        if delay is not None:
+            gauges.append(("ai_llm_hedge_delay_seconds", {"model": model}, delay))
+    return gauges
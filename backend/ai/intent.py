@@ -0,0 +1,70 @@
+"""
+Local first-stage intent classifier.
+
+Scores a query against hand-written rules and returns (intent, confidence).
+classify_intent in crew.py only calls the 8B model when the confidence is
+below INTENT_CONFIDENCE_THRESHOLD, and caches every decision by normalized
+query so repeats skip both stages.
+"""
+import os
+import re
+from collections import Counter
+
+from ai.cache import LRUCache
+
+VALID_INTENTS = {"MODIFY", "REMOVE", "SUGGEST", "PLAN", "GENERAL"}
+
+CONFIDENCE_THRESHOLD = float(os.environ.get("INTENT_CONFIDENCE_THRESHOLD", 0.8))
+
+# Normalized query -> intent
+intent_cache = LRUCache(maxsize=int(os.environ.get("INTENT_CACHE_SIZE", 2048)))
+
+# How each routing decision was made: cache / local / llm / fallback
+route_counts = Counter()
+
+# (intent, weight, pattern). An intent scores the highest weight among its matching rules.
+# Anchored "leading verb" rules are strong; bare keywords anywhere are weak.
+_RULES = [
+    ("REMOVE", 0.95, r"^(?:please\s+)?(?:remove|delete|cancel|clear|empty|reset|drop|scrap)\b"),
+    ("REMOVE", 0.9, r"\b(?:get rid of|take out|take off)\b"),
+    ("REMOVE", 0.85, r"\b(?:don'?t|do not) want\b.*\banymore\b"),
+    ("REMOVE", 0.6, r"\b(?:remove|delete|cancel|clear|empty|reset)\b"),
+    ("MODIFY", 0.95, r"^(?:please\s+)?(?:move|reschedule|shift|push|postpone|rename|change|update|swap)\b"),
+    ("MODIFY", 0.6, r"\b(?:move|change|update|shift|reschedule|postpone|rename|earlier|later)\b"),
+    ("SUGGEST", 0.9, r"^(?:please\s+)?(?:suggest|recommend|find|show)\b"),
+    ("SUGGEST", 0.85, r"\b(?:suggestions?|recommendations?|options|ideas|places|spots)\b"),
+    ("SUGGEST", 0.6, r"\b(?:where (?:can|should) we|i want to go|we want to go|any good)\b"),
+    ("PLAN", 0.95, r"\b(?:create|make|plan|generate|build|design)\b.*\b(?:itinerary|trip|schedule)\b"),
+    ("PLAN", 0.9, r"^(?:please\s+)?plan\b"),
+    ("GENERAL", 0.95, r"^(?:hi|hello|hey|thanks|thank you|good (?:morning|afternoon|evening))\b[\s!.]*$"),
+]
+_COMPILED_RULES = [(intent, weight, re.compile(pattern)) for intent, weight, pattern in _RULES]
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and strip surrounding punctuation."""
+    return " ".join(query.lower().split()).strip(" .!?,;:")
+
+
+def classify_local(query: str) -> tuple[str, float]:
+    """Rule-based classification. Returns (intent, confidence in [0, 1])."""
+    q = normalize_query(query)
+    scores = {}
+    for intent, weight, pattern in _COMPILED_RULES:
+        if weight > scores.get(intent, 0.0) and pattern.search(q):
+            scores[intent] = weight
+
+    if not scores:
+        # Same default as the old keyword fallback, but flagged as a guess
+        return "SUGGEST", 0.0
+
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    intent, best = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    # Competing intents (e.g. "change lunch to one of your suggestions") lower confidence
+    return intent, round(best - 0.5 * runner_up, 3)
+
+
+def stats() -> dict:
+    """Cache hit/miss counters plus how many decisions each stage made."""
+    return {**intent_cache.stats(), "routes": dict(route_counts)}
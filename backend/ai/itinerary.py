@@ -0,0 +1,200 @@
+"""
+Lookup structures over tripContext.itinerary for the local (LLM-free) paths
+and for checking LLM answers against the trip (ai/conflicts.py).
+"""
+import bisect
+import re
+from difflib import SequenceMatcher
+
+# Fuzzy title matches below this score, or too close to the runner-up, are ambiguous
+MATCH_THRESHOLD = 0.75
+MATCH_MARGIN = 0.1
+
+
+def normalize_title(title: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.findall(r"[a-z0-9]+", str(title).lower()))
+
+
+def to_minutes(clock) -> int | None:
+    """Minutes since midnight for an "HH:MM" item time, or None."""
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*", str(clock or ""))
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def as_day(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def item_span(item: dict) -> tuple[int, int] | None:
+    """(start, end) minutes of a timed item: endTime, else startTime + duration."""
+    start = to_minutes(item.get("startTime"))
+    if start is None:
+        return None
+    end = to_minutes(item.get("endTime"))
+    if end is None or end <= start:
+        duration = item.get("duration")
+        if not isinstance(duration, int) or isinstance(duration, bool) or duration <= 0:
+            return None
+        end = start + duration
+    return start, end
+
+
+class DaySchedule:
+    """Timed items of one day as intervals sorted by start.
+
+    Alongside the starts it keeps the running maximum of the ends, so
+    overlapping() and free_slot() binary-search to their position and only
+    walk the items they report or skip past. add() and remove() are O(n)
+    (list insert and rebuilding the maxima after it), which at a day's
+    handful of items costs less than a balanced interval tree would.
+    """
+
+    def __init__(self):
+        self._starts = []   # sorted
+        self._spans = []    # (start, end, item), same order
+        self._max_end = []  # max end of _spans[:i + 1]
+
+    def __len__(self):
+        return len(self._spans)
+
+    def copy(self) -> "DaySchedule":
+        other = DaySchedule()
+        other._starts, other._spans, other._max_end = list(self._starts), list(self._spans), list(self._max_end)
+        return other
+
+    def _reindex(self, i: int):
+        running = self._max_end[i - 1] if i else -1
+        del self._max_end[i:]
+        for _, end, _ in self._spans[i:]:
+            running = max(running, end)
+            self._max_end.append(running)
+
+    def add(self, start: int, end: int, item: dict):
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._spans.insert(i, (start, end, item))
+        self._reindex(i)
+
+    def remove(self, item: dict) -> bool:
+        """Drop `item` (by identity); False if it is not scheduled here."""
+        for i, (_, _, other) in enumerate(self._spans):
+            if other is item:
+                del self._starts[i], self._spans[i]
+                self._reindex(i)
+                return True
+        return False
+
+    def overlapping(self, start: int, end: int) -> list:
+        """Items whose interval overlaps [start, end), latest start first."""
+        found = []
+        i = bisect.bisect_left(self._starts, end) - 1
+        while i >= 0 and self._max_end[i] > start:
+            s, e, item = self._spans[i]
+            if e > start:
+                found.append(item)
+            i -= 1
+        return found
+
+    def free_slot(self, duration: int, not_before: int, day_end: int = 24 * 60) -> int | None:
+        """Earliest start at or after `not_before` for `duration` free minutes ending by `day_end`."""
+        i = bisect.bisect_right(self._starts, not_before)
+        candidate = max(not_before, self._max_end[i - 1]) if i else not_before
+        while candidate + duration <= day_end:
+            if i == len(self._starts) or self._starts[i] >= candidate + duration:
+                return candidate
+            candidate = max(candidate, self._max_end[i])
+            i += 1
+        return None
+
+
+class ItineraryIndex:
+    """Itinerary items grouped by day and by normalized title, with each day's timed items as intervals."""
+
+    def __init__(self, itinerary: list, days_count: int | None = None):
+        self.days_count = days_count
+        self.by_day = {}    # day -> [item, ...] in itinerary order
+        self.by_title = {}  # normalized title -> [item, ...]
+        self._schedules = {}  # day -> DaySchedule
+        for item in itinerary or []:
+            day = as_day(item.get("day"))
+            if day is None or not item.get("title"):
+                continue
+            self.by_day.setdefault(day, []).append(item)
+            self.by_title.setdefault(normalize_title(item["title"]), []).append(item)
+            span = item_span(item)
+            if span is not None:
+                self._schedules.setdefault(day, DaySchedule()).add(*span, item)
+
+    @classmethod
+    def from_trip(cls, trip_context: dict) -> "ItineraryIndex":
+        settings = trip_context.get("settings") or {}
+        return cls(trip_context.get("itinerary") or [], as_day(settings.get("daysCount")))
+
+    def has_day(self, day) -> bool:
+        """Whether `day` is a day of the trip (any positive day when daysCount is unknown)."""
+        day = as_day(day)
+        return day is not None and day >= 1 and (self.days_count is None or day <= self.days_count)
+
+    def items_on(self, day: int) -> list:
+        return self.by_day.get(day, [])
+
+    def schedule(self, day: int) -> DaySchedule:
+        """A copy of `day`'s intervals that the caller may change."""
+        schedule = self._schedules.get(day)
+        return schedule.copy() if schedule is not None else DaySchedule()
+
+    def match(self, phrase: str, day: int | None = None) -> list | None:
+        """Items whose title matches `phrase` (optionally on `day`).
+
+        Exact normalized matches win; otherwise the single best fuzzy match is
+        returned. Returns None when nothing matches or the match is ambiguous.
+        """
+        wanted = normalize_title(phrase)
+        if not wanted:
+            return None
+
+        exact = [i for i in self.by_title.get(wanted, []) if day is None or as_day(i["day"]) == day]
+        if exact:
+            # Same title on several days without a day in the request is ambiguous
+            days = {as_day(i["day"]) for i in exact}
+            return exact if len(days) == 1 else None
+
+        candidates = self.items_on(day) if day is not None else [i for items in self.by_day.values() for i in items]
+        scored = sorted(
+            ((_title_score(wanted, normalize_title(i["title"])), idx, i) for idx, i in enumerate(candidates)),
+            key=lambda s: (s[0], -s[1]),
+            reverse=True,
+        )
+        if not scored or scored[0][0] < MATCH_THRESHOLD:
+            return None
+        best_score, _, best = scored[0]
+        best_title = normalize_title(best["title"])
+        same = [i for _, _, i in scored if normalize_title(i["title"]) == best_title]
+        others = [entry for entry in scored if normalize_title(entry[2]["title"]) != best_title]
+        if others and best_score - others[0][0] < MATCH_MARGIN:
+            return None
+        if len({as_day(i["day"]) for i in same}) > 1:
+            return None
+        return same
+
+
+def _title_score(wanted: str, title: str) -> float:
+    ratio = SequenceMatcher(None, wanted, title).ratio()
+    wanted_words, title_words = set(wanted.split()), set(title.split())
+    if wanted_words and wanted_words <= title_words:
+        # "museum" -> "National Museum Visit"
+        ratio = max(ratio, 0.9)
+    return ratio
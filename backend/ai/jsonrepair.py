@@ -0,0 +1,219 @@
+"""
+Tolerant extraction of JSON actions from agent output.
+
+Agents often wrap their JSON in prose or code fences, emit a second block
+(e.g. a draft followed by the final answer), or make small syntax slips.
+Each of those used to cost a full guardrail retry. Here every top-level
+object is decoded in turn (json.JSONDecoder.raw_decode), common defects are
+repaired locally, and the object carrying the expected "action" is chosen.
+"""
+import json
+import math
+import re
+
+_decoder = json.JSONDecoder()
+
+# Fields the client treats as integers
+_NUMERIC_FIELDS = ("day", "duration", "newDay")
+_NUMERIC_STRING = re.compile(
+    r"^\s*(?:day\s*)?(\d+(?:\.\d+)?|\.\d+)\s*"
+    r"(?:min(?:ute)?s?|m|(hours?|hrs?|h)(?:\s*(?:and\s+)?(\d+)\s*(?:min(?:ute)?s?|m))?)?\s*$",
+    re.I,
+)
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _scan(text: str, start: int) -> tuple[int, list]:
+    """Walk a JSON-ish value from `start`.
+
+    Returns (end, open_brackets): the index just past the balanced value, or
+    len(text) with the brackets still open when the value is truncated.
+    Strings in either quote style are skipped.
+    """
+    stack, quote, i = [], None, start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in _CLOSERS:
+            stack.append(ch)
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                return i, stack
+            stack.pop()
+            if not stack:
+                return i + 1, stack
+        i += 1
+    return i, stack
+
+
+def _normalize_tokens(text: str, repairs: set) -> str:
+    """Single-quoted strings -> double-quoted, and drop trailing commas."""
+    out, i, quote = [], 0, None
+    while i < len(text):
+        ch = text[i]
+        if quote == '"':
+            out.append(ch)
+            if ch == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif ch == '"':
+                quote = None
+        elif quote == "'":
+            if ch == "\\" and i + 1 < len(text):
+                nxt = text[i + 1]
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 1
+            elif ch == "'":
+                out.append('"')
+                quote = None
+            else:
+                out.append('\\"' if ch == '"' else ch)
+        elif ch == '"':
+            out.append(ch)
+            quote = ch
+        elif ch == "'":
+            out.append('"')
+            quote = ch
+            repairs.add("single_quotes")
+        elif ch == ",":
+            j = i + 1
+            while j < len(text) and text[j].isspace():
+                j += 1
+            if j < len(text) and text[j] in "}]":
+                repairs.add("trailing_comma")
+            else:
+                out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _loads(text: str, repairs: set) -> object | None:
+    found = set()
+    try:
+        data = json.loads(_normalize_tokens(text, found))
+    except json.JSONDecodeError:
+        return None
+    repairs |= found
+    return data
+
+
+def _close(body: str) -> str:
+    _, stack = _scan(body, 0)
+    return body.rstrip().rstrip(",") + "".join(_CLOSERS[b] for b in reversed(stack))
+
+
+def repair_json(candidate: str, repairs: set | None = None) -> object | None:
+    """Parse `candidate` after fixing quotes, trailing commas and unclosed brackets."""
+    repairs = set() if repairs is None else repairs
+    end, stack = _scan(candidate, 0)
+    if not stack:
+        return _loads(candidate[:end], repairs)
+
+    # Truncated: close what is still open, first as-is, then without trailing
+    # prose (cut after the last bracket), then without a partial last member
+    body = candidate[:end].rstrip().rstrip("`").rstrip()
+    last_bracket = max(body.rfind("}"), body.rfind("]"))
+    attempts = [body]
+    if last_bracket > 0:
+        attempts.append(body[:last_bracket + 1])
+    if body.rfind(",") > 0:
+        attempts.append(body[:body.rfind(",")])
+    for attempt in attempts:
+        data = _loads(_close(attempt), repairs)
+        if data is not None:
+            repairs.add("unclosed")
+            return data
+    return None
+
+
+def iter_json_objects(raw: str):
+    """Yield (obj, repairs) for every top-level JSON object in `raw`, in order."""
+    for obj, repairs, _, _ in iter_json_spans(raw):
+        yield obj, repairs
+
+
+def iter_json_spans(raw: str):
+    """iter_json_objects(), with each object's (start, end) offsets in `raw`."""
+    pos = raw.find("{")
+    while pos != -1:
+        try:
+            obj, end = _decoder.raw_decode(raw, pos)
+            repairs = set()
+        except json.JSONDecodeError:
+            end, _ = _scan(raw, pos)
+            repairs = set()
+            obj = repair_json(raw[pos:end], repairs)
+            if obj is None:
+                # Not an object we can salvage; nested ones are tried next
+                pos = raw.find("{", pos + 1)
+                continue
+        if isinstance(obj, dict):
+            yield obj, repairs, pos, end
+        pos = raw.find("{", max(end, pos + 1))
+
+
+def _whole_number(key: str, value) -> int | None:
+    """`value` of numeric field `key` as an int (durations rounded to whole minutes), or None."""
+    if isinstance(value, float):
+        amount = value
+    else:
+        match = _NUMERIC_STRING.match(value)
+        if not match:
+            return None
+        amount = float(match.group(1))
+        if match.group(2):
+            if key != "duration":
+                return None
+            amount = amount * 60 + int(match.group(3) or 0)
+    if not math.isfinite(amount) or amount < 0:
+        return None
+    if key != "duration" and not amount.is_integer():
+        return None  # "day": 2.5 is no day to round to
+    return int(amount + 0.5)
+
+
+def _coerce_numbers(value, repairs: set):
+    """Turn "2", "Day 2", "90.0", "90 mins" or "1.5 hours" into ints for the client's numeric fields."""
+    if isinstance(value, list):
+        for v in value:
+            _coerce_numbers(v, repairs)
+    elif isinstance(value, dict):
+        for key, v in value.items():
+            if key in _NUMERIC_FIELDS and isinstance(v, (str, float)):
+                number = _whole_number(key, v)
+                if number is not None:
+                    value[key] = number
+                    repairs.add("numeric_fields")
+            else:
+                _coerce_numbers(v, repairs)
+
+
+def extract_action(raw: str, action: str) -> tuple[dict | None, set]:
+    """The object whose "action" is `action` (else the first object with any action).
+
+    When several objects carry `action`, the last one wins: agents that emit
+    two blocks are correcting a draft.
+
+    Returns (data, repairs), where `repairs` names every local fix applied,
+    including "selected" when `raw` held several objects to choose from.
+    Returns (None, set()) when nothing parseable is found.
+    """
+    found = list(iter_json_objects(raw or ""))
+    with_action = [(obj, repairs) for obj, repairs in found if "action" in obj]
+    matching = [entry for entry in with_action if entry[0].get("action") == action]
+    chosen = (matching or with_action or [(None, set())])[-1 if len(matching) > 1 else 0]
+    data, repairs = chosen
+    if data is None:
+        return None, set()
+    if len(found) > 1:
+        repairs.add("selected")
+    _coerce_numbers(data, repairs)
+    return data, repairs
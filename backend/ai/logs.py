@@ -0,0 +1,256 @@
+"""
+Structured JSON-lines logging, written off the request thread.
+
+log(level, event, **fields) stamps a record with the time and the current
+request id and appends it to a bounded ring buffer. A background thread drains
+the buffer to stdout or a size-rotated file. When the writer falls behind, the
+oldest records are dropped (and counted) instead of blocking the request.
+Debug records are sampled per request, so a sampled request keeps its whole
+trace.
+
+Environment:
+    LOG_LEVEL      Minimum level written: debug/info/warning/error (default: info)
+    LOG_SAMPLE     Keep ratio per level, e.g. "debug=0.1,info=1" (default: debug=0.1)
+    LOG_FILE       JSON-lines file, or "-" for stdout (default: -)
+    LOG_MAX_BYTES  Rotate LOG_FILE once it reaches this size (default: 10 MB)
+    LOG_BACKUPS    Rotated files kept as LOG_FILE.1 ... LOG_FILE.N (default: 5)
+    LOG_BUFFER     Records buffered for the writer (default: 10000)
+    LOG_PREVIEW    Characters kept from long values such as crew output (default: 500)
+    CREW_VERBOSE   "1" to also print crewai's console panels (default: off)
+"""
+import atexit
+import contextvars
+import datetime
+import json
+import os
+import sys
+import threading
+import uuid
+import zlib
+from collections import Counter, deque
+from contextlib import contextmanager
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+LOG_LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "info").lower(), LEVELS["info"])
+LOG_FILE = os.environ.get("LOG_FILE", "-")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get("LOG_BACKUPS", 5))
+LOG_BUFFER = int(os.environ.get("LOG_BUFFER", 10000))
+LOG_PREVIEW = int(os.environ.get("LOG_PREVIEW", 500))
+CREW_VERBOSE = os.environ.get("CREW_VERBOSE", "").lower() in ("1", "true", "yes")
+
+
+def _parse_sample(spec: str) -> dict:
+    rates = {"debug": 0.1}
+    for part in spec.split(","):
+        level, _, rate = part.partition("=")
+        if level.strip().lower() in LEVELS and rate.strip():
+            rates[level.strip().lower()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+SAMPLE_RATES = _parse_sample(os.environ.get("LOG_SAMPLE", ""))
+
+_request_id = contextvars.ContextVar("ai_request_id", default=None)
+_worker = None  # pre-fork worker slot, stamped on records when set
+
+# written / dropped (buffer full) / sampled_out / write_errors
+log_counts = Counter()
+
+
+# ═══════════════════════════════════════════════════════════════
+# REQUEST IDS
+# ═══════════════════════════════════════════════════════════════
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> str | None:
+    return _request_id.get()
+
+
+@contextmanager
+def request_scope(request_id: str | None = None):
+    """Tag every record logged inside the block with one request id.
+
+    Nested scopes keep the outer id unless a new one is passed explicitly.
+    """
+    rid = (request_id or "").strip()[:64] or _request_id.get() or new_request_id()
+    token = _request_id.set(rid)
+    try:
+        yield rid
+    finally:
+        _request_id.reset(token)
+
+
+# ═══════════════════════════════════════════════════════════════
+# WRITER
+# ═══════════════════════════════════════════════════════════════
+
+class _RotatingFile:
+    """Append-only file rotated to path.1 .. path.N once it reaches max_bytes."""
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def write(self, text: str):
+        if self.max_bytes and self.size and self.size + len(text) > self.max_bytes:
+            self._rotate()
+        self.file.write(text)
+        self.size += len(text)
+
+    def flush(self):
+        self.file.flush()
+
+
+class _Writer:
+    """Ring buffer drained by one daemon thread."""
+
+    def __init__(self, maxlen: int):
+        self._buffer = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stream = None
+        self._pending = 0  # records appended but not yet written
+
+    def put(self, record: dict):
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                log_counts["dropped"] += 1
+                self._pending -= 1
+            self._buffer.append(record)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _target(self):
+        if LOG_FILE in ("", "-"):
+            return sys.stdout  # looked up per batch so redirection is honoured
+        if self._stream is None:
+            self._stream = _RotatingFile(LOG_FILE, LOG_MAX_BYTES, LOG_BACKUPS)
+        return self._stream
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer:
+                    self._cond.wait()
+                batch = list(self._buffer)
+                self._buffer.clear()
+            try:
+                stream = self._target()
+                for record in batch:
+                    stream.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+                stream.flush()
+                log_counts["written"] += len(batch)
+            except Exception:
+                log_counts["write_errors"] += len(batch)
+            with self._cond:
+                self._pending -= len(batch)
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything logged so far is written."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending <= 0, timeout=timeout)
+
+    def reset_after_fork(self):
+        # The writer thread does not survive fork(); the parent's queued records stay with the parent
+        self._buffer = deque(maxlen=self._buffer.maxlen)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stream = None
+        self._pending = 0
+
+
+_writer = _Writer(LOG_BUFFER)
+atexit.register(_writer.flush, 2.0)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_writer.reset_after_fork)
+
+
+# ═══════════════════════════════════════════════════════════════
+# API
+# ═══════════════════════════════════════════════════════════════
+
+def _sampled(level: str, rid: str | None) -> bool:
+    rate = SAMPLE_RATES.get(level, 1.0)
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    # Same decision for every record of a request, so its trace stays whole
+    seed = rid or uuid.uuid4().hex
+    return zlib.crc32(f"{level}:{seed}".encode()) / 0xFFFFFFFF < rate
+
+
+def enabled(level: str) -> bool:
+    """Cheap pre-check for callers that would build expensive fields."""
+    return LEVELS.get(level, 20) >= LOG_LEVEL
+
+
+def log(level: str, event: str, **fields):
+    """Queue one structured record; never blocks on I/O."""
+    if not enabled(level):
+        return
+    rid = _request_id.get()
+    if not _sampled(level, rid):
+        log_counts["sampled_out"] += 1
+        return
+    record = {
+        "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+        "level": level,
+        "event": event,
+    }
+    if rid:
+        record["request_id"] = rid
+    if _worker is not None:
+        record["worker"] = _worker
+    record.update(fields)
+    _writer.put(record)
+
+
+def preview(value, limit: int = None) -> str:
+    """`value` as a string cut to LOG_PREVIEW characters."""
+    text = value if isinstance(value, str) else str(value)
+    limit = LOG_PREVIEW if limit is None else limit
+    return text if len(text) <= limit else f"{text[:limit]}… (+{len(text) - limit} chars)"
+
+
+def set_worker(slot: int):
+    """Tag this process's records with its pre-fork worker slot (see server.py)."""
+    global _worker
+    _worker = slot
+    log_counts.clear()
+
+
+def flush(timeout: float = 5.0) -> bool:
+    return _writer.flush(timeout)
+
+
+def stats() -> dict:
+    return {name: log_counts[name] for name in ("written", "dropped", "sampled_out", "write_errors")}
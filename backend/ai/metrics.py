@@ -0,0 +1,161 @@
+"""
+Latency spans, counters and histograms for the AI server.
+
+Code under a request wraps each stage in span("stage", **labels). Every span
+is observed into the ai_stage_duration_seconds histogram (rendered in the
+Prometheus text format by render() for the /metrics route) and, when the
+handler opened request_timing(), recorded for that request's Server-Timing
+header. Cache and routing stats from the other modules are exported as
+gauges through register_collector().
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from ai.logs import log
+
+# Seconds; LLM-bound stages run from ~100 ms to a couple of minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_histograms = {}   # name -> {label tuple: [bucket counts..., sum, count]}
+_counters = {}     # name -> {label tuple: value}
+_help = {}
+_collectors = []   # callables returning [(name, labels, value), ...]
+_timings = contextvars.ContextVar("ai_request_timings", default=None)
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def observe(name: str, seconds: float, help: str = "", **labels):
+    """Add one observation to histogram `name`."""
+    key = _key(labels)
+    with _lock:
+        _help.setdefault(name, help)
+        series = _histograms.setdefault(name, {})
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+def inc(name: str, amount: float = 1, help: str = "", **labels):
+    """Increase counter `name`."""
+    key = _key(labels)
+    with _lock:
+        _help.setdefault(name, help)
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def register_collector(fn):
+    """`fn()` -> [(metric name, labels dict, value), ...], read on every render()."""
+    _collectors.append(fn)
+    return fn
+
+
+class Span:
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.seconds = 0.0
+
+    def tag(self, **labels):
+        """Add labels known only once the stage has run (e.g. the intent)."""
+        self.labels.update(labels)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a stage; recorded in ai_stage_duration_seconds and the request's Server-Timing."""
+    current = Span(name, labels)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception:
+        current.labels.setdefault("outcome", "error")
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        observe("ai_stage_duration_seconds", current.seconds,
+                help="Wall time of each create_suggestion_crew stage", stage=name, **current.labels)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, current.seconds))
+
+
+@contextmanager
+def request_timing():
+    """Collect the spans of one request; yields the list of (stage, seconds)."""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def server_timing(timings: list) -> str:
+    """Server-Timing header value: total milliseconds per stage, in first-seen order."""
+    totals, counts = {}, {}
+    for name, seconds in list(timings):
+        totals[name] = totals.get(name, 0.0) + seconds
+        counts[name] = counts.get(name, 0) + 1
+    return ", ".join(
+        f"{name};dur={totals[name] * 1000:.1f}" + (f';desc="x{counts[name]}"' if counts[name] > 1 else "")
+        for name in totals
+    )
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        histograms = {name: {k: list(v) for k, v in series.items()} for name, series in _histograms.items()}
+        counters = {name: dict(series) for name, series in _counters.items()}
+        helps = dict(_help)
+
+    for name, series in sorted(histograms.items()):
+        lines += [f"# HELP {name} {helps.get(name) or name}", f"# TYPE {name} histogram"]
+        for key, values in sorted(series.items()):
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                lines.append(f"{name}_bucket{_labels_text(key, (('le', bound),))} {values[i]}")
+            lines.append(f"{name}_bucket{_labels_text(key, (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{_labels_text(key)} {values[-2]:.6f}")
+            lines.append(f"{name}_count{_labels_text(key)} {values[-1]}")
+
+    for name, series in sorted(counters.items()):
+        lines += [f"# HELP {name} {helps.get(name) or name}", f"# TYPE {name} counter"]
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{_labels_text(key)} {value}")
+
+    gauges = {}
+    for collect in list(_collectors):
+        try:
+            for name, labels, value in collect():
+                gauges.setdefault(name, []).append((_key(labels), value))
+        except Exception as e:
+            log("error", "metrics.collector_failed", collector=getattr(collect, "__name__", str(collect)), error=str(e))
+    for name, series in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in series:
+            lines.append(f"{name}{_labels_text(key)} {value}")
+    return "\n".join(lines) + "\n"
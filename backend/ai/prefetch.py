@@ -0,0 +1,133 @@
+"""
+Speculative Serper prefetch (opt-in with SPECULATIVE_SEARCH=1).
+
+create_suggestion_crew starts a destination-scoped search for the query on a
+background thread before the intent is classified. If the request turns out
+to be SUGGEST, the first fast_search_tool call of that request takes the
+prefetched result instead of starting its own lookup, provided it searches
+the same query (compared as search cache keys). A first search for anything
+else is a miss and runs its own lookup; otherwise the prefetch is cancelled
+(or, if already running, its result is discarded — it still lands in the
+search cache). stats() reports how often the speculation paid off.
+
+Environment:
+    SPECULATIVE_SEARCH  "1" to enable (default: off)
+    PREFETCH_WORKERS    Background search threads (default: 4)
+"""
+import contextvars
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from ai import deadline
+from ai.clients import SERPER_TIMEOUT
+from ai.intent import CONFIDENCE_THRESHOLD, classify_local
+from ai.logs import log
+from ai.search import cached_search, normalize_search_query
+
+SPECULATIVE_SEARCH = os.environ.get("SPECULATIVE_SEARCH", "").lower() in ("1", "true", "yes")
+
+_executor = None
+_executor_lock = threading.Lock()
+_current = contextvars.ContextVar("search_prefetch", default=None)
+
+# started / hit / miss / wasted / cancelled / failed
+prefetch_counts = Counter()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("PREFETCH_WORKERS", 4)), thread_name_prefix="prefetch"
+                )
+    return _executor
+
+
+class Prefetch:
+    """One in-flight speculative search; consumed at most once."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.future = _pool().submit(cached_search, query)
+        self._lock = threading.Lock()
+        self._done = False
+        prefetch_counts["started"] += 1
+
+    def take(self, query: str) -> str | None:
+        """The prefetched result if `query` is the prefetched search, else None (also once used or failed)."""
+        with self._lock:
+            if self._done:
+                return None
+            self._done = True
+        if normalize_search_query(query) != normalize_search_query(self.query):
+            self.future.cancel()
+            prefetch_counts["miss"] += 1
+            log("info", "prefetch.miss", query=query, prefetched=self.query)
+            return None
+        try:
+            result = self.future.result(timeout=deadline.bound(SERPER_TIMEOUT))
+        except Exception as e:
+            prefetch_counts["failed"] += 1
+            log("warning", "prefetch.failed", query=self.query, error=str(e))
+            return None
+        prefetch_counts["hit"] += 1
+        return result
+
+    def discard(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        prefetch_counts["cancelled" if self.future.cancel() else "wasted"] += 1
+
+
+def search_query(user_query: str, trip_context: dict) -> str:
+    """The query scoped to the trip's destination, as the suggest agent would search it."""
+    destination = (trip_context.get("settings", {}) or {}).get("destination") or ""
+    if destination and destination.lower() not in user_query.lower():
+        return f"{user_query} {destination}"
+    return user_query
+
+
+def start(user_query: str, trip_context: dict) -> Prefetch | None:
+    """Start a speculative search unless disabled or the query is clearly not a SUGGEST."""
+    if not SPECULATIVE_SEARCH:
+        return None
+    intent, confidence = classify_local(user_query)
+    if intent != "SUGGEST" and confidence >= CONFIDENCE_THRESHOLD:
+        return None
+    return Prefetch(search_query(user_query, trip_context))
+
+
+@contextmanager
+def use(prefetch: Prefetch | None):
+    """Offer `prefetch` to the first search of the block; discard it if unused."""
+    token = _current.set(prefetch)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        if prefetch is not None:
+            prefetch.discard()
+
+
+def take(query: str) -> str | None:
+    """For fast_search_tool: the current request's prefetched result for `query`, once."""
+    prefetch = _current.get()
+    return prefetch.take(query) if prefetch is not None else None
+
+
+def stats() -> dict:
+    started = prefetch_counts["started"]
+    return {
+        **{name: prefetch_counts[name] for name in ("started", "hit", "miss", "wasted", "cancelled", "failed")},
+        "hit_rate": round(prefetch_counts["hit"] / started, 3) if started else 0.0,
+        "waste_rate": round(
+            (prefetch_counts["miss"] + prefetch_counts["wasted"] + prefetch_counts["cancelled"]) / started, 3
+        ) if started else 0.0,
+    }
@@ -0,0 +1,118 @@
+"""
+Response cache in front of create_suggestion_crew.
+
+Entries are keyed by the classified intent, the normalized query and a hash
+of the trip slices the crews read (settings, preferences, itinerary, and the
+chat for GENERAL), so a repeated ask against an unchanged trip returns the
+previous answer without running a crew. When a trip's itinerary hash changes,
+every entry cached for that trip is dropped. Each trip's set of keys loses
+the ones the cache evicts, and the trip goes once it has none left.
+
+Environment:
+    RESULT_CACHE_SIZE  Entries kept before LRU eviction (default: 512)
+    RESULT_CACHE_TTL   Seconds an answer stays fresh (default: 900)
+"""
+import hashlib
+import json
+import os
+import threading
+
+from ai.cache import LRUCache
+from ai.intent import normalize_query
+
+
+def _digest(value) -> str:
+    blob = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def trip_id(trip_context: dict) -> str:
+    return str(trip_context.get("_id") or trip_context.get("id") or "")
+
+
+def itinerary_hash(trip_context: dict) -> str:
+    return _digest(trip_context.get("itinerary", []) or [])
+
+
+def fingerprint(intent: str, trip_context: dict, chat_history: list) -> str:
+    """Stable hash of the tripContext slices a crew for `intent` reads."""
+    slices = {
+        "settings": trip_context.get("settings", {}),
+        "preferences": trip_context.get("preferences", {}),
+        "itinerary": itinerary_hash(trip_context),
+    }
+    if intent == "GENERAL":
+        # Only the general crew reads the group chat
+        slices["chat"] = [(m.get("senderName"), m.get("content")) for m in chat_history or []]
+    return _digest(slices)
+
+
+class ResultCache:
+    """LRU+TTL cache of crew answers, invalidated per trip on itinerary changes."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 900):
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl, on_evict=self._evicted)  # key -> (trip id, result)
+        self._trips = LRUCache(maxsize=maxsize)  # trip id -> (itinerary hash, {keys})
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def key(self, intent: str, query: str, trip_context: dict, chat_history: list) -> tuple:
+        return (intent, normalize_query(query), fingerprint(intent, trip_context, chat_history))
+
+    def _sync_trip(self, trip_context: dict) -> set | None:
+        """Key set for this trip, emptied first if its itinerary changed."""
+        tid = trip_id(trip_context)
+        if not tid:
+            return None
+        current = itinerary_hash(trip_context)
+        with self._lock:
+            state = self._trips.get(tid)
+            if state is None or state[0] != current:
+                if state is not None:
+                    for key in state[1]:
+                        self._entries.pop(key)
+                    self.invalidations += 1
+                state = (current, set())
+                self._trips.set(tid, state)
+            return state[1]
+
+    def _evicted(self, key: tuple, entry: tuple):
+        """LRU or TTL eviction: forget `key` in its trip's key set, and the trip once the set is empty."""
+        tid = entry[0]
+        if not tid:
+            return
+        with self._lock:
+            state = self._trips.get(tid)
+            if state is None:
+                return
+            state[1].discard(key)
+            if not state[1]:
+                self._trips.pop(tid)
+
+    def get(self, key: tuple, trip_context: dict) -> str | None:
+        self._sync_trip(trip_context)
+        entry = self._entries.get(key)
+        return None if entry is None else entry[1]
+
+    def put(self, key: tuple, trip_context: dict, result: str) -> str:
+        """Store `result` and return it, so callers can `return cache.put(...)`."""
+        keys = self._sync_trip(trip_context)
+        self._entries.set(key, (trip_id(trip_context), result))
+        if keys is not None:
+            with self._lock:
+                keys.add(key)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._trips.clear()
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "invalidations": self.invalidations}
+
+
+result_cache = ResultCache(
+    maxsize=int(os.environ.get("RESULT_CACHE_SIZE", 512)),
+    ttl=float(os.environ.get("RESULT_CACHE_TTL", 900)),
+)
@@ -0,0 +1,65 @@
+"""
+Cached Serper web search.
+
+Results are stored in SQLite keyed by a normalized form of the query, so
+"best breakfast Port Blair" and "Best breakfast in Port Blair?" share one
+entry across turns, trip members and server restarts. Concurrent identical
+lookups collapse into a single upstream call.
+
+Environment:
+    SEARCH_CACHE_PATH         SQLite file (default: backend/.cache/search_cache.sqlite3)
+    SEARCH_CACHE_TTL          Seconds a result stays fresh (default: 21600)
+    SEARCH_CACHE_MAX_ENTRIES  Rows kept before LRU eviction (default: 5000)
+"""
+import os
+import re
+
+from ai.cache import SingleFlight, SQLiteTTLCache
+from ai.clients import get_serper
+
+_DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "search_cache.sqlite3"
+)
+
+# Words that don't change what Serper returns for a travel query
+_STOPWORDS = {"a", "an", "the", "in", "at", "on", "of", "for", "to", "near", "around", "and", "me", "some"}
+
+search_cache = SQLiteTTLCache(
+    os.environ.get("SEARCH_CACHE_PATH", _DEFAULT_CACHE_PATH),
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL", 6 * 3600)),
+    max_entries=int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 5000)),
+)
+_in_flight = SingleFlight()
+
+
+def normalize_search_query(query: str) -> str:
+    """Case-, punctuation- and stopword-insensitive cache key for a search query.
+
+    Word order is kept: "Delhi to Mumbai" and "Mumbai to Delhi" are different searches.
+    """
+    words = re.findall(r"[a-z0-9]+", query.lower())
+    return " ".join(w for w in words if w not in _STOPWORDS) or query.strip().lower()
+
+
+def _serper_search(query: str) -> str:
+    return get_serper().run(query)
+
+
+def cached_search(query: str) -> str:
+    """Return Serper results for `query`, from cache when fresh."""
+    key = normalize_search_query(query)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        result = _serper_search(query)
+        search_cache.set(key, result)
+        return result
+
+    return _in_flight.do(key, fetch)
+
+
+def search_stats() -> dict:
+    """Cache hit rate and how many lookups were collapsed into in-flight calls."""
+    return {**search_cache.stats(), **_in_flight.stats()}
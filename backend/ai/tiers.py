@@ -0,0 +1,293 @@
+"""
+Adaptive choice between the 8B ("fast") and 70B ("large") NIM models.
+
+Every crew kickoff goes through run(task, attempt). The task is the crew path,
+with single-day PLANs as "plan_day". Each task has a default tier: fast for
+REMOVE, MODIFY, SUGGEST and single-day PLAN, large for whole-trip PLAN and
+the full crew. choose() moves a task off its default tier when:
+
+  * the default model's circuit breaker is open (TIER_BREAKER_FAILURES
+    upstream errors in a row; it half-opens for one trial call after
+    TIER_BREAKER_COOLDOWN seconds), as long as the other model's is not;
+  * on fast, too many recent attempts exhausted their guardrail retries
+    (TIER_ESCALATE_RATE) and had to escalate;
+  * on large, its recent median latency for the task is above
+    TIER_SLOW_SECONDS.
+
+Stats are rolling (the last TIER_WINDOW seconds, at least TIER_MIN_SAMPLES
+attempts), so a task returns to its default tier once the evidence ages out.
+
+Within one request, a task that starts on fast gets TIER_FAST_RETRIES
+guardrail retries there before it escalates to large with the crew's own
+retry budget. An upstream error on either tier falls back to the other tier
+once. An attempt cut short by the request deadline (ai/deadline.py) is not
+retried and counts against neither the model nor the task's stats.
+Decisions, per-tier latency, error, rejection and guardrail-failure rates,
+and breaker states are in stats() and on /metrics.
+
+Environment:
+    MODEL_TIERING          "0" to always use each task's default tier (default: on)
+    TIER_WINDOW            Seconds of history behind the rolling stats (default: 300)
+    TIER_MIN_SAMPLES       Attempts needed before stats move traffic (default: 10)
+    TIER_FAST_RETRIES      Guardrail retries on fast before escalating (default: 1)
+    TIER_ESCALATE_RATE     Share of fast attempts escalating that sends a task to large (default: 0.5)
+    TIER_SLOW_SECONDS      Median large-tier latency that sends a task to fast (default: 90)
+    TIER_BREAKER_FAILURES  Consecutive upstream errors that open a model's breaker (default: 5)
+    TIER_BREAKER_COOLDOWN  Seconds a breaker stays open before a trial call (default: 30)
+"""
+import contextvars
+import os
+import statistics
+import threading
+import time
+from collections import Counter, deque
+
+from ai import deadline
+from ai.clients import FAST_MODEL, PLANNING_MODEL
+from ai.logs import log
+from ai.metrics import register_collector
+
+MODEL_TIERING = os.environ.get("MODEL_TIERING", "1").lower() not in ("0", "false", "no")
+TIER_WINDOW = float(os.environ.get("TIER_WINDOW", 300))
+TIER_MIN_SAMPLES = int(os.environ.get("TIER_MIN_SAMPLES", 10))
+TIER_FAST_RETRIES = int(os.environ.get("TIER_FAST_RETRIES", 1))
+TIER_ESCALATE_RATE = float(os.environ.get("TIER_ESCALATE_RATE", 0.5))
+TIER_SLOW_SECONDS = float(os.environ.get("TIER_SLOW_SECONDS", 90))
+TIER_BREAKER_FAILURES = int(os.environ.get("TIER_BREAKER_FAILURES", 5))
+TIER_BREAKER_COOLDOWN = float(os.environ.get("TIER_BREAKER_COOLDOWN", 30))
+
+# Tier -> (model, crew.py client name)
+TIERS = {
+    "fast": (FAST_MODEL, "fast_crew_llm"),
+    "large": (PLANNING_MODEL, "crew_llm"),
+}
+DEFAULT_TIERS = {
+    "remove": "fast",
+    "modify": "fast",
+    "suggest": "fast",
+    "plan_day": "fast",
+    "plan": "large",
+    "general": "large",
+}
+
+_attempt = contextvars.ContextVar("ai_tier_attempt", default=None)
+_lock = threading.Lock()
+
+# (task, tier, reason) -> count
+decision_counts = Counter()
+
+
+def _other(tier: str) -> str:
+    return "large" if tier == "fast" else "fast"
+
+
+class CircuitBreaker:
+    """Per-model breaker: closed -> open after N upstream errors in a row -> half-open trial."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def allows(self) -> bool:
+        """Whether a call may go to this model now (claims the half-open trial)."""
+        with _lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= TIER_BREAKER_COOLDOWN:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def available(self) -> bool:
+        """allows() without claiming the trial, for choosing a fallback."""
+        with _lock:
+            return self.state == "closed" or (
+                self.state == "open" and time.monotonic() - self.opened_at >= TIER_BREAKER_COOLDOWN
+            ) or (self.state == "half_open" and not self._trial)
+
+    def release(self):
+        """Give back a half-open trial whose call ended without a verdict."""
+        with _lock:
+            self._trial = False
+
+    def record(self, ok: bool):
+        with _lock:
+            previous = self.state
+            if ok:
+                self.state, self.failures = "closed", 0
+            else:
+                self.failures += 1
+                if self.state == "half_open" or self.failures >= TIER_BREAKER_FAILURES:
+                    self.state, self.opened_at = "open", time.monotonic()
+            self._trial = False
+            state = self.state
+        if state != previous:
+            log("warning" if state == "open" else "info", "tier.breaker", model=self.model, state=state,
+                failures=self.failures)
+
+
+class RollingStats:
+    """Attempts of one (task, tier) in the last TIER_WINDOW seconds."""
+
+    def __init__(self):
+        self._samples = deque(maxlen=500)  # (ts, seconds, outcome, rejections)
+
+    def add(self, seconds: float, outcome: str, rejections: int):
+        with _lock:
+            self._samples.append((time.monotonic(), seconds, outcome, rejections))
+
+    def summary(self) -> dict:
+        cutoff = time.monotonic() - TIER_WINDOW
+        with _lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            samples = list(self._samples)
+        if not samples:
+            return {"calls": 0}
+        outcomes = Counter(outcome for _, _, outcome, _ in samples)
+        latencies = sorted(seconds for _, seconds, outcome, _ in samples if outcome == "ok")
+        calls = len(samples)
+        return {
+            "calls": calls,
+            "error_rate": round(outcomes["error"] / calls, 3),
+            "guardrail_failure_rate": round(outcomes["guardrail"] / calls, 3),
+            "rejections_per_call": round(sum(r for _, _, _, r in samples) / calls, 3),
+            "p50_s": round(statistics.median(latencies), 3) if latencies else None,
+            "p90_s": round(latencies[int(0.9 * (len(latencies) - 1))], 3) if latencies else None,
+        }
+
+
+breakers = {model: CircuitBreaker(model) for model, _ in TIERS.values()}
+_stats = {(task, tier): RollingStats() for task in DEFAULT_TIERS for tier in TIERS}
+
+
+def _breaker(tier: str) -> CircuitBreaker:
+    return breakers[TIERS[tier][0]]
+
+
+def choose(task: str) -> tuple[str, str]:
+    """(tier, reason) for the first attempt of `task`."""
+    preferred = DEFAULT_TIERS.get(task, "large")
+    if not MODEL_TIERING:
+        return preferred, "default"
+    other = _other(preferred)
+    if not _breaker(preferred).available() and _breaker(other).available():
+        return other, "breaker_open"
+    recent = _stats[(task, preferred)].summary() if (task, preferred) in _stats else {"calls": 0}
+    if recent["calls"] >= TIER_MIN_SAMPLES and _breaker(other).available():
+        if preferred == "fast" and recent["guardrail_failure_rate"] >= TIER_ESCALATE_RATE:
+            return other, "fast_rejections"
+        if preferred == "large" and recent["p50_s"] is not None and recent["p50_s"] > TIER_SLOW_SECONDS:
+            return other, "large_slow"
+    return preferred, "default"
+
+
+def note_rejection():
+    """Called by the guardrails: one rejected answer in the current attempt."""
+    attempt = _attempt.get()
+    if attempt is not None:
+        attempt["rejections"] += 1
+        attempt["rejected_last"] = True
+
+
+def note_accept():
+    """Called by the guardrails: an answer of the current attempt passed."""
+    attempt = _attempt.get()
+    if attempt is not None:
+        attempt["rejected_last"] = False
+
+
+def _decide(task: str, tier: str, reason: str):
+    decision_counts[(task, tier, reason)] += 1
+    log("info" if reason != "default" else "debug", "tier.decision", task=task, tier=tier,
+        model=TIERS[tier][0], reason=reason)
+
+
+def run(task: str, attempt):
+    """Result of `attempt(tier, guardrail_retries)` on the chosen tier, escalating once if needed.
+
+    `guardrail_retries` is None when the crew's own retry budget applies.
+    """
+    tier, reason = choose(task)
+    tried = set()
+    while True:
+        tried.add(tier)
+        _decide(task, tier, reason)
+        # Fast gets a short guardrail budget only when large can take over
+        escalates = (MODEL_TIERING and DEFAULT_TIERS.get(task) == "fast" and tier == "fast"
+                     and "large" not in tried and _breaker("large").available())
+        retries = TIER_FAST_RETRIES if escalates else None
+        # With both breakers open the chosen tier is still tried; this claims a half-open trial
+        _breaker(tier).allows()
+        state = {"rejections": 0, "rejected_last": False}
+        token = _attempt.set(state)
+        started = time.perf_counter()
+        try:
+            result = attempt(tier, retries)
+        except Exception as e:
+            if deadline.expired():
+                # Out of time, not a verdict on the model; crewai may report it as HookAborted
+                _breaker(tier).release()
+                if isinstance(e, deadline.DeadlineExceeded):
+                    raise
+                raise deadline.exceeded("kickoff") from e
+            seconds = time.perf_counter() - started
+            # crewai ends a task whose guardrail retries ran out with a plain Exception
+            guardrail = type(e) is Exception and state["rejected_last"]
+            if not guardrail:
+                _breaker(tier).record(False)
+            if (task, tier) in _stats:
+                _stats[(task, tier)].add(seconds, "guardrail" if guardrail else "error", state["rejections"])
+            other = _other(tier)
+            # Guardrail failures only escalate fast -> large; upstream errors fall back either way
+            if (not MODEL_TIERING or other in tried or not _breaker(other).available()
+                    or (guardrail and not escalates)):
+                raise
+            reason = "escalated" if guardrail else "fallback"
+            log("warning", f"tier.{reason}", task=task, tier=tier, to=other, error=str(e)[:200])
+            tier = other
+            continue
+        finally:
+            _attempt.reset(token)
+        _breaker(tier).record(True)
+        if (task, tier) in _stats:
+            _stats[(task, tier)].add(time.perf_counter() - started, "ok", state["rejections"])
+        return result
+
+
+def stats() -> dict:
+    """Rolling stats per task and tier, breaker states and decision counts, for tuning."""
+    return {
+        "tasks": {
+            task: {tier: _stats[(task, tier)].summary() for tier in TIERS} for task in DEFAULT_TIERS
+        },
+        "breakers": {model: breaker.state for model, breaker in breakers.items()},
+        "decisions": {f"{task}.{tier}.{reason}": n for (task, tier, reason), n in decision_counts.items()},
+    }
+
+
+@register_collector
+def _collect_stats():
+    """Tier decisions, rolling rates and breaker states as /metrics gauges."""
+    gauges = [("ai_tier_decisions", {"task": task, "tier": tier, "reason": reason}, n)
+              for (task, tier, reason), n in decision_counts.items()]
+    for (task, tier), rolling in _stats.items():
+        summary = rolling.summary()
+        if not summary["calls"]:
+            continue
+        labels = {"task": task, "tier": tier}
+        gauges += [("ai_tier_calls", labels, summary["calls"]),
+                   ("ai_tier_error_rate", labels, summary["error_rate"]),
+                   ("ai_tier_guardrail_failure_rate", labels, summary["guardrail_failure_rate"]),
+                   ("ai_tier_rejections_per_call", labels, summary["rejections_per_call"])]
+        if summary["p50_s"] is not None:
+            gauges.append(("ai_tier_latency_p50_seconds", labels, summary["p50_s"]))
+    gauges += [("ai_tier_breaker_open", {"model": model}, int(breaker.state != "closed"))
+               for model, breaker in breakers.items()]
+    return gauges
@@ -0,0 +1,248 @@
+"""
+Priority-aware admission to the upstream APIs (NVIDIA NIM, Serper).
+
+Every call that leaves the process asks admit(provider, model, tokens) first:
+crewai agent LLM calls through a global before_llm_call hook, ChatNVIDIA
+through ScheduledChatNVIDIA and Serper through PooledSerperAPIWrapper (all in
+ai/clients.py). admit() waits until the token buckets of the provider and of
+the model have room for one request and its estimated prompt tokens; the
+completion's tokens are charged afterwards with charge(), so buckets can go
+briefly negative and later callers wait for them to refill.
+
+Callers queue by priority class, taken from the intent of the crew being run
+(see priority()): interactive edits and intent routing first, then SUGGEST,
+then PLAN/GENERAL. A caller never overtakes an earlier caller of the same or
+higher class waiting on one of its buckets. The time spent waiting is
+recorded as the "queue" stage (ai_stage_duration_seconds and Server-Timing),
+labelled with provider and priority.
+
+Limits are for the whole server; with AI_PROCESSES > 1 each worker process
+enforces an equal share. A caller still queued when its request's deadline
+passes (ai/deadline.py) leaves the queue with DeadlineExceeded instead of
+being sent.
+
+Environment:
+    UPSTREAM_LIMITS         Comma-separated `<scope>.rpm=N` / `<scope>.tpm=N`, where scope
+                            is a provider (nim, serper) or a model name
+                            (default: "nim.rpm=40"; e.g. "nim.rpm=40,nim.tpm=100000,
+                            meta/llama-3.1-70b-instruct.rpm=10,serper.rpm=100")
+    UPSTREAM_QUEUE_TIMEOUT  Seconds a call waits before it is sent anyway (default: 60)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from ai import deadline
+from ai.logs import log
+from ai.metrics import inc, register_collector, span
+
+# Lower rank is served first
+PRIORITY_CLASSES = {
+    "ROUTE": "interactive",
+    "REMOVE": "interactive",
+    "MODIFY": "interactive",
+    "SUGGEST": "suggest",
+    "PLAN": "plan",
+    "GENERAL": "plan",
+}
+PRIORITY_RANKS = {"interactive": 0, "suggest": 1, "plan": 2}
+DEFAULT_PRIORITY = "suggest"
+
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", 60))
+
+
+def _parse_limits(spec: str, share: int) -> dict:
+    limits = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        scope, _, kind = name.strip().rpartition(".")
+        if scope and kind in ("rpm", "tpm") and value.strip():
+            per_minute = float(value) / share
+            if per_minute > 0:
+                limits.setdefault(scope, {})[kind] = per_minute
+    return limits
+
+
+LIMITS = _parse_limits(os.environ.get("UPSTREAM_LIMITS", "nim.rpm=40"),
+                       max(1, int(os.environ.get("AI_PROCESSES", 1))))
+
+_priority = contextvars.ContextVar("ai_upstream_priority", default=DEFAULT_PRIORITY)
+
+
+class TokenBucket:
+    """`per_minute` units, refilled continuously; holds at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def available(self, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.level
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` fits (a cost above capacity only needs a full bucket)."""
+        missing = min(cost, self.capacity) - self.available(now)
+        return max(0.0, missing / self.rate)
+
+    def take(self, cost: float):
+        self.level -= cost
+
+
+class UpstreamScheduler:
+    """Token buckets per provider and per model, served in priority order."""
+
+    def __init__(self, limits: dict, timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.timeout = timeout
+        self._buckets = {
+            (scope, kind): TokenBucket(per_minute)
+            for scope, kinds in limits.items() for kind, per_minute in kinds.items()
+        }
+        self._cond = threading.Condition()
+        self._waiting = []  # [(rank, seq, bucket keys)] of callers not yet admitted
+        self._seq = 0
+        self.waiting_by_class = Counter()
+        # admitted / waited / timeouts / deadline, per priority class
+        self.counts = Counter()
+
+    def _costs(self, provider: str, model: str, tokens: int) -> dict:
+        costs = {}
+        for scope in (provider, model):
+            if (scope, "rpm") in self._buckets:
+                costs[(scope, "rpm")] = 1
+            if (scope, "tpm") in self._buckets:
+                costs[(scope, "tpm")] = tokens
+        return costs
+
+    def admit(self, provider: str, model: str, tokens: int = 0) -> float:
+        """Block until the call may be sent; returns the seconds it waited."""
+        costs = self._costs(provider, model, tokens)
+        priority = _priority.get()
+        if not costs:
+            self.counts[(priority, "admitted")] += 1
+            return 0.0
+        with span("queue", provider=provider, priority=priority) as timing:
+            try:
+                waited = self._acquire(costs, priority)
+            except deadline.DeadlineExceeded:
+                timing.tag(outcome="deadline")
+                self.counts[(priority, "deadline")] += 1
+                raise
+            if waited is None:
+                timing.tag(outcome="timeout")
+        if waited is None:
+            self.counts[(priority, "timeouts")] += 1
+            inc("ai_upstream_queue_timeouts_total", help="Upstream calls sent after UPSTREAM_QUEUE_TIMEOUT",
+                provider=provider, priority=priority)
+            log("warning", "upstream.queue_timeout", provider=provider, model=model, priority=priority,
+                timeout=self.timeout)
+            return self.timeout
+        self.counts[(priority, "admitted")] += 1
+        if waited > 0:
+            self.counts[(priority, "waited")] += 1
+            log("debug", "upstream.queued", provider=provider, model=model, priority=priority,
+                waited_ms=round(waited * 1000, 1))
+        return waited
+
+    def _acquire(self, costs: dict, priority: str) -> float | None:
+        started = time.monotonic()
+        until = started + self.timeout
+        left = deadline.remaining()
+        # The request gives up before the queue timeout would send the call anyway
+        give_up = started + left if left is not None and left < self.timeout else None
+        with self._cond:
+            self._seq += 1
+            me = (PRIORITY_RANKS.get(priority, PRIORITY_RANKS[DEFAULT_PRIORITY]), self._seq, frozenset(costs))
+            self._waiting.append(me)
+            self.waiting_by_class[priority] += 1
+            blocked = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    # Callers ahead of us on a shared bucket go first
+                    ahead = any(other[:2] < me[:2] and other[2] & me[2] for other in self._waiting)
+                    delay = until - now
+                    if not ahead:
+                        delay = min(delay, max(self._buckets[key].wait_time(cost, now) for key, cost in costs.items()))
+                        if delay <= 0:
+                            break
+                    if give_up is not None:
+                        if now >= give_up:
+                            raise deadline.exceeded("queue")
+                        delay = min(delay, give_up - now)
+                    if now >= until:
+                        break
+                    blocked = True
+                    self._cond.wait(delay)
+                # A timed-out call is still sent, so it still uses up capacity
+                for key, cost in costs.items():
+                    self._buckets[key].take(cost)
+                if now >= until:
+                    return None
+                return now - started if blocked else 0.0
+            finally:
+                self._waiting.remove(me)
+                self.waiting_by_class[priority] -= 1
+                self._cond.notify_all()
+
+    def charge(self, provider: str, model: str, tokens: int):
+        """Add tokens known only after the call (the completion) to the tpm buckets."""
+        with self._cond:
+            for scope in (provider, model):
+                bucket = self._buckets.get((scope, "tpm"))
+                if bucket is not None:
+                    bucket.take(tokens)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        levels = {}
+        with self._cond:
+            for (scope, kind), bucket in self._buckets.items():
+                levels[f"{scope}.{kind}"] = round(bucket.available(now), 1)
+        return {
+            "waiting": dict(self.waiting_by_class),
+            "counts": {f"{priority}.{outcome}": n for (priority, outcome), n in self.counts.items()},
+            "available": levels,
+        }
+
+
+scheduler = UpstreamScheduler(LIMITS)
+
+
+def admit(provider: str, model: str, tokens: int = 0) -> float:
+    return scheduler.admit(provider, model, tokens)
+
+
+def charge(provider: str, model: str, tokens: int):
+    scheduler.charge(provider, model, tokens)
+
+
+@contextmanager
+def priority(intent: str):
+    """Queue this block's upstream calls in the priority class of `intent`."""
+    token = _priority.set(PRIORITY_CLASSES.get(intent, DEFAULT_PRIORITY))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def stats() -> dict:
+    return scheduler.stats()
+
+
+@register_collector
+def _collect_stats():
+    """Queue depth per priority class and remaining bucket capacity as /metrics gauges."""
+    gauges = [("ai_upstream_waiting", {"priority": p}, n) for p, n in scheduler.waiting_by_class.items()]
+    gauges += [("ai_upstream_calls", {"priority": p, "outcome": o}, n) for (p, o), n in scheduler.counts.items()]
+    for name, level in stats()["available"].items():
+        scope, _, kind = name.rpartition(".")
+        gauges.append(("ai_upstream_bucket_available", {"scope": scope, "kind": kind}, level))
+    return gauges
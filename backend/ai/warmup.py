@@ -0,0 +1,131 @@
+"""
+Background warmup and readiness for the AI server.
+
+Importing the crew stack (crewai, litellm, langchain) takes several seconds,
+so the server starts listening first and start() does the heavy work on a
+background thread: import ai.crew and ai.batch, build the NIM and Serper
+clients, check that crew templates can be reused, and optionally send one
+tiny completion so the first request finds a warm TLS connection. /readyz
+reports ready only once that has finished; suggestion requests that arrive
+earlier wait for it (up to WARMUP_TIMEOUT) rather than serving cold.
+
+Environment:
+    WARMUP_PING      "1" to send a 1-token completion to the fast model (default: off)
+    WARMUP_PING_URL  OpenAI-compatible base URL for that ping (default: NVIDIA_NIM_BASE_URL)
+    WARMUP_TIMEOUT   Seconds a request waits for warmup before a 503 (default: 60)
+"""
+import importlib
+import os
+import threading
+import time
+
+from ai.logs import log
+
+WARMUP_PING = os.environ.get("WARMUP_PING", "").lower() in ("1", "true", "yes")
+WARMUP_PING_URL = os.environ.get("WARMUP_PING_URL", "")
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", 60))
+
+_lock = threading.Lock()
+_done = threading.Event()
+_ready = threading.Event()
+_thread = None
+_state = {"status": "cold", "steps_ms": {}, "error": None, "ping_error": None}
+_process_started = time.monotonic()
+
+
+def _reset_clock():
+    global _process_started
+    _process_started = time.monotonic()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clock)  # pre-fork workers time their own start
+
+
+def _step(name: str, fn):
+    started = time.perf_counter()
+    fn()
+    _state["steps_ms"][name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _imports():
+    importlib.import_module("ai.crew")
+    importlib.import_module("ai.batch")
+
+
+def _clients():
+    from ai import crew
+    from ai.clients import get_serper, http_session
+    http_session()
+    crew.init_clients()
+    crew.crew_factory.check_reuse()  # logs if this crewai can't reuse crew templates
+    if os.environ.get("SERPER_API_KEY"):  # search is optional; fast_search_tool reports the missing key
+        get_serper()
+
+
+def _ping():
+    from ai.clients import FAST_MODEL, NIM_BASE_URL, http_session
+    from ai.upstream import admit, priority
+    url = (WARMUP_PING_URL or NIM_BASE_URL).rstrip("/") + "/chat/completions"
+    with priority("PLAN"):  # counts against the NIM quota, behind any real request
+        admit("nim", FAST_MODEL, 2)
+    response = http_session().post(
+        url,
+        json={"model": FAST_MODEL, "messages": [{"role": "user", "content": "ping"}], "max_tokens": 1},
+        headers={"Authorization": f"Bearer {os.environ.get('NVIDIA_NIM_API_KEY', '')}"},
+        timeout=10,
+    )
+    response.raise_for_status()
+
+
+def _run():
+    _state["status"] = "warming"
+    try:
+        _step("imports", _imports)
+        _step("clients", _clients)
+    except Exception as e:
+        _state.update(status="failed", error=f"{type(e).__name__}: {e}")
+        log("error", "warmup.failed", error=_state["error"], steps_ms=_state["steps_ms"])
+        _done.set()
+        return
+    if WARMUP_PING:
+        try:
+            _step("ping", _ping)
+        except Exception as e:
+            # A slow or flaky upstream must not keep the replica out of rotation
+            _state["ping_error"] = str(e)
+            log("warning", "warmup.ping_failed", error=str(e))
+    _state["status"] = "ready"
+    _state["ready_after_s"] = round(time.monotonic() - _process_started, 2)
+    _ready.set()
+    _done.set()
+    log("info", "warmup.ready", steps_ms=_state["steps_ms"], ready_after_s=_state["ready_after_s"])
+
+
+def start():
+    """Begin warming up in the background (idempotent)."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="warmup", daemon=True)
+            _thread.start()
+
+
+def wait(timeout: float | None = None) -> bool:
+    """Start warmup if needed and block until it finishes; True once ready."""
+    start()
+    _done.wait(timeout)
+    return _ready.is_set()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def failed() -> bool:
+    return _state["status"] == "failed"
+
+
+def status() -> dict:
+    return {**_state, "steps_ms": dict(_state["steps_ms"]),
+            "uptime_s": round(time.monotonic() - _process_started, 2)}
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Per-request crew construction overhead, before and after CrewFactory.
+
+"before" rebuilds a path's agents, tasks and crew for every request, plus the
+three full-crew tasks the old create_suggestion_crew built up front on every
+path. "after" binds the request inputs into the cached per-thread template.
+No LLM or search calls are made.
+
+Usage:
+    python backend/benchmarks/crew_construction.py [iterations]
+"""
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from ai import crew as crew_module  # noqa: E402
+
+INPUTS = {
+    "user_query": "suggest breakfast spots for day 2",
+    "context": "Trip Destination: Port Blair\nDuration: 3 days, 2 nights",
+    "itinerary": "Day 1: Breakfast at 08:00-09:00\nDay 1: Lunch at 13:00-14:00",
+    "chat": "Asha: we love seafood",
+    "agent_goal": "Create themed, personalized JSON itineraries that match the user's vision",
+    "theme_emphasis": "",
+    "day_instruction": "",
+    "output_limit_instruction": "ALL items for ALL days",
+    "example_day": 1,
+}
+
+
+def before(name: str):
+    crew = crew_module.crew_factory._builders[name]()
+    if name != "general":
+        crew_module._build_general_crew()  # search/preference/planning tasks built eagerly
+    crew._interpolate_inputs(INPUTS)
+
+
+def after(name: str):
+    crew = crew_module.crew_factory.get(name)
+    for task in crew.tasks:
+        task.retry_count = 0
+        task._guardrail_retry_counts.clear()
+    crew._interpolate_inputs(INPUTS)
+
+
+def bench(fn, name: str, iterations: int) -> float:
+    fn(name)  # warm up (first template build, lazy imports)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(name)
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{'path':<10}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in ["remove", "modify", "suggest", "plan", "general"]:
+        b = bench(before, name, iterations)
+        a = bench(after, name, iterations)
+        print(f"{name:<10}{b:>14.3f}{a:>14.3f}{b / a:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
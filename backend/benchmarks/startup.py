@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Cold-start profile of the AI server.
+
+Runs each measurement in a fresh interpreter:
+  * import time of ai.handlers (what server.py needs before it can listen)
+    and of ai.crew (what warmup loads in the background), from -X importtime,
+    with the slowest top-level packages;
+  * a real `server.py` start: seconds until /healthz answers (listening) and
+    until /readyz reports ready (warmup done), plus warmup's own step timings.
+
+Usage:
+    python backend/benchmarks/startup.py [--runs N] [--top N] [--timeout S]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = {
+    **os.environ,
+    "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    "CREWAI_DISABLE_TELEMETRY": "true",
+    "OTEL_SDK_DISABLED": "true",
+    "LOG_LEVEL": "warning",
+}
+
+
+def import_profile(module: str) -> tuple[float, list]:
+    """(total seconds, [(self seconds, top-level package), ...]) for importing `module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=ENV, capture_output=True, text=True, check=True,
+    )
+    total, packages = 0.0, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue  # header line
+        if name == module:
+            total = int(cumulative) / 1e6
+        # Self time summed per top-level package, so nested imports aren't counted twice
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + int(own) / 1e6
+    return total, sorted(((s, p) for p, s in packages.items()), reverse=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except OSError:
+        return None, b""
+
+
+def server_start(timeout: float) -> dict:
+    """Seconds until /healthz and /readyz first answer 200 for a fresh server.py."""
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "server.py")],
+        env={**ENV, "PORT": str(port), "HOST": "127.0.0.1"},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    result = {"healthz_s": None, "readyz_s": None, "warmup": None}
+    try:
+        while time.perf_counter() - started < timeout:
+            if result["healthz_s"] is None and _get(f"{base}/healthz")[0] == 200:
+                result["healthz_s"] = time.perf_counter() - started
+            if result["healthz_s"] is not None:
+                status, body = _get(f"{base}/readyz")
+                if status == 200:
+                    result["readyz_s"] = time.perf_counter() - started
+                    result["warmup"] = json.loads(body)
+                    break
+            time.sleep(0.02)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3, help="server starts to average")
+    parser.add_argument("--top", type=int, default=6, help="slowest packages to list per import")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for readiness")
+    args = parser.parse_args()
+
+    print("Import time (fresh interpreter)")
+    for module in ("ai.handlers", "ai.crew"):
+        total, packages = import_profile(module)
+        print(f"  {module:<12} {total:8.3f} s   " +
+              ", ".join(f"{name} {seconds:.2f}s" for seconds, name in packages[:args.top]))
+
+    runs = [server_start(args.timeout) for _ in range(args.runs)]
+    healthz = [r["healthz_s"] for r in runs if r["healthz_s"] is not None]
+    readyz = [r["readyz_s"] for r in runs if r["readyz_s"] is not None]
+    print(f"\nserver.py start ({args.runs} runs, median)")
+    print(f"  listening (/healthz 200)  {statistics.median(healthz):8.3f} s" if healthz else "  /healthz never answered")
+    print(f"  ready     (/readyz 200)   {statistics.median(readyz):8.3f} s" if readyz else "  /readyz never became ready")
+    if readyz:
+        print(f"  warmup steps (last run)   {runs[-1]['warmup']['steps_ms']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of every create_suggestion_crew path.
+
+The NIM models and Serper are replaced by local stand-ins with configurable
+latency and scripted replies (including malformed JSON and wrong actions), so
+the numbers measure this backend's own overhead: routing, context building,
+crew setup, guardrails and JSON repair. For each scenario it reports per-stage
+wall time, LLM calls, guardrail repairs/retries, prompt size and peak memory.
+
+Results can be stored as a baseline and later runs are diffed against it:
+
+    python backend/benchmarks/suggestion_paths.py --save-baseline
+    python backend/benchmarks/suggestion_paths.py            # compares to the baseline
+
+Usage:
+    python backend/benchmarks/suggestion_paths.py [--iterations N] [--llm-latency S]
+        [--search-latency S] [--scenario NAME ...] [--baseline PATH] [--save-baseline]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("SERPER_API_KEY", "benchmark")
+os.environ["SEARCH_CACHE_PATH"] = ":memory:"
+os.environ.setdefault("LOG_LEVEL", "warning")
+os.environ.setdefault("UPSTREAM_LIMITS", "")  # measure our own overhead, not the NIM quota
+
+from crewai.events.event_bus import crewai_event_bus  # noqa: E402
+from crewai.llms.base_llm import BaseLLM  # noqa: E402
+
+from ai import clients, crew as crew_module  # noqa: E402
+from ai.context import estimate_tokens  # noqa: E402
+from ai.events import event_sink  # noqa: E402
+from ai.intent import intent_cache  # noqa: E402
+from ai.results import result_cache  # noqa: E402
+from ai.search import search_cache  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "suggestion_paths.json")
+
+
+# ═══════════════════════════════════════════════════════════════
+# STAND-INS
+# ═══════════════════════════════════════════════════════════════
+
+class Script:
+    """Scripted replies per agent role; the last reply repeats once a list runs out."""
+
+    def __init__(self, replies: dict):
+        self.replies = replies
+        self.calls = 0
+        self.prompt_tokens = 0
+        self._position = {}
+        self._lock = threading.Lock()
+
+    def next(self, role: str, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += estimate_tokens(prompt)
+            replies = self.replies.get(role) or self.replies.get("*") or ["Final Answer: {}"]
+            position = self._position.get(role, 0)
+            self._position[role] = position + 1
+            return replies[min(position, len(replies) - 1)]
+
+
+class StubChat:
+    """Stand-in for ChatNVIDIA: classify_intent's fast_llm.invoke()."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.reply = "SUGGEST"
+        self.calls = 0
+
+    def invoke(self, prompt):
+        time.sleep(self.latency)
+        self.calls += 1
+        return SimpleNamespace(content=self.reply)
+
+
+class StubCrewLLM(BaseLLM):
+    """Stand-in for the crewai LLM the agents call (converted from ChatNVIDIA in production)."""
+
+    latency: float = 0.0
+    script: Any = None
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        time.sleep(self.latency)
+        prompt = messages if isinstance(messages, str) else "\n".join(str(m.get("content", "")) for m in messages)
+        return self.script.next(getattr(from_agent, "role", ""), prompt)
+
+
+class StubSerper:
+    """Stand-in for GoogleSerperAPIWrapper."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def run(self, query: str) -> str:
+        time.sleep(self.latency)
+        self.calls += 1
+        return f"1. Top result for {query}: open 9am-10pm, mid-range prices.\n2. Runner-up for {query}."
+
+
+def install_stubs(llm_latency: float, search_latency: float) -> tuple:
+    chat = StubChat(llm_latency)
+    crew_llm = StubCrewLLM(model=clients.PLANNING_MODEL, latency=llm_latency, script=Script({}))
+    fast_crew_llm = StubCrewLLM(model=clients.FAST_MODEL, latency=llm_latency, script=crew_llm.script)
+    crew_module.llm = crew_module.fast_llm = chat
+    crew_module.crew_llm = crew_llm
+    crew_module.fast_crew_llm = fast_crew_llm
+    clients._serper = StubSerper(search_latency)
+    return chat, crew_llm, fast_crew_llm, clients._serper
+
+
+# ═══════════════════════════════════════════════════════════════
+# SCENARIOS
+# ═══════════════════════════════════════════════════════════════
+
+TRIP = {
+    "_id": "benchmark-trip",
+    "settings": {"destination": "Port Blair", "daysCount": 3, "nightsCount": 2, "groupSize": 4},
+    "preferences": {"dietary": ["Vegetarian"], "interests": ["Beaches", "History"]},
+    "itinerary": [
+        {"day": 1, "title": "Breakfast at Hotel", "startTime": "08:00", "endTime": "09:00"},
+        {"day": 1, "title": "Cellular Jail Museum", "startTime": "10:00", "endTime": "12:00"},
+        {"day": 1, "title": "Lunch", "startTime": "13:00", "endTime": "14:00"},
+        {"day": 1, "title": "Dinner", "startTime": "19:00", "endTime": "21:00"},
+        {"day": 2, "title": "Ross Island Ferry", "startTime": "09:00", "endTime": "13:00"},
+        {"day": 2, "title": "Corbyn's Cove Beach", "startTime": "15:00", "endTime": "18:00"},
+        {"day": 3, "title": "Chidiya Tapu Sunset", "startTime": "16:00", "endTime": "18:30"},
+    ],
+}
+CHAT = [
+    {"senderName": "Asha", "content": "We should keep one evening free for seafood, but veg options for Ben"},
+    {"senderName": "Ben", "content": "ok"},
+    {"senderName": "Chen", "content": "Can we avoid very early mornings? The ferry on day 2 is already at 9"},
+    {"senderName": "Asha", "content": "@weai what's the weather usually like in March?"},
+]
+
+REMOVE_JSON = '{"action": "remove_items", "items": [{"title": "Cellular Jail Museum", "day": 1}]}'
+MODIFY_JSON = ('{"action": "update_items", "updates": [{"originalTitle": "Lunch", "day": 1, "newStartTime": "19:00", '
+               '"newEndTime": "20:00"}, {"originalTitle": "Dinner", "day": 1, "newStartTime": "13:00", "newEndTime": "15:00"}]}')
+SUGGEST_JSON = ('{"action": "smart_schedule", "isOptions": true, "newItems": ['
+                '{"title": "Anju Coco Resto", "day": 2, "startTime": "19:30", "duration": 90},'
+                '{"title": "New Lighthouse Restaurant", "day": 2, "startTime": "19:30", "duration": 90}],'
+                ' "itemsToRemove": []}')
+PLAN_JSON = ('{"action": "add_items", "replacementStrategy": "replace", "items": ['
+             '{"title": "Scuba Diving", "day": 1, "duration": 180}, {"title": "Jungle Trek", "day": 2, "duration": 180},'
+             ' {"title": "Sea Kayaking", "day": 3, "duration": 120}]}')
+SEARCH_CALL = 'Thought: I should search.\nAction: Fast Web Search\nAction Input: {"query": "seafood dinner Port Blair"}'
+
+
+def final(text: str) -> str:
+    return f"Thought: I now know the final answer\nFinal Answer: {text}"
+
+
+# name -> (query, classifier reply for the LLM stage, {agent role: [replies]})
+SCENARIOS = {
+    "remove/fast": ("remove breakfast from day 1", "REMOVE", {}),
+    "remove/crew": ("I don't want the museum anymore", "REMOVE", {"Itinerary Modifier": [final(REMOVE_JSON)]}),
+    "modify/fast": ("move lunch to 2pm", "MODIFY", {}),
+    "modify/crew": ("swap lunch and dinner on day 1", "MODIFY", {"Itinerary Modifier": [final(MODIFY_JSON)]}),
+    "suggest": ("suggest seafood places for dinner on day 2", "SUGGEST",
+                {"Local Expert & Planner": [SEARCH_CALL, final(SUGGEST_JSON)]}),
+    "suggest/repaired": ("suggest seafood places for dinner on day 2", "SUGGEST",
+                         {"Local Expert & Planner": [SEARCH_CALL, final(
+                             "Here you go:\n```json\n" + SUGGEST_JSON.replace('"day": 2', '"day": "2"')[:-1] + ",}\n```")]}),
+    "suggest/retry": ("suggest seafood places for dinner on day 2", "SUGGEST",
+                      {"Local Expert & Planner": [SEARCH_CALL, final(PLAN_JSON), final(SUGGEST_JSON)]}),
+    "suggest/llm-routed": ("anything fun near the hotel for day 2?", "SUGGEST",
+                           {"Local Expert & Planner": [SEARCH_CALL, final(SUGGEST_JSON)]}),
+    "plan": ("plan an adventurous trip", "PLAN", {"Creative Trip Planner": [final(PLAN_JSON)]}),
+    "general": ("what's the weather usually like in March?", "GENERAL", {
+        "Travel Researcher": [SEARCH_CALL, final("March is dry and sunny, 24-31C.")],
+        "Group Preference Analyst": [final("Vegetarian options needed; prefers late starts.")],
+        "Trip Itinerary Planner": [final(PLAN_JSON)],
+    }),
+}
+
+
+# ═══════════════════════════════════════════════════════════════
+# RUNNER
+# ═══════════════════════════════════════════════════════════════
+
+def reset_caches():
+    intent_cache.clear()
+    result_cache.clear()
+    search_cache.clear()
+
+
+def run_once(name: str, stubs: tuple) -> dict:
+    chat, crew_llm, fast_crew_llm, serper = stubs
+    query, routed_intent, replies = SCENARIOS[name]
+    script = Script(replies)
+    chat.reply = routed_intent
+    crew_llm.script = fast_crew_llm.script = script
+    chat_calls, search_calls = chat.calls, serper.calls
+    guardrails = dict(crew_module.guardrail_counts)
+    reset_caches()
+
+    marks = []
+    started = time.perf_counter()
+    quiet = io.StringIO()  # crew verbose output and log_to_file
+    with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet), \
+            event_sink(lambda e: marks.append((time.perf_counter(), e))):
+        result = crew_module.create_suggestion_crew(query, json.loads(json.dumps(TRIP)), list(CHAT))
+        total = time.perf_counter() - started
+        crewai_event_bus.flush()  # crewai prints its completion panels from handler threads
+
+    at = {e["event"]: t for t, e in marks}
+    routed = at.get("intent", started)
+    crew_started = at.get("crew_start")
+    context_event = next((e for _, e in marks if e["event"] == "context"), {})
+    return {
+        "total_ms": total * 1000,
+        "route_ms": (routed - started) * 1000,
+        "context_ms": (at.get("context", routed) - routed) * 1000,
+        "crew_ms": (started + total - crew_started) * 1000 if crew_started else 0.0,
+        "search_ms": sum(e.get("elapsed_ms", 0) for _, e in marks if e["event"] == "tool_end"),
+        "llm_calls": script.calls + chat.calls - chat_calls,
+        "search_calls": serper.calls - search_calls,
+        "prompt_tokens": script.prompt_tokens,
+        "context_tokens": context_event.get("tokens", {}).get("total", 0),
+        "guardrail_repairs": crew_module.guardrail_counts["repairs"] - guardrails.get("repairs", 0),
+        "guardrail_retries": crew_module.guardrail_counts["retries"] - guardrails.get("retries", 0),
+        "fast_path": int("fast_path" in at),
+        "result_bytes": len(str(result)),
+    }
+
+
+def measure_memory(name: str, stubs: tuple) -> float:
+    tracemalloc.start()
+    try:
+        run_once(name, stubs)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench(name: str, stubs: tuple, iterations: int) -> dict:
+    run_once(name, stubs)  # warm up: first template build per path, lazy imports
+    runs = [run_once(name, stubs) for _ in range(iterations)]
+    summary = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+    summary["total_ms_p90"] = sorted(r["total_ms"] for r in runs)[int(0.9 * (len(runs) - 1))]
+    summary["peak_kib"] = measure_memory(name, stubs)
+    return {key: round(value, 3) for key, value in summary.items()}
+
+
+COLUMNS = [
+    ("total_ms", "total ms"), ("route_ms", "route"), ("context_ms", "ctx"), ("crew_ms", "crew"),
+    ("search_ms", "search"), ("llm_calls", "llm"), ("guardrail_repairs", "repair"),
+    ("guardrail_retries", "retry"), ("prompt_tokens", "prompt tok"), ("peak_kib", "peak KiB"),
+]
+
+
+def print_table(results: dict):
+    print(f"{'scenario':<20}" + "".join(f"{label:>11}" for _, label in COLUMNS))
+    for name, metrics in results.items():
+        print(f"{name:<20}" + "".join(f"{metrics[key]:>11.1f}" for key, _ in COLUMNS))
+
+
+def print_diff(results: dict, baseline: dict):
+    """Changes against the stored baseline; counts exactly, timings/memory beyond 10% and 1 ms/KiB."""
+    print(f"\nvs baseline ({baseline['meta']['created']}):")
+    changed = False
+    for name, metrics in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"  {name}: new scenario")
+            continue
+        for key, value in metrics.items():
+            before = old.get(key)
+            if before is None:
+                continue
+            exact = key.endswith(("calls", "repairs", "retries", "tokens", "fast_path", "bytes"))
+            relative = (value - before) / before if before else (1.0 if value else 0.0)
+            if (exact and value != before) or (not exact and abs(relative) > 0.10 and abs(value - before) >= 1.0):
+                changed = True
+                print(f"  {name:<20}{key:<20}{before:>12.3f} -> {value:<12.3f}({relative:+.0%})")
+    if not changed:
+        print("  no changes beyond noise")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per stub LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="seconds per stub Serper call")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    stubs = install_stubs(args.llm_latency, args.search_latency)
+    results = {name: bench(name, stubs, args.iterations) for name in (args.scenario or SCENARIOS)}
+    print_table(results)
+
+    meta = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "iterations": args.iterations,
+        "llm_latency": args.llm_latency,
+        "search_latency": args.search_latency,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nSaved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["meta"]["llm_latency"], baseline["meta"]["search_latency"]) != (args.llm_latency, args.search_latency):
+            print("\nBaseline was recorded with different stub latencies; timings are not comparable.")
+        print_diff(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
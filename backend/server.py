@@ -6,14 +6,47 @@ Runs the AI suggestion service for local development and production.
 Usage:
     python backend/server.py           # Run on default port 5328
     PORT=8000 python backend/server.py # Run on custom port
+    AI_PROCESSES=4 python backend/server.py  # Pre-fork: 4 worker processes
+
+Concurrency (environment variables):
+    AI_WORKERS=8       # Worker threads serving requests in parallel (per process)
+    AI_QUEUE_SIZE=16   # Accepted connections allowed to wait for a worker
+    AI_RETRY_AFTER=5   # Retry-After seconds sent when the queue is full
+
+Pre-fork mode (POSIX only):
+    AI_PROCESSES=1         # >1: worker processes sharing the listening socket
+    AI_MAX_REQUESTS=0      # Recycle a worker after ~this many requests (0: never; needs AI_PROCESSES > 1)
+    AI_GRACEFUL_TIMEOUT=30 # Seconds to finish accepted requests on SIGTERM
+
+    A supervisor forks the workers, restarts any that crash and replaces
+    recycled ones. Each worker warms up on its own; caches, in-flight
+    coalescing and /metrics are per worker.
+
+Monitoring:
+    GET /metrics       # Prometheus text: per-stage latency histograms, cache gauges
+    GET /healthz       # Liveness: 200 while the process serves (500 if warmup failed)
+    GET /readyz        # Readiness: 200 once background warmup is done, 503 before
+
+Startup: the server listens immediately; ai/warmup.py imports the crew stack
+and builds the upstream clients in the background (WARMUP_PING, WARMUP_TIMEOUT).
+
+Logging: JSON lines per request, see ai/logs.py (LOG_LEVEL, LOG_FILE, ...)
 """
 import http.server
+import json
 import os
+import random
+import signal
+import socket
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Add backend directory to path
+# Add backend directory to path (already there when run as a script)
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, BACKEND_DIR)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
 
 # Load .env file from project root
 PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
@@ -33,54 +66,319 @@ if os.path.exists(env_path):
 else:
     print("Warning: .env file not found")
 
-# Import handler after environment is loaded
+# Import handler after environment is loaded (light: the crew stack loads in warmup)
 try:
+    from ai import warmup
     from ai.handlers import handler
+    from ai.logs import flush as flush_logs, log, set_worker
+    from ai.metrics import render
 except ImportError as e:
     print(f"Error importing ai.handlers: {e}")
     print("Make sure you are running this script from the project root.")
     sys.exit(1)
 
 
+# Polled every few seconds by load balancers; kept out of the access log
+PROBE_PATHS = ('/healthz', '/readyz', '/metrics')
+
+
 class DevHandler(handler):
     """Development handler with request logging."""
+
+    def log_request(self, code='-', size='-'):
+        if self.path.split('?', 1)[0] not in PROBE_PATHS:
+            super().log_request(code, size)
     
     def do_POST(self):
-        print(f"[AI Server] POST {self.path}")
         if self.path.startswith('/api/ai/suggest'):
             try:
                 super().do_POST()
             except Exception as e:
-                print(f"Error in do_POST: {e}")
+                log('error', 'http.post_failed', path=self.path, error=str(e))
                 self.send_error(500, str(e))
         else:
             self.send_error(404, f"Endpoint {self.path} not found")
 
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            self._send_text(200, render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif path == '/healthz':
+            status = 500 if warmup.failed() else 200
+            self._send_text(status, json.dumps({'status': 'failed' if status == 500 else 'ok'}), 'application/json')
+        elif path == '/readyz':
+            self._send_text(200 if warmup.is_ready() else 503, json.dumps(warmup.status()), 'application/json')
+        else:
+            self.send_error(404, f"Endpoint {self.path} not found")
+
+    def _send_text(self, status, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_OPTIONS(self):
-        print(f"[AI Server] OPTIONS {self.path}")
         if self.path.startswith('/api/ai/suggest'):
             super().do_OPTIONS()
         else:
             self.send_error(404)
 
 
+class PooledHTTPServer(http.server.HTTPServer):
+    """HTTPServer that serves connections on a bounded worker pool.
+
+    Up to `workers` requests run at once and up to `queue_size` more wait for
+    a free worker. Anything beyond that is turned away immediately with a 503
+    and a Retry-After header instead of queueing behind a long PLAN crew.
+    """
+
+    def __init__(self, server_address, handler_class, workers=8, queue_size=16, retry_after=5):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.max_requests = 0          # after this many, call on_max_requests (worker recycling)
+        self.on_max_requests = None
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-worker')
+        self._rejects = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-reject')
+        self._active = 0               # accepted and not yet finished
+        self._handled = 0
+        self._idle = threading.Condition()
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        with self._idle:
+            self._active += 1
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor already shut down (server stopping)
+            self._finished(counted=False)
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._finished()
+
+    def _finished(self, counted=True):
+        self._slots.release()
+        with self._idle:
+            self._active -= 1
+            self._handled += counted
+            limit_reached = self.max_requests and self._handled == self.max_requests
+            self._idle.notify_all()
+        if limit_reached and self.on_max_requests:
+            self.on_max_requests()
+
+    def drain(self, timeout):
+        """Wait for accepted requests to finish; False if some were still running at `timeout`."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._active == 0, timeout=timeout)
+
+    def reject_request(self, request):
+        """Answer an over-capacity connection with 503 + Retry-After and close it."""
+        body = json.dumps({
+            'success': False,
+            'error': 'AI server is busy, please retry shortly.'
+        }).encode('utf-8')
+        head = (
+            "HTTP/1.0 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Retry-After: {self.retry_after}\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode('latin-1')
+        try:
+            # A fresh connection's send buffer takes this at once; the accept loop never waits on the client
+            request.sendall(head + body)
+            request.shutdown(socket.SHUT_WR)
+        except OSError:
+            self.shutdown_request(request)
+        else:
+            try:
+                self._rejects.submit(self._close_rejected, request)
+            except RuntimeError:
+                self.shutdown_request(request)
+        log('warning', 'http.rejected', workers=self.workers, queue_size=self.queue_size)
+
+    def _close_rejected(self, request):
+        try:
+            # Drain what the client already sent so closing doesn't RST the reply
+            request.settimeout(0.5)
+            request.recv(65536)
+        except OSError:
+            pass
+        finally:
+            request.close()
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._rejects.shutdown(wait=False)
+
+
+def serve(httpd, graceful_timeout, max_requests=0):
+    """Serve until SIGTERM/SIGINT or `max_requests`, then let accepted requests finish."""
+    stopping = threading.Event()
+
+    def stop(*_):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() waits for serve_forever() to return, so it can't run on this thread
+            threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    httpd.max_requests = max_requests
+    httpd.on_max_requests = stop
+
+    # Heavy imports and client setup run while the socket already accepts probes
+    warmup.start()
+    httpd.serve_forever()
+    if not httpd.drain(graceful_timeout):
+        log('warning', 'server.drain_timeout', timeout=graceful_timeout)
+    httpd.server_close()
+
+
+class Supervisor:
+    """Pre-fork mode: worker processes serving one listening socket.
+
+    Crashed workers are restarted (with a pause if they die right after
+    starting), workers that reach their request limit are replaced, and
+    SIGTERM/SIGINT are forwarded so every worker finishes its accepted
+    requests before the supervisor exits.
+    """
+
+    def __init__(self, httpd, processes, max_requests, graceful_timeout):
+        self.httpd = httpd
+        self.processes = processes
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}  # pid -> (slot, started)
+        self.stopping = False
+
+    def _request_limit(self):
+        # Up to 10% jitter so workers don't all recycle at once
+        if not self.max_requests:
+            return 0
+        return self.max_requests + random.randint(0, self.max_requests // 10)
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            # Until serve() installs its own, the supervisor's handlers would signal the siblings
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 1
+            try:
+                set_worker(slot)
+                serve(self.httpd, self.graceful_timeout, self._request_limit())
+                code = 0
+            except BaseException as e:
+                log('error', 'worker.crashed', error=f"{type(e).__name__}: {e}")
+            finally:
+                flush_logs(2.0)
+                os._exit(code)
+        self.workers[pid] = (slot, time.monotonic())
+        log('info', 'worker.started', slot=slot, pid=pid)
+
+    def stop(self, *_):
+        if self.stopping:
+            return
+        self.stopping = True
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.processes):
+            self.spawn(slot)
+
+        deadline = None
+        while self.workers:
+            if self.stopping:
+                deadline = deadline or time.monotonic() + self.graceful_timeout + 5
+                if time.monotonic() > deadline:
+                    for pid in self.workers:
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+            # Polled: a blocking os.wait() is resumed after the SIGTERM handler
+            # (PEP 475), and would never get back here to enforce the deadline
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                time.sleep(0.1)
+                continue
+            slot, started = self.workers.pop(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                log('info', 'worker.stopped', slot=slot, pid=pid, code=code)
+                continue
+            if code == 0:
+                log('info', 'worker.recycled', slot=slot, pid=pid)
+            else:
+                log('error', 'worker.died', slot=slot, pid=pid, code=code)
+                if time.monotonic() - started < 1:
+                    time.sleep(1)  # crash loop: don't fork as fast as it dies
+            self.spawn(slot)
+        self.httpd.server_close()
+
+
 def main():
     PORT = int(os.environ.get('PORT', 5328))
     HOST = os.environ.get('HOST', '127.0.0.1')
+    WORKERS = max(1, int(os.environ.get('AI_WORKERS', 8)))
+    QUEUE_SIZE = max(0, int(os.environ.get('AI_QUEUE_SIZE', 16)))
+    RETRY_AFTER = int(os.environ.get('AI_RETRY_AFTER', 5))
+    PROCESSES = max(1, int(os.environ.get('AI_PROCESSES', 1)))
+    MAX_REQUESTS = max(0, int(os.environ.get('AI_MAX_REQUESTS', 0)))
+    GRACEFUL_TIMEOUT = float(os.environ.get('AI_GRACEFUL_TIMEOUT', 30))
+
+    if PROCESSES > 1 and not hasattr(os, 'fork'):
+        print("   AI_PROCESSES ignored: pre-fork mode needs os.fork (POSIX)")
+        PROCESSES = 1
+    if PROCESSES == 1 and MAX_REQUESTS:
+        # Recycling needs a supervisor to start the replacement
+        print("   AI_MAX_REQUESTS ignored: worker recycling needs AI_PROCESSES > 1")
+        MAX_REQUESTS = 0
     
     server_address = (HOST, PORT)
     print(f"\n🤖 WeGoAI Backend Server")
     print(f"   Running at http://{HOST}:{PORT}")
     print(f"   Endpoint: POST /api/ai/suggest")
+    print(f"   Batch:    POST /api/ai/suggest/batch")
+    print(f"   Metrics:  GET /metrics, /healthz, /readyz")
+    print(f"   Workers: {WORKERS} (queue: {QUEUE_SIZE})" + (f" x {PROCESSES} processes" if PROCESSES > 1 else ""))
     print(f"\n   Press Ctrl+C to stop\n")
     
-    httpd = http.server.HTTPServer(server_address, DevHandler)
-    
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\n\nStopping server...")
-        httpd.server_close()
+    httpd = PooledHTTPServer(server_address, DevHandler,
+                             workers=WORKERS, queue_size=QUEUE_SIZE, retry_after=RETRY_AFTER)
+
+    if PROCESSES > 1:
+        # Workers inherit the listening socket; non-blocking so a worker that
+        # loses the accept() race goes back to select() instead of hanging
+        httpd.socket.setblocking(False)
+        Supervisor(httpd, PROCESSES, MAX_REQUESTS, GRACEFUL_TIMEOUT).run()
+    else:
+        serve(httpd, GRACEFUL_TIMEOUT, MAX_REQUESTS)
+    print("\nServer stopped.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+/**
+ * Proxy route for batched AI suggestions
+ * Forwards { queries, tripContext, chatHistory } to the Python AI backend,
+ * which classifies all queries in one call and answers them concurrently.
+ * Per-query failures come back inside `results`; only a failed batch is an error.
+ *
+ * `timeoutMs` in the body is the backend's time budget for the whole batch;
+ * the proxy gives up a little after it (or after the largest default budget).
+ */
+
+const AI_BACKEND_URL = process.env.AI_BACKEND_URL || 'http://localhost:5328';
+const DEFAULT_TIMEOUT_MS = 150000;
+const TIMEOUT_GRACE_MS = 15000;
+
+export async function POST(request: NextRequest) {
+    try {
+        const body = await request.json();
+        const timeoutMs = typeof body?.timeoutMs === 'number' && body.timeoutMs > 0
+            ? body.timeoutMs
+            : DEFAULT_TIMEOUT_MS;
+
+        const response = await fetch(`${AI_BACKEND_URL}/api/ai/suggest/batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body),
+            signal: AbortSignal.timeout(timeoutMs + TIMEOUT_GRACE_MS),
+        });
+
+        const data = await response.json().catch(() => null);
+        if (!response.ok) {
+            console.error('AI Backend batch error:', data);
+            return NextResponse.json(
+                { success: false, error: data?.error || 'AI backend error' },
+                { status: response.status }
+            );
+        }
+
+        return NextResponse.json(data);
+
+    } catch (error) {
+        console.error('Error proxying batch to AI backend:', error);
+
+        if (error instanceof DOMException && error.name === 'TimeoutError') {
+            return NextResponse.json(
+                { success: false, error: 'AI backend did not answer in time' },
+                { status: 504 }
+            );
+        }
+
+        // Check if backend is unreachable
+        if (error instanceof TypeError && error.message.includes('fetch')) {
+            return NextResponse.json(
+                {
+                    success: false,
+                    error: 'AI backend is not running. Start it with: npm run dev:ai'
+                },
+                { status: 503 }
+            );
+        }
+
+        return NextResponse.json(
+            { success: false, error: 'Internal server error' },
+            { status: 500 }
+        );
+    }
+}
+
+export async function OPTIONS() {
+    return new NextResponse(null, {
+        status: 200,
+        headers: {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+        },
+    });
+}
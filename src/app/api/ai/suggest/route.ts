@@ -3,20 +3,34 @@ import { NextRequest, NextResponse } from 'next/server';
 /**
  * Proxy route for AI suggestions
  * Forwards requests to the Python AI backend
+ *
+ * When the body has `stream: true`, the backend answers with NDJSON progress
+ * events which are piped straight through to the caller.
+ *
+ * `timeoutMs` in the body is the backend's time budget for the answer; the
+ * proxy gives up a little after it (or after the largest default budget).
  */
 
 const AI_BACKEND_URL = process.env.AI_BACKEND_URL || 'http://localhost:5328';
+const DEFAULT_TIMEOUT_MS = 150000;
+const TIMEOUT_GRACE_MS = 15000;
 
 export async function POST(request: NextRequest) {
     try {
         const body = await request.json();
+        const wantsStream = body?.stream === true;
+        const timeoutMs = typeof body?.timeoutMs === 'number' && body.timeoutMs > 0
+            ? body.timeoutMs
+            : DEFAULT_TIMEOUT_MS;
 
         const response = await fetch(`${AI_BACKEND_URL}/api/ai/suggest`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                ...(wantsStream ? { 'Accept': 'application/x-ndjson' } : {}),
             },
             body: JSON.stringify(body),
+            signal: AbortSignal.timeout(timeoutMs + TIMEOUT_GRACE_MS),
         });
 
         if (!response.ok) {
@@ -28,12 +42,31 @@ export async function POST(request: NextRequest) {
             );
         }
 
+        // Pass the event stream through without buffering it
+        if (wantsStream && response.body) {
+            return new Response(response.body, {
+                status: 200,
+                headers: {
+                    'Content-Type': 'application/x-ndjson',
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no',
+                },
+            });
+        }
+
         const data = await response.json();
         return NextResponse.json(data);
 
     } catch (error) {
         console.error('Error proxying to AI backend:', error);
 
+        if (error instanceof DOMException && error.name === 'TimeoutError') {
+            return NextResponse.json(
+                { success: false, error: 'AI backend did not answer in time' },
+                { status: 504 }
+            );
+        }
+
         // Check if backend is unreachable
         if (error instanceof TypeError && error.message.includes('fetch')) {
             return NextResponse.json(
@@ -3,6 +3,12 @@ import { connectToDatabase } from '@/lib/db/connection';
 import { Message, Trip } from '@/lib/db/models';
 import { v4 as uuidv4 } from 'uuid';
 
+// Time budget for one @weai answer (see backend/ai/deadline.py). Unset, the
+// backend uses its per-intent defaults, the largest of which is 150s.
+const AI_TIMEOUT_MS = Number(process.env.AI_TIMEOUT_MS) || undefined;
+const AI_DEFAULT_TIMEOUT_MS = 150000;
+const AI_TIMEOUT_GRACE_MS = 15000;
+
 // GET /api/messages?tripId=xxx - Get messages for a trip
 export async function GET(request: NextRequest) {
     try {
@@ -112,10 +118,12 @@ export async function POST(request: NextRequest) {
                     body: JSON.stringify({
                         query: content.replace(/@weai/gi, '').trim(),
                         tripContext: trip,
-                        chatHistory: recentMessages.reverse()
+                        chatHistory: recentMessages.reverse(),
+                        // The backend answers (possibly partially) within this budget
+                        ...(AI_TIMEOUT_MS ? { timeoutMs: AI_TIMEOUT_MS } : {})
                     }),
-                    // Set a long timeout for AI generation (5 minutes)
-                    signal: AbortSignal.timeout(300000)
+                    // Leave the backend room to send its best-effort answer
+                    signal: AbortSignal.timeout((AI_TIMEOUT_MS ?? AI_DEFAULT_TIMEOUT_MS) + AI_TIMEOUT_GRACE_MS)
                 });
 
 
@@ -381,6 +389,8 @@ export async function POST(request: NextRequest) {
                                     if (item) {
                                         if (update.newStartTime) item.startTime = update.newStartTime;
                                         if (update.newEndTime) item.endTime = update.newEndTime;
+                                        if (update.newTitle) item.title = update.newTitle;
+                                        if (update.newDay) item.day = update.newDay;
                                         updatedCount++;
                                     }
                                 }